@@ -3,9 +3,28 @@
 #######################################
 
 from strings_with_arrows import *
+from persistent_vector import PersistentVector
 import string
 import os
 import math
+import re
+import bisect
+import sys
+import pickle
+import hashlib
+import functools
+import gc
+import contextlib
+import array
+import operator
+import itertools
+import collections
+import builtins
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 #######################################
 # CONSTANTS
@@ -28,9 +47,13 @@ class Error:
 	def as_string(self):
 		result  = f'{self.error_name}: {self.details}\n'
 		result += f'File {self.pos_start.fn}, line {self.pos_start.ln + 1}'
-		result += '\n\n' + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+		result += '\n\n' + self.arrows()
 		return result
 
+	def arrows(self):
+		source = self.pos_start.source
+		return string_with_arrows(source.text, self.pos_start, self.pos_end, source.line_index())
+
 class IllegalCharError(Error):
 	def __init__(self, pos_start, pos_end, details):
 		super().__init__(pos_start, pos_end, 'Illegal Character', details)
@@ -51,7 +74,7 @@ class RunTimeError(Error):
 	def as_string(self):
 		result  = self.generate_traceback()
 		result += f'{self.error_name}: {self.details}'
-		result += '\n\n' + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+		result += '\n\n' + self.arrows()
 		return result
 
 	def generate_traceback(self):
@@ -66,30 +89,102 @@ class RunTimeError(Error):
 
 		return 'Traceback (most recent call last):\n' + result
 
+# Errors about the right-hand operand of a binary operation, e.g. a zero divisor
+class OperandError(RunTimeError):
+	def __init__(self, details):
+		super().__init__(None, None, details, None)
+
+# Values carry no positions, so errors raised by value methods and built-ins
+# are placed on the node being evaluated when they surface
+def locate_error(error, node, context):
+	if error.pos_start is None:
+		span = node.right_node if isinstance(error, OperandError) and isinstance(node, BinOpNode) else node
+		error.pos_start, error.pos_end = span.pos_start, span.pos_end
+	if error.context is None:
+		error.context = context
+	return error
+
 #######################################
 # POSITION
 #######################################
 
+source_files = []
+source_file_ids = {}
+
+class SourceFile:
+	def __init__(self, fn, text):
+		self.fn = fn
+		self.text = text
+		self.id = len(source_files)
+		self.line_starts = None
+
+	def line_index(self):
+		if self.line_starts is None:
+			line_starts = [0]
+			text = self.text
+			nl = text.find('\n')
+			while nl >= 0:
+				line_starts.append(nl + 1)
+				nl = text.find('\n', nl + 1)
+			self.line_starts = line_starts
+		return self.line_starts
+
+	def line_of(self, idx):
+		return bisect.bisect_right(self.line_index(), idx) - 1
+
+def register_source(fn, text):
+	key = (fn, text)
+	file_id = source_file_ids.get(key)
+	if file_id is None:
+		source = SourceFile(fn, text)
+		source_files.append(source)
+		file_id = source_file_ids[key] = source.id
+	return file_id
+
 class Position:
-	def __init__(self, idx, ln, col, fn, ftxt):
+	__slots__ = ('idx', 'file_id')
+
+	def __init__(self, idx, file_id):
 		self.idx = idx
-		self.ln = ln
-		self.col = col
-		self.fn = fn
-		self.ftxt = ftxt
+		self.file_id = file_id
 
-	def advance(self, current_char=None):
-		self.idx += 1
-		self.col += 1
+	@property
+	def source(self):
+		return source_files[self.file_id]
 
-		if current_char == '\n':
-			self.ln += 1
-			self.col = 0
+	@property
+	def fn(self):
+		return source_files[self.file_id].fn
 
-		return self
+	@property
+	def ftxt(self):
+		return source_files[self.file_id].text
+
+	@property
+	def ln(self):
+		return source_files[self.file_id].line_of(self.idx)
+
+	@property
+	def col(self):
+		source = source_files[self.file_id]
+		return self.idx - source.line_index()[source.line_of(self.idx)]
 
 	def copy(self):
-		return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
+		return self
+
+class EndPosition(Position):
+	# End offsets are exclusive, so they resolve on the line of the last character
+	# they cover even when that character is a newline
+	__slots__ = ()
+
+	@property
+	def ln(self):
+		return source_files[self.file_id].line_of(self.idx - 1)
+
+	@property
+	def col(self):
+		source = source_files[self.file_id]
+		return self.idx - source.line_index()[source.line_of(self.idx - 1)]
 
 #######################################
 # TOKENS
@@ -110,6 +205,8 @@ TOK_LPAREN   = 'LPAREN'
 TOK_RPAREN   = 'RPAREN'
 TOK_LSQB     = 'LSQB'
 TOK_RSQB     = 'RSQB'
+TOK_LBRACE   = 'LBRACE'
+TOK_RBRACE   = 'RBRACE'
 TOK_EE 		 = 'EE'
 TOK_NE 		 = 'NE'
 TOK_LT 		 = 'LT'
@@ -143,17 +240,22 @@ KEYWORDS=[
 ]
 
 class Token:
-	def __init__(self, type_, value=None, pos_start=None, pos_end=None):
+	__slots__ = ('type', 'value', 'start', 'end', 'file_id')
+
+	def __init__(self, type_, value, start, end, file_id):
 		self.type = type_
 		self.value = value
+		self.start = start
+		self.end = end
+		self.file_id = file_id
 
-		if pos_start:
-			self.pos_start = pos_start.copy()
-			self.pos_end = pos_start.copy()
-			self.pos_end.advance()
+	@property
+	def pos_start(self):
+		return Position(self.start, self.file_id)
 
-		if pos_end:
-			self.pos_end = pos_end.copy()
+	@property
+	def pos_end(self):
+		return EndPosition(self.end, self.file_id)
 
 	def matches(self,type_,value):
 		return self.type == type_ and self.value == value
@@ -169,209 +271,138 @@ class Token:
 # LEXER
 #######################################
 
+OPERATORS = {
+	'+':  TOK_PLUS,
+	'-':  TOK_MINUS,
+	'*':  TOK_MUL,
+	'/':  TOK_DIV,
+	'%':  TOK_MOD,
+	'^':  TOK_POW,
+	'(':  TOK_LPAREN,
+	')':  TOK_RPAREN,
+	'[':  TOK_LSQB,
+	']':  TOK_RSQB,
+	'{':  TOK_LBRACE,
+	'}':  TOK_RBRACE,
+	',':  TOK_COMMA,
+	':':  TOK_COLON,
+	'=':  TOK_EQS,
+	'==': TOK_EE,
+	'<':  TOK_LT,
+	'<=': TOK_LTE,
+	'>':  TOK_GT,
+	'>=': TOK_GTE,
+}
+
+KEYWORD_SET = frozenset(KEYWORDS)
+
+# A single '!' opens a comment that runs up to and including the end of the line,
+# so no NEWL token is produced for it.
+TOKEN_REGEX = re.compile(r'''[ \t]*(?:
+	  (?P<NUMBER>[0-9]+(?P<DOT>\.[0-9]*)?)
+	| (?P<IDENTIFIER>[A-Za-z][A-Za-z0-9_]*)
+	| (?P<NEWL>[;\n])
+	| (?P<OP>==|<=|>=|[-+*/%^()\[\]{},:=<>])
+	| (?P<STRING>"(?P<STRING_BODY>[^"]*)(?P<STRING_END>"?))
+	| (?P<COMMENT>![^\n]*\n?)
+	| (?P<EOF>\Z)
+	| (?P<ILLEGAL>[\s\S])
+)''', re.VERBOSE)
+
 class Lexer:
 	def __init__(self, fn, text):
 		self.fn = fn
 		self.text = text
-		self.pos = Position(-1, 0, -1, fn, text)
-		self.current_char = None
-		self.advance()
-	
-	def advance(self):
-		self.pos.advance(self.current_char)
-		self.current_char = self.text[self.pos.idx] if self.pos.idx < len(self.text) else None
+		self.file_id = register_source(fn, text)
 
 	def make_tokens(self):
 		tokens = []
-
-		while self.current_char != None:
-			if self.current_char in ' \t':
-				self.advance()
-			elif self.current_char in '!!':
-				self.skip_comment()
-			elif self.current_char in ';\n':
-				tokens.append(Token(TOK_NEWL, pos_start=self.pos))
-				self.advance()
-			elif self.current_char in DIGITS:
-				tokens.append(self.make_number())
-			elif self.current_char in LETTERS:
-				tokens.append(self.make_identifier())
-			elif self.current_char == '"':
-				tokens.append(self.make_string())
-			elif self.current_char == '+':
-				tokens.append(Token(TOK_PLUS, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '-':
-				tokens.append(Token(TOK_MINUS, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '*':
-				tokens.append(Token(TOK_MUL, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '/':
-				tokens.append(Token(TOK_DIV, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '%':
-				tokens.append(Token(TOK_MOD, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '^':
-				tokens.append(Token(TOK_POW, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '(':
-				tokens.append(Token(TOK_LPAREN, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == ')':
-				tokens.append(Token(TOK_RPAREN, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '[':
-				tokens.append(Token(TOK_LSQB, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == ']':
-				tokens.append(Token(TOK_RSQB, pos_start=self.pos))
-				self.advance()
-			elif self.current_char == '!':
-				tok,error=self.make_not_equals()
-				if error:return [], error
-				tokens.append(tok)
-			elif self.current_char == '=':
-				tokens.append(self.make_equals())
-			elif self.current_char == '<':
-				tokens.append(self.make_less_than())
-			elif self.current_char == '>':
-				tokens.append(self.make_greater_than())
-			elif self.current_char == ':':
-				tokens.append(self.make_colon())
-			elif self.current_char == ',':
-				tokens.append(Token(TOK_COMMA, pos_start=self.pos))
-				self.advance()
-			else:
-				pos_start = self.pos.copy()
-				char = self.current_char
-				self.advance()
-				return [], IllegalCharError(pos_start, self.pos, "'" + char + "'")
-
-		tokens.append(Token(TOK_EOF, pos_start=self.pos))
-		return tokens, None
-
-	def make_number(self):
-		num_str = ''
-		dot_count = 0
-		pos_start = self.pos.copy()
-
-		while self.current_char != None and self.current_char in DIGITS + '.':
-			if self.current_char == '.':
-				if dot_count == 1: break
-				dot_count += 1
-				num_str += '.'
-			else:
-				num_str += self.current_char
-			self.advance()
-
-		if dot_count == 0:
-			return Token(TOK_INT, int(num_str), pos_start, self.pos)
-		else:
-			return Token(TOK_FLOAT, float(num_str), pos_start, self.pos)
-
-	def make_string(self):
-		string = ''
-		pos_start = self.pos.copy()
-		escape_character = False
-		self.advance()
-
-		escape_characters = {
-			'n': '\n',
-			't': '\t'
-		}
-
-		while self.current_char != None and (self.current_char != '"' or escape_character):
-			if escape_character:
-				string += escape_characters.get(self.current_char, self.current_char)
-			else:
-				if self.current_char == '\\':
-					escape_character = True
+		append = tokens.append
+		text = self.text
+		file_id = self.file_id
+
+		for m in TOKEN_REGEX.finditer(text):
+			kind = m.lastgroup
+			start = m.start(kind)
+			idx = m.end()
+
+			if kind == 'IDENTIFIER':
+				value = text[start:idx]
+				append(Token(TOK_KEYWORD if value in KEYWORD_SET else TOK_IDENTIFIER, value, start, idx, file_id))
+			elif kind == 'OP':
+				append(Token(OPERATORS[text[start:idx]], None, start, idx, file_id))
+			elif kind == 'NUMBER':
+				if m.group('DOT') is None:
+					append(Token(TOK_INT, int(text[start:idx]), start, idx, file_id))
 				else:
-					string += self.current_char
-			self.advance()
-			escape_character = False
-		
-		self.advance()
-		return Token(TOK_STRING, string, pos_start, self.pos)
-
-	def make_identifier(self):
-		id_str=''
-		pos_start=self.pos.copy()
-		while self.current_char!= None and self.current_char in LETTERS_DIGITS + '_':
-			id_str+=self.current_char
-			self.advance()
-		tok_type=TOK_KEYWORD if id_str in KEYWORDS else TOK_IDENTIFIER
-		return Token(tok_type,id_str,pos_start,self.pos)
-
-	def make_colon(self):
-		pos_start=self.pos.copy()
-		if self.current_char==':':
-			self.advance()
-			tok_type=TOK_COLON
-
-		return Token(tok_type,pos_start=pos_start,pos_end=self.pos)
-
-	def make_not_equals(self):
-		pos_start=self.pos.copy()
-		self.advance()
-		
-		if self.current_char=='=':
-			self.advance()
-			return Token(TOK_NE,pos_start=pos_start,pos_end=self.pos),None
-
-		self.advance()
-		return None,ExpectedCharError(pos_start,self.pos,"'=' (after '!')")
-
-	def make_equals(self):
-		tok_type=TOK_EQS
-		pos_start=self.pos.copy()
-		self.advance()
-
-		if self.current_char=='=':
-			self.advance()
-			tok_type=TOK_EE
-
-		return Token(tok_type,pos_start=pos_start,pos_end=self.pos)
-
-	def make_less_than(self):
-		tok_type=TOK_LT
-		pos_start=self.pos.copy()
-		self.advance()
-
-		if self.current_char=='=':
-			self.advance()
-			tok_type=TOK_LTE
-
-		return Token(tok_type,pos_start=pos_start,pos_end=self.pos)
-	
-	def make_greater_than(self):
-		tok_type=TOK_GT
-		pos_start=self.pos.copy()
-		self.advance()
-
-		if self.current_char=='=':
-			self.advance()
-			tok_type=TOK_GTE
-
-		return Token(tok_type,pos_start=pos_start,pos_end=self.pos)
-
-	def skip_comment(self):
-		self.advance()
-
-		while self.current_char != '\n':
-			self.advance()
-
-		self.advance()
+					append(Token(TOK_FLOAT, float(text[start:idx]), start, idx, file_id))
+			elif kind == 'NEWL':
+				append(Token(TOK_NEWL, None, start, idx, file_id))
+			elif kind == 'STRING':
+				# Backslashes are dropped and never escape the closing quote
+				value = m.group('STRING_BODY').replace('\\', '')
+				if m.group('STRING_END'):
+					append(Token(TOK_STRING, value, start, idx, file_id))
+				else:
+					# An unterminated string runs one past the end of the text
+					append(Token(TOK_STRING, value, start, idx + 1, file_id))
+					append(Token(TOK_EOF, None, idx + 1, idx + 2, file_id))
+					return tokens, None
+			elif kind == 'COMMENT':
+				pass
+			elif kind == 'EOF':
+				append(Token(TOK_EOF, None, idx, idx + 1, file_id))
+				return tokens, None
+			else:
+				return [], IllegalCharError(Position(start, file_id), EndPosition(idx, file_id), "'" + text[start] + "'")
 
 #######################################
 # NODES
 #######################################
 
+BINARY_OPS = [
+	(TOK_PLUS,          lambda left, right: left.added_to(right)),
+	(TOK_MINUS,         lambda left, right: left.subbed_by(right)),
+	(TOK_MUL,           lambda left, right: left.multed_by(right)),
+	(TOK_DIV,           lambda left, right: left.dived_by(right)),
+	(TOK_MOD,           lambda left, right: left.moded_by(right)),
+	(TOK_POW,           lambda left, right: left.powed_by(right)),
+	(TOK_EE,            lambda left, right: left.get_comp_eq(right)),
+	(TOK_NE,            lambda left, right: left.get_comp_ne(right)),
+	(TOK_LT,            lambda left, right: left.get_comp_lt(right)),
+	(TOK_GT,            lambda left, right: left.get_comp_gt(right)),
+	(TOK_LTE,           lambda left, right: left.get_comp_lte(right)),
+	(TOK_GTE,           lambda left, right: left.get_comp_gte(right)),
+	((TOK_KEYWORD, 'AND'), lambda left, right: left.anded_by(right)),
+	((TOK_KEYWORD, 'OR'),  lambda left, right: left.ored_by(right)),
+]
+BINARY_OP_INDEX = {key: i for i, (key, _) in enumerate(BINARY_OPS)}
+BINARY_OP_FUNCS = [func for _, func in BINARY_OPS]
+
+# AND and OR skip their right operand when the left one is a number that
+# decides the result (false for AND, true for OR) and give the left one
+# back; anything else still goes to anded_by/ored_by
+SHORT_CIRCUIT_OPS = {
+	BINARY_OP_INDEX[(TOK_KEYWORD, 'AND')]: False,
+	BINARY_OP_INDEX[(TOK_KEYWORD, 'OR')]:  True,
+}
+
+# Comparisons used as conditions compare two numbers directly
+COMPARE_OPERATORS = {BINARY_OP_INDEX[key]: func for key, func in (
+	(TOK_EE,  operator.eq),
+	(TOK_NE,  operator.ne),
+	(TOK_LT,  operator.lt),
+	(TOK_GT,  operator.gt),
+	(TOK_LTE, operator.le),
+	(TOK_GTE, operator.ge),
+)}
+
 class NumberNode:
+	__slots__ = ('tok', 'value', 'pos_start', 'pos_end')
+
 	def __init__(self, tok):
 		self.tok = tok
+		self.value = make_number(tok.value)
 
 		self.pos_start = self.tok.pos_start
 		self.pos_end = self.tok.pos_end
@@ -380,8 +411,11 @@ class NumberNode:
 		return f'{self.tok}'
 
 class StringNode:
+	__slots__ = ('tok', 'value', 'pos_start', 'pos_end')
+
 	def __init__(self, tok):
 		self.tok = tok
+		self.value = String(tok.value)
 
 		self.pos_start = self.tok.pos_start
 		self.pos_end = self.tok.pos_end
@@ -390,30 +424,50 @@ class StringNode:
 		return f'{self.tok}'
 
 class ListNode:
+	__slots__ = ('element_nodes', 'pos_start', 'pos_end')
+
 	def __init__(self, element_nodes, pos_start, pos_end):
 		self.element_nodes = element_nodes
 		self.pos_start = pos_start
 		self.pos_end = pos_end
 
+class DictNode:
+	__slots__ = ('entry_nodes', 'pos_start', 'pos_end')
+
+	def __init__(self, entry_nodes, pos_start, pos_end):
+		self.entry_nodes = entry_nodes
+		self.pos_start = pos_start
+		self.pos_end = pos_end
+
 class VarAccessNode:
+	__slots__ = ('var_name_tok', 'address', 'pos_start', 'pos_end')
+
 	def __init__(self,var_name_tok):
 		self.var_name_tok = var_name_tok
+		self.address = ()
 		self.pos_start = self.var_name_tok.pos_start
 		self.pos_end = self.var_name_tok.pos_end 
 
 class VarAssignNode:
+	__slots__ = ('var_name_tok', 'value_node', 'slot', 'pos_start', 'pos_end')
+
 	def __init__(self,var_name_tok,value_node):
 		self.var_name_tok = var_name_tok
 		self.value_node = value_node
+		self.slot = None
 		self.pos_start = self.var_name_tok.pos_start
 		self.pos_end = self.value_node.pos_end 
 
 class BinOpNode:
+	__slots__ = ('left_node', 'op_tok', 'right_node', 'op_index', 'pos_start', 'pos_end')
+
 	def __init__(self, left_node, op_tok, right_node):
 		self.left_node = left_node
 		self.op_tok = op_tok
 		self.right_node = right_node
 
+		self.op_index = BINARY_OP_INDEX[(op_tok.type, op_tok.value) if op_tok.type == TOK_KEYWORD else op_tok.type]
+
 		self.pos_start = self.left_node.pos_start
 		self.pos_end = self.right_node.pos_end
 
@@ -421,6 +475,8 @@ class BinOpNode:
 		return f'({self.left_node}, {self.op_tok}, {self.right_node})'
 
 class UnaryOpNode:
+	__slots__ = ('op_tok', 'node', 'pos_start', 'pos_end')
+
 	def __init__(self, op_tok, node):
 		self.op_tok = op_tok
 		self.node = node
@@ -432,6 +488,8 @@ class UnaryOpNode:
 		return f'({self.op_tok}, {self.node})'
 
 class IfNode:
+	__slots__ = ('cases', 'else_case', 'pos_start', 'pos_end')
+
 	def __init__(self,cases,else_case):
 		self.cases=cases
 		self.else_case=else_case
@@ -440,6 +498,8 @@ class IfNode:
 		self.pos_end=(self.else_case or self.cases[len(self.cases)-1])[0].pos_end
 
 class FromNode:
+	__slots__ = ('var_name_tok', 'start_value_node', 'end_value_node', 'step_value_node', 'body_node', 'should_return_null', 'var_slot', 'lazy', 'hoisted', 'pos_start', 'pos_end')
+
 	def __init__(self, var_name_tok, start_value_node, end_value_node, step_value_node, body_node,should_return_null):
 		self.var_name_tok = var_name_tok
 		self.start_value_node = start_value_node
@@ -447,25 +507,35 @@ class FromNode:
 		self.step_value_node = step_value_node
 		self.body_node = body_node
 		self.should_return_null = should_return_null
+		self.var_slot = None
+		self.lazy = False
+		self.hoisted = None
 
 		self.pos_start = self.var_name_tok.pos_start
 		self.pos_end = self.body_node.pos_end
 
 class UntilNode:
+	__slots__ = ('condition_node', 'body_node', 'should_return_null', 'hoisted', 'pos_start', 'pos_end')
+
 	def __init__(self, condition_node, body_node,should_return_null):
 		self.condition_node = condition_node
 		self.body_node = body_node
 		self.should_return_null = should_return_null
+		self.hoisted = None
 
 		self.pos_start = self.condition_node.pos_start
 		self.pos_end = self.body_node.pos_end
 
 class FuncDefNode:
+	__slots__ = ('var_name_tok', 'arg_name_toks', 'body_node', 'should_auto_return', 'name_slot', 'slot_names', 'pos_start', 'pos_end')
+
 	def __init__(self, var_name_tok, arg_name_toks, body_node,should_auto_return):
 		self.var_name_tok = var_name_tok
 		self.arg_name_toks = arg_name_toks
 		self.body_node = body_node
 		self.should_auto_return = should_auto_return
+		self.name_slot = None
+		self.slot_names = [arg_name_tok.value for arg_name_tok in arg_name_toks]
 
 		if self.var_name_tok:
 			self.pos_start = self.var_name_tok.pos_start
@@ -477,9 +547,12 @@ class FuncDefNode:
 		self.pos_end = self.body_node.pos_end
 
 class CallNode:
+	__slots__ = ('node_to_call', 'arg_nodes', 'tail', 'pos_start', 'pos_end')
+
 	def __init__(self, node_to_call, arg_nodes):
 		self.node_to_call = node_to_call
 		self.arg_nodes = arg_nodes
+		self.tail = False
 
 		self.pos_start = self.node_to_call.pos_start
 
@@ -489,18 +562,38 @@ class CallNode:
 			self.pos_end = self.node_to_call.pos_end
 
 class RetNode:
+	__slots__ = ('node_to_return', 'pos_start', 'pos_end')
+
 	def __init__(self, node_to_return, pos_start, pos_end):
 		self.node_to_return = node_to_return
 
 		self.pos_start = pos_start
 		self.pos_end = pos_end
 
+# A loop-invariant expression (see hoist_invariants). It is evaluated where
+# it stands the first time the loop reaches it, and the value is kept for
+# the rest of that run of the loop.
+class HoistedNode:
+	__slots__ = ('node', 'value', 'active', 'pos_start', 'pos_end')
+
+	def __init__(self, node):
+		self.node = node
+		self.value = None
+		self.active = False
+
+		self.pos_start = node.pos_start
+		self.pos_end = node.pos_end
+
 class ContNode:
+	__slots__ = ('pos_start', 'pos_end')
+
 	def __init__(self, pos_start, pos_end):
 		self.pos_start = pos_start
 		self.pos_end = pos_end
 
 class BrkNode:
+	__slots__ = ('pos_start', 'pos_end')
+
 	def __init__(self, pos_start, pos_end):
 		self.pos_start = pos_start
 		self.pos_end = pos_end
@@ -514,39 +607,42 @@ class ParseResult:
 	def __init__(self):
 		self.error = None
 		self.node = None
-		self.last_reg_adv_count = 0
-		self.adv_count=0
-		self.to_rev_count = 0
-
-	def register_advance(self):
-		self.last_reg_adv_count=1
-		self.adv_count+=1
 
 	def register(self, res):
-		self.last_reg_adv_count = res.adv_count
-		self.adv_count+=res.adv_count
 		if res.error:self.error = res.error
 		return res.node
 
-	def try_register(self, res):
-		if res.error:
-			self.to_rev_count = res.adv_count
-			return None
-		return self.register(res)
-
 	def success(self, node):
 		self.node = node
 		return self
 
 	def failure(self, error):
-		if not self.error or self.last_reg_adv_count==0:
-			self.error = error
+		self.error = error
 		return self
 
 #######################################
 # PARSER
 #######################################
 
+# Tokens that can begin an expression or a statement. The parser looks at these
+# before committing to a production instead of trying it and rewinding.
+EXPR_START_TYPES = (TOK_INT, TOK_FLOAT, TOK_STRING, TOK_IDENTIFIER, TOK_LPAREN, TOK_LSQB, TOK_LBRACE, TOK_PLUS, TOK_MINUS)
+EXPR_START_KEYWORDS = ('var', 'NOT', 'if', 'from', 'until', 'fun')
+STATEMENT_START_KEYWORDS = ('ret', 'cont', 'brk') + EXPR_START_KEYWORDS
+
+PREC_AND_OR = 1
+PREC_COMP = 2
+PREC_UNARY = 5
+PREC_POW = 6
+
+BINARY_PRECEDENCE = {
+	(TOK_KEYWORD, 'AND'): PREC_AND_OR, (TOK_KEYWORD, 'OR'): PREC_AND_OR,
+	TOK_EE: PREC_COMP, TOK_NE: PREC_COMP, TOK_LT: PREC_COMP, TOK_GT: PREC_COMP, TOK_LTE: PREC_COMP, TOK_GTE: PREC_COMP,
+	TOK_PLUS: 3, TOK_MINUS: 3,
+	TOK_MUL: 4, TOK_DIV: 4, TOK_MOD: 4,
+	TOK_POW: PREC_POW,
+}
+
 class Parser:
 	def __init__(self, tokens):
 		self.tokens = tokens
@@ -558,15 +654,20 @@ class Parser:
 		self.update_current_tok()
 		return self.current_tok
 
-	def reverse(self, amount=1):
-		self.tok_idx -= amount
-		self.update_current_tok()
-		return self.current_tok
-
 	def update_current_tok(self):
 		if self.tok_idx >= 0 and self.tok_idx < len(self.tokens):
 			self.current_tok = self.tokens[self.tok_idx]
 
+	def starts_expr(self):
+		tok = self.current_tok
+		if tok.type == TOK_KEYWORD: return tok.value in EXPR_START_KEYWORDS
+		return tok.type in EXPR_START_TYPES
+
+	def starts_statement(self):
+		tok = self.current_tok
+		if tok.type == TOK_KEYWORD: return tok.value in STATEMENT_START_KEYWORDS
+		return tok.type in EXPR_START_TYPES
+
 	def parse(self):
 		res = self.statements()
 		if not res.error and self.current_tok.type != TOK_EOF:
@@ -574,6 +675,8 @@ class Parser:
 				self.current_tok.pos_start, self.current_tok.pos_end,
 				"Expected '+', '-', '*', '/', '^', '==', '!=', '<', '>', <=', '>=', 'AND' or 'OR'"
 			))
+		if not res.error:
+			Resolver().resolve_program(res.node)
 		return res
 
 	###################################
@@ -584,31 +687,26 @@ class Parser:
 		pos_start = self.current_tok.pos_start.copy()
 		
 		while self.current_tok.type == TOK_NEWL:
-			res.register_advance()
 			self.advance()
 
 		statement = res.register(self.statement())
 		if res.error: return res
 		statements.append(statement)
-		
-		more_statements = True
 
-		while True:
-			newline_count = 0
+		while self.current_tok.type == TOK_NEWL:
 			while self.current_tok.type == TOK_NEWL:
-				res.register_advance()
 				self.advance()
-				newline_count += 1
-			if newline_count == 0:
-				more_statements = False
-      		
-			if not more_statements: break
-			statement = res.try_register(self.statement())
-			if not statement:
-				self.reverse(res.to_rev_count)
-				more_statements = False
-				continue
-			statements.append(statement)
+
+			if not self.starts_statement(): break
+			statement_idx = self.tok_idx
+			statement = self.statement()
+			if statement.error:
+				# A malformed statement after a newline ends the block here, so the
+				# enclosing rule reports the error at its first token
+				self.tok_idx = statement_idx
+				self.update_current_tok()
+				break
+			statements.append(statement.node)
 		
 		return res.success(ListNode(
       statements,
@@ -621,26 +719,26 @@ class Parser:
 		pos_start = self.current_tok.pos_start.copy()
 
 		if self.current_tok.matches(TOK_KEYWORD, 'ret'):
-			res.register_advance()
 			self.advance()
 
-			expr = res.try_register(self.expr())
-			if not expr:
-				self.reverse(res.to_reverse_count)
+			expr = None
+			if self.starts_expr():
+				expr = res.register(self.expr())
+				if res.error: return res
 			return res.success(RetNode(expr, pos_start, self.current_tok.pos_start.copy()))
     
 		if self.current_tok.matches(TOK_KEYWORD, 'cont'):
-			res.register_advance()
 			self.advance()
 			return res.success(ContNode(pos_start, self.current_tok.pos_start.copy()))
       
 		if self.current_tok.matches(TOK_KEYWORD, 'brk'):
-			res.register_advance()
 			self.advance()
 			return res.success(BrkNode(pos_start, self.current_tok.pos_start.copy()))
 
+		expr_idx = self.tok_idx
 		expr = res.register(self.expr())
 		if res.error:
+			if self.tok_idx != expr_idx: return res
 			return res.failure(InvalidSyntaxError(
         self.current_tok.pos_start, self.current_tok.pos_end,
         "Expected 'ret', 'cont', 'brk', 'var', 'if', 'from', 'until', 'fun', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
@@ -663,10 +761,8 @@ class Parser:
 		else_case = None
 
 		if self.current_tok.matches(TOK_KEYWORD, 'else'):
-			res.register_advance()
 			self.advance()
 			if self.current_tok.type == TOK_NEWL:
-				res.register_advance()
 				self.advance()
 				
 				statements = res.register(self.statements())
@@ -674,7 +770,6 @@ class Parser:
 				else_case = (statements, True)
 				
 				if self.current_tok.matches(TOK_KEYWORD, 'just'):
-					res.register_advance()
 					self.advance()
 				else:
 					return res.failure(InvalidSyntaxError(
@@ -712,7 +807,6 @@ class Parser:
         f"Expected '{case_keyword}'"
       ))
 
-		res.register_advance()
 		self.advance()
 
 		condition = res.register(self.expr())
@@ -724,11 +818,9 @@ class Parser:
         f"Expected 'then'"
       ))
 
-		res.register_advance()
 		self.advance()
 
 		if self.current_tok.type == TOK_NEWL:
-			res.register_advance()
 			self.advance()
 
 			statements = res.register(self.statements())
@@ -736,7 +828,6 @@ class Parser:
 			cases.append((condition, statements, True))
 
 			if self.current_tok.matches(TOK_KEYWORD, 'just'):
-				res.register_advance()
 				self.advance()
 			else:
 				all_cases = res.register(self.if_expr_b_or_c())
@@ -764,7 +855,6 @@ class Parser:
 				f"Expected 'from'"
 			))
 
-		res.register_advance()
 		self.advance()
 
 		if self.current_tok.type != TOK_IDENTIFIER:
@@ -774,7 +864,6 @@ class Parser:
 			))
 
 		var_name = self.current_tok
-		res.register_advance()
 		self.advance()
 
 		if self.current_tok.type != TOK_EQS:
@@ -783,7 +872,6 @@ class Parser:
 				f"Expected '='"
 			))
 		
-		res.register_advance()
 		self.advance()
 
 		start_value = res.register(self.expr())
@@ -795,14 +883,12 @@ class Parser:
 				f"Expected 'to'"
 			))
 		
-		res.register_advance()
 		self.advance()
 
 		end_value = res.register(self.expr())
 		if res.error: return res
 
 		if self.current_tok.matches(TOK_KEYWORD, 'step'):
-			res.register_advance()
 			self.advance()
 
 			step_value = res.register(self.expr())
@@ -815,11 +901,9 @@ class Parser:
 				self.current_tok.pos_start, self.current_tok.pos_end,
 				f"Expected 'then'"
 			))
-		res.register_advance()
 		self.advance()
 
 		if self.current_tok.type == TOK_NEWL:
-			res.register_advance()
 			self.advance()
 
 			body = res.register(self.statements())
@@ -831,7 +915,6 @@ class Parser:
           f"Expected 'just'"
         ))
 
-			res.register_advance()
 			self.advance()
 			return res.success(FromNode(var_name, start_value, end_value, step_value, body, True))
 
@@ -849,7 +932,6 @@ class Parser:
 				f"Expected 'until'"
 			))
 
-		res.register_advance()
 		self.advance()
 
 		condition = res.register(self.expr())
@@ -861,11 +943,9 @@ class Parser:
 				f"Expected 'then'"
 			))
 
-		res.register_advance()
 		self.advance()
 
 		if self.current_tok.type == TOK_NEWL:
-			res.register_advance()
 			self.advance()
 
 			body = res.register(self.statements())
@@ -877,7 +957,6 @@ class Parser:
           f"Expected 'just'"
         ))
 
-			res.register_advance()
 			self.advance()
 
 			return res.success(UntilNode(condition, body, True))
@@ -887,32 +966,28 @@ class Parser:
 
 		return res.success(UntilNode(condition, body,False))
 
-	def power(self):
-		return self.bin_op(self.call, (TOK_POW, ), self.factor)
-
 	def call(self):
 		res = ParseResult()
 		atom = res.register(self.atom())
 		if res.error: return res
 
 		if self.current_tok.type == TOK_LPAREN:
-			res.register_advance()
 			self.advance()
 			arg_nodes = []
 
 			if self.current_tok.type == TOK_RPAREN:
-				res.register_advance()
 				self.advance()
 			else:
+				arg_idx = self.tok_idx
 				arg_nodes.append(res.register(self.expr()))
 				if res.error:
+					if self.tok_idx != arg_idx: return res
 					return res.failure(InvalidSyntaxError(
 						self.current_tok.pos_start, self.current_tok.pos_end,
 						"Expected ')', 'var', 'if', 'from', 'until', 'fun', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
 					))
 
 				while self.current_tok.type == TOK_COMMA:
-					res.register_advance()
 					self.advance()
 
 					arg_nodes.append(res.register(self.expr()))
@@ -924,7 +999,6 @@ class Parser:
 						f"Expected ',' or ')'"
 					))
 
-				res.register_advance()
 				self.advance()
 			return res.success(CallNode(atom, arg_nodes))
 		return res.success(atom)
@@ -935,27 +1009,22 @@ class Parser:
 		tok = self.current_tok
 
 		if tok.type in (TOK_INT, TOK_FLOAT):
-			res.register_advance()
 			self.advance()
 			return res.success(NumberNode(tok))
 
 		if tok.type in (TOK_STRING):
-			res.register_advance()
 			self.advance()
 			return res.success(StringNode(tok))
 			
 		elif tok.type == TOK_IDENTIFIER:
-			res.register_advance()
 			self.advance()
 			return res.success(VarAccessNode(tok))
 
 		elif tok.type == TOK_LPAREN:
-			res.register_advance()
 			self.advance()
 			expr = res.register(self.expr())
 			if res.error: return res
 			if self.current_tok.type == TOK_RPAREN:
-				res.register_advance()
 				self.advance()
 				return res.success(expr)
 			else:
@@ -969,6 +1038,11 @@ class Parser:
 			if res.error: return res
 			return res.success(list_expr)
 
+		elif tok.type == TOK_LBRACE:
+			dict_expr = res.register(self.dict_expr())
+			if res.error: return res
+			return res.success(dict_expr)
+
 		elif tok.matches(TOK_KEYWORD,'if'):
 			if_expr=res.register(self.if_expr())
 			if res.error: return res
@@ -1001,60 +1075,99 @@ class Parser:
 		if self.current_tok.type != TOK_LSQB:
 			return res.failure(InvalidSyntaxError(self.current_tok.pos_start, self.current_tok.pos_end,f"Expected '['"))
 			
-		res.register_advance()
 		self.advance()
 		
 		if self.current_tok.type == TOK_RSQB:
-			res.register_advance()
 			self.advance()
 		else:
+			element_idx = self.tok_idx
 			element_nodes.append(res.register(self.expr()))
 			if res.error:
+				if self.tok_idx != element_idx: return res
 				return res.failure(InvalidSyntaxError(self.current_tok.pos_start, self.current_tok.pos_end,"Expected ']', 'var', 'if', 'from', 'until', 'fun', int, float, identifier, '+', '-', '(', '[' or 'NOT'"))
 			
 			while self.current_tok.type == TOK_COMMA:
-				res.register_advance()
 				self.advance()
 				element_nodes.append(res.register(self.expr()))
 				if res.error: return res
 			if self.current_tok.type != TOK_RSQB:
 				return res.failure(InvalidSyntaxError(self.current_tok.pos_start, self.current_tok.pos_end,f"Expected ',' or ']'"))
-			res.register_advance()
 			self.advance()
 		return res.success(ListNode(element_nodes,pos_start,self.current_tok.pos_end.copy()))
 
-	def factor(self):
+	def dict_expr(self):
+		res = ParseResult()
+		entry_nodes = []
+		pos_start = self.current_tok.pos_start.copy()
+		if self.current_tok.type != TOK_LBRACE:
+			return res.failure(InvalidSyntaxError(self.current_tok.pos_start, self.current_tok.pos_end,f"Expected '{{'"))
+
+		self.advance()
+
+		if self.current_tok.type != TOK_RBRACE:
+			while True:
+				key_node = res.register(self.expr())
+				if res.error: return res
+				if self.current_tok.type != TOK_COLON:
+					return res.failure(InvalidSyntaxError(self.current_tok.pos_start, self.current_tok.pos_end,f"Expected ':'"))
+				self.advance()
+
+				value_node = res.register(self.expr())
+				if res.error: return res
+				entry_nodes.append((key_node, value_node))
+
+				if self.current_tok.type != TOK_COMMA: break
+				self.advance()
+
+			if self.current_tok.type != TOK_RBRACE:
+				return res.failure(InvalidSyntaxError(self.current_tok.pos_start, self.current_tok.pos_end,f"Expected ',' or '}}'"))
+
+		pos_end = self.current_tok.pos_end.copy()
+		self.advance()
+		return res.success(DictNode(entry_nodes, pos_start, pos_end))
+
+	def op_expr(self, min_prec):
 		res = ParseResult()
 		tok = self.current_tok
 
-		if tok.type in (TOK_PLUS, TOK_MINUS):
-			res.register_advance()
+		if tok.type == TOK_KEYWORD and tok.value == 'NOT' and min_prec <= PREC_COMP:
 			self.advance()
-			factor = res.register(self.factor())
+			node = res.register(self.comp_expr())
 			if res.error: return res
-			return res.success(UnaryOpNode(tok, factor))
-		
-		return self.power()
+			left = UnaryOpNode(tok, node)
+		elif tok.type in (TOK_PLUS, TOK_MINUS):
+			self.advance()
+			node = res.register(self.op_expr(PREC_UNARY))
+			if res.error: return res
+			left = UnaryOpNode(tok, node)
+		else:
+			left = res.register(self.call())
+			if res.error: return res
+
+		while True:
+			op_tok = self.current_tok
+			prec = BINARY_PRECEDENCE.get((op_tok.type, op_tok.value) if op_tok.type == TOK_KEYWORD else op_tok.type)
+			if prec is None or prec < min_prec: break
+			self.advance()
 
-	def term(self):
-		return self.bin_op(self.factor, (TOK_MUL, TOK_DIV, TOK_MOD))
+			if prec == PREC_AND_OR:
+				right = res.register(self.comp_expr())
+			elif prec == PREC_POW:
+				right = res.register(self.op_expr(PREC_UNARY))
+			else:
+				right = res.register(self.op_expr(prec + 1))
+			if res.error: return res
+			left = BinOpNode(left, op_tok, right)
 
-	def art_expr(self):
-		return self.bin_op(self.term,(TOK_PLUS,TOK_MINUS))
+		return res.success(left)
 
 	def comp_expr(self):
 		res=ParseResult()
-		if self.current_tok.matches(TOK_KEYWORD,"NOT"):
-			op_tok = self.current_tok
-			res.register_advance()
-			self.advance()
-
-			node= res.register(self.comp_expr())
-			if res.error:return res
-			return res.success(UnaryOpNode(op_tok,node))
-		node=res.register(self.bin_op(self.art_expr,(TOK_EE,TOK_NE,TOK_LT,TOK_GT,TOK_LTE,TOK_GTE)))
+		node_idx = self.tok_idx
+		node=res.register(self.op_expr(PREC_COMP))
 
 		if res.error:
+			if self.tok_idx != node_idx: return res
 			return res.failure(InvalidSyntaxError(self.current_tok.pos_start,self.current_tok.pos_end,
 			"Expected int, float, identifier, '+', '-', '(','[', 'NOT'"))
 		return res.success(node)
@@ -1062,18 +1175,15 @@ class Parser:
 	def expr(self):
 		res=ParseResult()
 		if self.current_tok.matches(TOK_KEYWORD, 'var'):
-			res.register_advance()
 			self.advance()
 
 			if self.current_tok.type != TOK_IDENTIFIER:
 				return res.failure(InvalidSyntaxError(self.current_tok.pos_start,self.current_tok.pos_end,'Expected identifier'))
 			var_name=self.current_tok
-			res.register_advance()
 			self.advance()
 
 			if self.current_tok.type != TOK_EQS:
 				return res.failure(InvalidSyntaxError(self.current_tok.pos_start,self.current_tok.pos_end,"Expected '='"))
-			res.register_advance()
 			self.advance()
 			expr=res.register(self.expr())
 
@@ -1081,8 +1191,10 @@ class Parser:
 			return res.success(VarAssignNode(var_name,expr))
 
 
-		node= res.register(self.bin_op(self.comp_expr, ((TOK_KEYWORD,"AND"),(TOK_KEYWORD,"OR"))))
+		node_idx = self.tok_idx
+		node= res.register(self.op_expr(PREC_AND_OR))
 		if res.error:
+			if self.tok_idx != node_idx: return res
 			return res.failure(InvalidSyntaxError(self.current_tok.pos_start,self.current_tok.pos_end,"Expected 'var', 'if', 'from', 'until', 'fun', int, float, identifier, '+', '-' or '(', '[' "))
 		return res.success(node)
 
@@ -1095,12 +1207,10 @@ class Parser:
 				f"Expected 'fun'"
 			))
 
-		res.register_advance()
 		self.advance()
 
 		if self.current_tok.type == TOK_IDENTIFIER:
 			var_name_tok = self.current_tok
-			res.register_advance()
 			self.advance()
 			if self.current_tok.type != TOK_LPAREN:
 				return res.failure(InvalidSyntaxError(
@@ -1115,17 +1225,14 @@ class Parser:
 					f"Expected identifier or '('"
 				))
 		
-		res.register_advance()
 		self.advance()
 		arg_name_toks = []
 
 		if self.current_tok.type == TOK_IDENTIFIER:
 			arg_name_toks.append(self.current_tok)
-			res.register_advance()
 			self.advance()
 			
 			while self.current_tok.type == TOK_COMMA:
-				res.register_advance()
 				self.advance()
 
 				if self.current_tok.type != TOK_IDENTIFIER:
@@ -1135,7 +1242,6 @@ class Parser:
 					))
 
 				arg_name_toks.append(self.current_tok)
-				res.register_advance()
 				self.advance()
 			
 			if self.current_tok.type != TOK_RPAREN:
@@ -1150,11 +1256,9 @@ class Parser:
 					f"Expected identifier or ')'"
 				))
 
-		res.register_advance()
 		self.advance()
 
 		if self.current_tok.type == TOK_COLON:
-			res.register_advance()
 			self.advance()
 
 			body = res.register(self.expr())
@@ -1172,7 +1276,6 @@ class Parser:
         f"Expected ':' or NEWLINE"
       ))
 
-		res.register_advance()
 		self.advance()
 
 		body = res.register(self.statements())
@@ -1184,7 +1287,6 @@ class Parser:
         f"Expected 'just'"
       ))
 
-		res.register_advance()
 		self.advance()
     
 		return res.success(FuncDefNode(
@@ -1194,25 +1296,402 @@ class Parser:
 	  False
     ))
 
+#######################################
+# RESOLVER
+#######################################
+
+def node_handlers(cls, prefix):
+	return {
+		globals()[name[len(prefix):]]: getattr(cls, name)
+		for name in dir(cls) if name.startswith(prefix) and name[len(prefix):] in globals()
+	}
+
+def child_nodes(node):
+	if isinstance(node, ListNode):
+		return node.element_nodes
+	if isinstance(node, DictNode):
+		return [entry_node for entry in node.entry_nodes for entry_node in entry]
+	if isinstance(node, VarAssignNode):
+		return [node.value_node]
+	if isinstance(node, BinOpNode):
+		return [node.left_node, node.right_node]
+	if isinstance(node, UnaryOpNode):
+		return [node.node]
+	if isinstance(node, IfNode):
+		children = []
+		for condition, expr, _ in node.cases:
+			children += [condition, expr]
+		if node.else_case:
+			children.append(node.else_case[0])
+		return children
+	if isinstance(node, FromNode):
+		children = [node.start_value_node, node.end_value_node]
+		if node.step_value_node: children.append(node.step_value_node)
+		return children + [node.body_node]
+	if isinstance(node, UntilNode):
+		return [node.condition_node, node.body_node]
+	if isinstance(node, FuncDefNode):
+		return [node.body_node]
+	if isinstance(node, CallNode):
+		return [node.node_to_call] + node.arg_nodes
+	if isinstance(node, RetNode):
+		return [node.node_to_return] if node.node_to_return else []
+	if isinstance(node, HoistedNode):
+		return [node.node]
+	return []
+
+# Marks the calls a function makes to itself (by its own name) whose value
+# it returns as it is: the body of a fun with ':', what follows ret, and
+# the branches of an if that is itself in tail position
+def mark_tail_calls(node, tail, name):
+	if isinstance(node, FuncDefNode): return
+	if isinstance(node, CallNode):
+		callee = node.node_to_call
+		node.tail = tail and isinstance(callee, VarAccessNode) and callee.var_name_tok.value == name
+	elif isinstance(node, IfNode):
+		for condition, expr, should_return_null in node.cases:
+			mark_tail_calls(condition, False, name)
+			mark_tail_calls(expr, tail and not should_return_null, name)
+		if node.else_case:
+			expr, should_return_null = node.else_case
+			mark_tail_calls(expr, tail and not should_return_null, name)
+		return
+	elif isinstance(node, RetNode):
+		if node.node_to_return: mark_tail_calls(node.node_to_return, True, name)
+		return
+	for child in child_nodes(node):
+		mark_tail_calls(child, False, name)
+
+# Gives every variable inside a function a slot in its frame. A name is
+# local to a function if it is a parameter or assigned anywhere in its
+# body (var, from, fun). Reads get the (depth, slot) of every enclosing
+# function that declares the name, innermost first; the first slot that
+# is set wins and the global symbol table is the fallback, so a local
+# read before its first assignment still sees the outer value.
+class Resolver:
+	def resolve_program(self, node):
+		self.scopes = []
+		self.resolve(node)
+
+	def resolve(self, node):
+		handler = self.handlers.get(type(node))
+		if handler: handler(self, node)
+		if not isinstance(node, FuncDefNode):
+			for child in child_nodes(node):
+				self.resolve(child)
+
+	def declare(self, name):
+		return self.scopes[-1][name] if self.scopes else None
+
+	def declared_names(self, node, names):
+		if isinstance(node, VarAssignNode):
+			names.append(node.var_name_tok.value)
+		elif isinstance(node, FromNode):
+			names.append(node.var_name_tok.value)
+		elif isinstance(node, FuncDefNode):
+			if node.var_name_tok: names.append(node.var_name_tok.value)
+			return
+		for child in child_nodes(node):
+			self.declared_names(child, names)
+
 	###################################
 
-	def bin_op(self, func_a, ops, func_b=None):
-		if func_b == None:
-			func_b = func_a
+	def resolve_VarAccessNode(self, node):
+		name = node.var_name_tok.value
+		address = []
+		for depth, scope in enumerate(reversed(self.scopes)):
+			if name in scope: address.append((depth, scope[name]))
+		node.address = tuple(address)
 
-		res = ParseResult()
-		left = res.register(func_a())
-		if res.error: return res
+	def resolve_VarAssignNode(self, node):
+		node.slot = self.declare(node.var_name_tok.value)
 
-		while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
-			op_tok = self.current_tok
-			res.register_advance()
-			self.advance()
-			right = res.register(func_b())
-			if res.error: return res
-			left = BinOpNode(left, op_tok, right)
+	def resolve_FromNode(self, node):
+		node.var_slot = self.declare(node.var_name_tok.value)
 
-		return res.success(left)
+	def resolve_FuncDefNode(self, node):
+		if node.var_name_tok:
+			node.name_slot = self.declare(node.var_name_tok.value)
+
+		# Arguments fill the first slots in order; a repeated argument name
+		# resolves to its last occurrence, as the old symbol table did
+		slot_names = [arg_name_tok.value for arg_name_tok in node.arg_name_toks]
+		body_names = []
+		self.declared_names(node.body_node, body_names)
+		for name in body_names:
+			if name not in slot_names: slot_names.append(name)
+		node.slot_names = slot_names
+
+		self.scopes.append({name: slot for slot, name in enumerate(slot_names)})
+		self.resolve(node.body_node)
+		self.scopes.pop()
+
+		if node.var_name_tok:
+			mark_tail_calls(node.body_node, node.should_auto_return, node.var_name_tok.value)
+
+Resolver.handlers = node_handlers(Resolver, 'resolve_')
+
+#######################################
+# OPTIMIZER
+#######################################
+
+# Folds that would build constants bigger than this are left to run time
+FOLD_MAX_BITS = 1024
+FOLD_MAX_CHARS = 1024
+
+def is_constant(node):
+	return isinstance(node, (NumberNode, StringNode))
+
+def constant_node(value, node):
+	pos_start, pos_end = node.pos_start, node.pos_end
+	if isinstance(value, String):
+		return StringNode(Token(TOK_STRING, value.value, pos_start.idx, pos_end.idx, pos_start.file_id))
+	tok_type = TOK_FLOAT if isinstance(value.value, float) else TOK_INT
+	return NumberNode(Token(tok_type, value.value, pos_start.idx, pos_end.idx, pos_start.file_id))
+
+# Rewrites the tree before it is run: folds operations whose operands are
+# literals, prunes if-cases with literal conditions and drops statements
+# that follow ret, brk or cont in a block. Anything that would fail when
+# evaluated is left in place so the error still happens at run time.
+PURE_BINARY_OPS = {BINARY_OP_INDEX[key] for key in (
+	TOK_PLUS, TOK_MINUS, TOK_MUL, TOK_EE, TOK_NE, TOK_LT, TOK_GT, TOK_LTE, TOK_GTE,
+	(TOK_KEYWORD, 'AND'), (TOK_KEYWORD, 'OR'),
+)}
+
+def is_pure_element(node, loop):
+	# Whole-number arithmetic on the loop variable can't fail or see other
+	# state, so a loop with such a body can work out its values on demand
+	node_type = type(node)
+	if node_type is NumberNode:
+		return type(node.value.value) is int
+	if node_type is VarAccessNode:
+		if node.var_name_tok.value != loop.var_name_tok.value: return False
+		if loop.var_slot is None: return not node.address
+		return node.address[:1] == ((0, loop.var_slot),)
+	if node_type is UnaryOpNode:
+		return node.op_tok.type in (TOK_MINUS, TOK_PLUS) and is_pure_element(node.node, loop)
+	if node_type is BinOpNode:
+		if node.op_index == BINARY_OP_INDEX[TOK_MOD]:
+			right = node.right_node
+			if not (type(right) is NumberNode and type(right.value.value) is int and right.value.value): return False
+		elif node.op_index not in PURE_BINARY_OPS:
+			return False
+		return is_pure_element(node.left_node, loop) and is_pure_element(node.right_node, loop)
+	return False
+
+class Optimizer:
+	def optimize(self, node):
+		handler = self.handlers.get(type(node))
+		return handler(self, node) if handler else node
+
+	def fold(self, func, node, *operands):
+		try:
+			result, error = func(*(operand.value for operand in operands))
+		except Exception:
+			return node
+		if error or not isinstance(result, (Number, String)): return node
+		if isinstance(result, String) and len(result.value) > FOLD_MAX_CHARS: return node
+		if isinstance(result.value, int) and result.value.bit_length() > FOLD_MAX_BITS: return node
+		return constant_node(result, node)
+
+	###################################
+
+	def optimize_ListNode(self, node):
+		element_nodes = []
+		for element_node in node.element_nodes:
+			element_nodes.append(self.optimize(element_node))
+			if isinstance(element_node, (RetNode, BrkNode, ContNode)): break
+		node.element_nodes = element_nodes
+		return node
+
+	def optimize_DictNode(self, node):
+		node.entry_nodes = [(self.optimize(key_node), self.optimize(value_node)) for key_node, value_node in node.entry_nodes]
+		return node
+
+	def optimize_VarAssignNode(self, node):
+		node.value_node = self.optimize(node.value_node)
+		return node
+
+	def optimize_BinOpNode(self, node):
+		node.left_node = self.optimize(node.left_node)
+		left = node.left_node
+		decides = SHORT_CIRCUIT_OPS.get(node.op_index)
+		if decides is not None and is_constant(left) and type(left.value) is Number and bool(left.value.value) is decides:
+			return left
+
+		node.right_node = self.optimize(node.right_node)
+		right = node.right_node
+		if not (is_constant(left) and is_constant(right)): return node
+
+		if node.op_tok.type == TOK_POW and isinstance(left.value.value, int) and isinstance(right.value.value, int):
+			# Work out the size first; computing a huge power just to throw it away could hang
+			if right.value.value * max(left.value.value.bit_length(), 1) > FOLD_MAX_BITS: return node
+		if node.op_tok.type == TOK_MUL and isinstance(left.value, String) and isinstance(right.value.value, int):
+			# Likewise for repeating a string
+			if left.value.size * right.value.value > FOLD_MAX_CHARS: return node
+		return self.fold(BINARY_OP_FUNCS[node.op_index], node, left, right)
+
+	def optimize_UnaryOpNode(self, node):
+		node.node = self.optimize(node.node)
+		if not is_constant(node.node): return node
+
+		if node.op_tok.type == TOK_MINUS:
+			return self.fold(lambda value: value.multed_by(make_number(-1)), node, node.node)
+		if node.op_tok.matches(TOK_KEYWORD, 'NOT'):
+			return self.fold(lambda value: value.notted(), node, node.node)
+		return constant_node(node.node.value, node)
+
+	def optimize_IfNode(self, node):
+		cases = []
+		else_case = node.else_case
+		for condition, expr, should_return_null in node.cases:
+			# Only the bodies of cases that can still run are optimized
+			condition = self.optimize(condition)
+			if not is_constant(condition):
+				cases.append((condition, self.optimize(expr), should_return_null))
+			elif condition.value.is_true():
+				else_case = (self.optimize(expr), should_return_null)
+				break
+		else:
+			if else_case:
+				else_case = (self.optimize(else_case[0]), else_case[1])
+
+		if cases:
+			node.cases, node.else_case = cases, else_case
+			return node
+		if else_case and not else_case[1]:
+			return else_case[0]
+		if else_case:
+			node.cases, node.else_case = [], else_case
+			return node
+		return constant_node(Number.null, node)
+
+	def optimize_FromNode(self, node):
+		node.start_value_node = self.optimize(node.start_value_node)
+		node.end_value_node = self.optimize(node.end_value_node)
+		if node.step_value_node:
+			node.step_value_node = self.optimize(node.step_value_node)
+		node.body_node = self.optimize(node.body_node)
+		node.lazy = not node.should_return_null and is_pure_element(node.body_node, node)
+		return node
+
+	def optimize_UntilNode(self, node):
+		node.condition_node = self.optimize(node.condition_node)
+		node.body_node = self.optimize(node.body_node)
+		return node
+
+	def optimize_FuncDefNode(self, node):
+		node.body_node = self.optimize(node.body_node)
+		return node
+
+	def optimize_CallNode(self, node):
+		node.node_to_call = self.optimize(node.node_to_call)
+		node.arg_nodes = [self.optimize(arg_node) for arg_node in node.arg_nodes]
+		return node
+
+	def optimize_RetNode(self, node):
+		if node.node_to_return:
+			node.node_to_return = self.optimize(node.node_to_return)
+		return node
+
+Optimizer.handlers = node_handlers(Optimizer, 'optimize_')
+
+# Finds expressions in loop bodies (and until conditions) that give the
+# same value on every iteration and wraps them in HoistedNodes. A loop
+# qualifies if every call in it is to a built-in in PURE_BUILTINS: nothing
+# else can run during the loop, so the only state it changes is the
+# variables it assigns. An expression is invariant if it only reads
+# variables the loop doesn't assign and only calls those built-ins. Each
+# run of the loop checks the names still refer to the built-ins first.
+def hoist_invariants(node):
+	if isinstance(node, (FromNode, UntilNode)) and not (isinstance(node, FromNode) and node.lazy):
+		callees = loop_callees(node)
+		if callees is not None:
+			assigned = []
+			Resolver().declared_names(node, assigned)
+			assigned = set(assigned)
+			if not any(callee.var_name_tok.value in assigned for callee in callees):
+				hoisted = []
+				node.body_node = hoist_expressions(node.body_node, assigned, hoisted)
+				if isinstance(node, UntilNode):
+					node.condition_node = hoist_expressions(node.condition_node, assigned, hoisted)
+				if hoisted: node.hoisted = (hoisted, callees)
+
+	for child in child_nodes(node):
+		hoist_invariants(child)
+
+def loop_callees(loop):
+	# The callee of every call the loop makes, or None if one isn't pure
+	callees = []
+	nodes = [loop.body_node] + ([loop.condition_node] if isinstance(loop, UntilNode) else [])
+	while nodes:
+		node = nodes.pop()
+		if isinstance(node, FuncDefNode): continue
+		if isinstance(node, CallNode):
+			callee = node.node_to_call
+			if not (isinstance(callee, VarAccessNode) and callee.var_name_tok.value in PURE_BUILTINS): return None
+			callees.append(callee)
+		nodes += child_nodes(node)
+	return callees
+
+def is_invariant(node, assigned):
+	node_type = type(node)
+	if node_type in (NumberNode, StringNode, HoistedNode): return True
+	if node_type is VarAccessNode: return node.var_name_tok.value not in assigned
+	if node_type is UnaryOpNode: return is_invariant(node.node, assigned)
+	if node_type is BinOpNode: return is_invariant(node.left_node, assigned) and is_invariant(node.right_node, assigned)
+	if node_type is CallNode:
+		return is_invariant(node.node_to_call, assigned) and all(is_invariant(arg_node, assigned) for arg_node in node.arg_nodes)
+	return False
+
+def hoist_expressions(node, assigned, hoisted):
+	if isinstance(node, (UnaryOpNode, BinOpNode, CallNode)) and is_invariant(node, assigned):
+		hoisted_node = HoistedNode(node)
+		hoisted.append(hoisted_node)
+		return hoisted_node
+
+	def hoist(child):
+		return hoist_expressions(child, assigned, hoisted)
+
+	if isinstance(node, ListNode):
+		node.element_nodes = [hoist(element_node) for element_node in node.element_nodes]
+	elif isinstance(node, DictNode):
+		node.entry_nodes = [(hoist(key_node), hoist(value_node)) for key_node, value_node in node.entry_nodes]
+	elif isinstance(node, VarAssignNode):
+		node.value_node = hoist(node.value_node)
+	elif isinstance(node, BinOpNode):
+		node.left_node, node.right_node = hoist(node.left_node), hoist(node.right_node)
+	elif isinstance(node, UnaryOpNode):
+		node.node = hoist(node.node)
+	elif isinstance(node, IfNode):
+		node.cases = [(hoist(condition), hoist(expr), should_return_null) for condition, expr, should_return_null in node.cases]
+		if node.else_case: node.else_case = (hoist(node.else_case[0]), node.else_case[1])
+	elif isinstance(node, FromNode):
+		node.start_value_node, node.end_value_node = hoist(node.start_value_node), hoist(node.end_value_node)
+		if node.step_value_node: node.step_value_node = hoist(node.step_value_node)
+		if not node.lazy: node.body_node = hoist(node.body_node)
+	elif isinstance(node, UntilNode):
+		node.condition_node, node.body_node = hoist(node.condition_node), hoist(node.body_node)
+	elif isinstance(node, CallNode):
+		node.arg_nodes = [hoist(arg_node) for arg_node in node.arg_nodes]
+	elif isinstance(node, RetNode):
+		if node.node_to_return: node.node_to_return = hoist(node.node_to_return)
+	return node
+
+# Only values nothing can change are kept; a list or dict is built anew
+# each time, as it was before
+def enter_hoisted(loop, context):
+	hoisted, callees = loop.hoisted
+	active = all(
+		context.lookup(callee.address, callee.var_name_tok.value) is PURE_BUILTINS[callee.var_name_tok.value]
+		for callee in callees
+	)
+	for hoisted_node in hoisted:
+		hoisted_node.value = None
+		hoisted_node.active = active
+
+def keep_hoisted(node, value):
+	if node.active and type(value) in (Number, String, NumArray): node.value = value
 
 #######################################
 # RUNTIME RESULT
@@ -1269,23 +1748,37 @@ class RTResult:
       self.loop_should_break
     )
 
+# The tree-walker returns values directly and uses these for everything
+# that has to unwind: runtime errors, ret, cont and brk.
+class ErrorSignal(Exception):
+	def __init__(self, error):
+		self.error = error
+
+class ReturnSignal(Exception):
+	def __init__(self, value):
+		self.value = value
+
+class ContinueSignal(Exception):
+	pass
+
+class BreakSignal(Exception):
+	pass
+
+# What a call in tail position evaluates to in the tree-walker: the callee
+# and its arguments, for Function.call to run in place of the current body
+class TailCall:
+	__slots__ = ('function', 'args')
+
+	def __init__(self, function, args):
+		self.function = function
+		self.args = args
+
 #######################################
 # VALUES
 #######################################
 
 class Value:
-	def __init__(self):
-		self.set_pos()
-		self.set_context()
-
-	def set_pos(self, pos_start=None, pos_end=None):
-		self.pos_start = pos_start
-		self.pos_end = pos_end
-		return self
-
-	def set_context(self, context=None):
-		self.context = context
-		return self
+	__slots__ = ()
 
 	def added_to(self, other):
 		return None, self.illegal_operation(other)
@@ -1302,22 +1795,22 @@ class Value:
 	def powed_by(self, other):
 		return None, self.illegal_operation(other)
 
-	def get_comparison_eq(self, other):
+	def get_comp_eq(self, other):
 		return None, self.illegal_operation(other)
 
-	def get_comparison_ne(self, other):
+	def get_comp_ne(self, other):
 		return None, self.illegal_operation(other)
 
-	def get_comparison_lt(self, other):
+	def get_comp_lt(self, other):
 		return None, self.illegal_operation(other)
 
-	def get_comparison_gt(self, other):
+	def get_comp_gt(self, other):
 		return None, self.illegal_operation(other)
 
-	def get_comparison_lte(self, other):
+	def get_comp_lte(self, other):
 		return None, self.illegal_operation(other)
 
-	def get_comparison_gte(self, other):
+	def get_comp_gte(self, other):
 		return None, self.illegal_operation(other)
 
 	def anded_by(self, other):
@@ -1329,7 +1822,7 @@ class Value:
 	def notted(self,other):
 		return None, self.illegal_operation(other)
 
-	def execute(self, args):
+	def execute(self, args, context, entry_pos):
 		return RTResult().failure(self.illegal_operation())
 
 	def copy(self):
@@ -1338,158 +1831,230 @@ class Value:
 	def is_true(self):
 		return False
 
+	# Values usable as dict keys return a hashable Python value that is
+	# equal for equal keys; everything else returns None
+	def hash_key(self):
+		return None
+
 	def illegal_operation(self, other=None):
-		if not other: other = self
-		return RunTimeError(
-			self.pos_start, other.pos_end,
-			'Illegal operation',
-			self.context
-		)
+		return RunTimeError(None, None, 'Illegal operation', None)
 
 class Number(Value):
+	__slots__ = ('value',)
+
 	def __init__(self, value):
-		super().__init__()
 		self.value = value
 
 	def added_to(self, other):
 		if isinstance(other, Number):
-			return Number(self.value + other.value).set_context(self.context), None
+			return make_number(self.value + other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def subbed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value - other.value).set_context(self.context), None
+			return make_number(self.value - other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def multed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value * other.value).set_context(self.context), None
+			return make_number(self.value * other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def dived_by(self, other):
 		if isinstance(other, Number):
 			if other.value == 0:
-				return None, RunTimeError(
-					other.pos_start, other.pos_end,
-					'Division by zero',
-					self.context
-				)
+				return None, OperandError('Division by zero')
 
-			return Number(self.value / other.value).set_context(self.context), None
+			return make_number(self.value / other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def moded_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value % other.value).set_context(self.context), None
+			return make_number(self.value % other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def powed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value ** other.value).set_context(self.context), None
+			return make_number(self.value ** other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comp_eq(self, other):
 		if isinstance(other, Number):
-			return Number((self.value == other.value)).set_context(self.context), None
+			return make_number(self.value == other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comp_ne(self, other):
 		if isinstance(other, Number):
-			return Number((self.value != other.value)).set_context(self.context), None
+			return make_number(self.value != other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comp_lt(self, other):
 		if isinstance(other, Number):
-			return Number((self.value < other.value)).set_context(self.context), None
+			return make_number(self.value < other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comp_gt(self, other):
 		if isinstance(other, Number):
-			return Number((self.value > other.value)).set_context(self.context), None
+			return make_number(self.value > other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comp_lte(self, other):
 		if isinstance(other, Number):
-			return Number((self.value <= other.value)).set_context(self.context), None
+			return make_number(self.value <= other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comp_gte(self, other):
 		if isinstance(other, Number):
-			return Number((self.value >= other.value)).set_context(self.context), None
+			return make_number(self.value >= other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def anded_by(self, other):
 		if isinstance(other, Number):
-			return Number((self.value and other.value)).set_context(self.context), None
+			return make_number(self.value and other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def ored_by(self, other):
 		if isinstance(other, Number):
-			return Number((self.value or other.value)).set_context(self.context), None
+			return make_number(self.value or other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def notted(self):
-		return Number(True if self.value == 0 else False).set_context(self.context), None
+		return make_number(self.value == 0), None
 
 	def copy(self):
-		copy = Number(self.value)
-		copy.set_pos(self.pos_start, self.pos_end)
-		copy.set_context(self.context)
-		return copy
+		return Number(self.value)
 
 	def is_true(self):
 		return self.value != 0
 
+	def hash_key(self):
+		return self.value
+
 	def __str__(self):	
 		return str(self.value)
 	
 	def __repr__(self):
 		return str(self.value)
 
-Number.null=Number(0)
-Number.false=Number(0)
-Number.true=Number(1)
+# Small integers and booleans are interned: arithmetic, comparisons and
+# loop counters hand out these shared instances instead of allocating
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 256
+SMALL_INTS = [Number(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+BOOL_NUMBERS = (Number(False), Number(True))
+
+def make_number(value):
+	if type(value) is int:
+		if SMALL_INT_MIN <= value <= SMALL_INT_MAX: return SMALL_INTS[value - SMALL_INT_MIN]
+	elif type(value) is bool:
+		return BOOL_NUMBERS[value]
+	return Number(value)
+
+Number.null=make_number(0)
+Number.false=make_number(0)
+Number.true=make_number(1)
 Number.mpi=Number(math.pi)
 
+def number_range(start, end, step):
+	# Whole-number bounds are handed to range(); anything else is stepped by hand
+	if type(start) is int and type(end) is int and type(step) is int and step:
+		return map(make_number, range(start, end, step))
+	return stepped_numbers(start, end, step)
+
+def stepped_numbers(i, end, step):
+	if step >= 0:
+		while i < end:
+			yield make_number(i)
+			i += step
+	else:
+		while i > end:
+			yield make_number(i)
+			i += step
+
+# A string built by + keeps its pieces in a list and joins them the first
+# time its text is needed (print, comparison, use as a dict key...), so
+# var s = s + x in a loop is linear instead of copying s every time.
+# Strings made from one another share the list: a string owns
+# pieces[:count], and appending only copies the list when another string
+# has already appended past its end.
 class String(Value):
+	__slots__ = ('pieces', 'count', 'size', 'text')
+
 	def __init__(self, value):
-		super().__init__()
-		self.value = value
+		self.pieces = [value]
+		self.count = 1
+		self.size = len(value)
+		self.text = value
+
+	@property
+	def value(self):
+		text = self.text
+		if text is None:
+			pieces = self.pieces
+			if len(pieces) != self.count: pieces = pieces[:self.count]
+			text = self.text = ''.join(pieces)
+			self.pieces = [text]
+			self.count = 1
+		return text
 
 	def added_to(self, other):
 		if isinstance(other, String):
-			return String(self.value + other.value).set_context(self.context), None
+			pieces, count = self.pieces, self.count
+			if len(pieces) != count: pieces = pieces[:count]
+			pieces.append(other.value)
+
+			string = String.__new__(String)
+			string.pieces = pieces
+			string.count = count + 1
+			string.size = self.size + other.size
+			string.text = None
+			return string, None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def multed_by(self, other):
 		if isinstance(other, Number):
-			return String(self.value * other.value).set_context(self.context), None
+			return String(self.value * other.value), None
+		else:
+			return None, Value.illegal_operation(self, other)
+
+	def get_comp_eq(self, other):
+		if isinstance(other, String):
+			return make_number(self.size == other.size and self.value == other.value), None
+		else:
+			return None, Value.illegal_operation(self, other)
+
+	def get_comp_ne(self, other):
+		if isinstance(other, String):
+			return make_number(self.size != other.size or self.value != other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def is_true(self):
-		return len(self.value) > 0
+		return self.size > 0
+
+	def length(self):
+		return self.size
+
+	def hash_key(self):
+		return self.value
 
 	def copy(self):
-		copy = String(self.value)
-		copy.set_pos(self.pos_start, self.pos_end)
-		copy.set_context(self.context)
-		return copy
+		return String(self.value)
 
 	def __str__(self):
 		return self.value
@@ -1498,69 +2063,364 @@ class String(Value):
 		return f'"{self.value}"'
 
 class List(Value):
+	__slots__ = ('vector', 'edit')
+
 	def __init__(self, elements):
-		super().__init__()
-		self.elements = elements
+		# Takes over a Python list, or shares an existing PersistentVector
+		if not isinstance(elements, PersistentVector):
+			elements = PersistentVector.from_list(elements)
+		self.vector = elements
+		self.edit = None
 	
 	def added_to(self, other):
-		new_list = self.copy()
-		new_list.elements.append(other)
-		return new_list, None
+		return List(self.share().append(other)), None
 		
 	def subbed_by(self, other):
 		if isinstance(other, Number):
-			new_list = self.copy()
 			try:
-				new_list.elements.pop(other.value)
-				return new_list, None
+				return List(self.share().removed(other.value)), None
 			except:
-				return None, RunTimeError(
-          other.pos_start, other.pos_end,
-          'Element at this index could not be removed from list because index is out of bounds',
-          self.context
-        )
+				return None, OperandError('Element at this index could not be removed from list because index is out of bounds')
 		else:
 			return None, Value.illegal_operation(self, other)
 	
 	def multed_by(self, other):
 		if isinstance(other, List):
-			new_list = self.copy()
-			new_list.elements.extend(other.elements)
-			return new_list, None
+			return List(self.share().extend(other.iter_elements())), None
 		else:
 			return None, Value.illegal_operation(self, other)
 			
 	def dived_by(self, other):
 		if isinstance(other, Number):
 			try:
-				return self.elements[other.value], None
+				return self.element_at(other.value), None
 			except:
-				return None, RunTimeError(
-          other.pos_start, other.pos_end,
-          'Element at this index could not be retrieved from list because index is out of bounds',
-          self.context
-        )
+				return None, OperandError('Element at this index could not be retrieved from list because index is out of bounds')
 		else:
 			return None, Value.illegal_operation(self, other)
-  	
-	def copy(self):
-		copy = List(self.elements)
-		copy.set_pos(self.pos_start, self.pos_end)
-		copy.set_context(self.context)
-		return copy
-	def __str__(self):
-		return ", ".join([str(x) for x in self.elements])
-	def __repr__(self):
-		return f'[{", ".join([repr(x) for x in self.elements])}]'
 
-class BaseFunction(Value):
-  def __init__(self, name):
-    super().__init__()
+	# append, pop and ccat change the list in place by editing its vector under
+	# the list's own token. The token is dropped whenever the vector is shared.
+	def share(self):
+		self.edit = None
+		return self.vector
+
+	def transient(self):
+		if self.edit is None: self.edit = object()
+		return self.edit
+
+	def append(self, value):
+		self.vector = self.vector.append(value, self.transient())
+
+	def pop(self, index):
+		element = self.vector[index]
+		self.vector = self.vector.removed(index, self.transient())
+		return element
+
+	def extend(self, other):
+		self.vector = self.vector.extend(other.share(), self.transient())
+  	
+	def element_at(self, index):
+		return self.vector[index]
+
+	def length(self):
+		return len(self.vector)
+
+	def iter_elements(self):
+		return iter(self.vector)
+
+	def copy(self):
+		return List(self.share())
+	def __str__(self):
+		return ", ".join([str(x) for x in self.iter_elements()])
+	def __repr__(self):
+		return f'[{", ".join([repr(x) for x in self.iter_elements()])}]'
+
+# The result of a from loop whose body is pure (see is_pure_element). Elements
+# are worked out from the loop's range when they are read. The vector slot
+# stays None until something needs the elements stored, e.g. append or pop;
+# every List method that uses the slot directly is overridden here to build
+# it first.
+class LoopSequence(List):
+	__slots__ = ('values', 'body_node')
+
+	def __init__(self, values, body_node):
+		self.vector = None
+		self.edit = None
+		self.values = values
+		self.body_node = body_node
+
+	def materialize(self):
+		if self.vector is None:
+			self.vector = PersistentVector.from_list(list(self.iter_elements()))
+			self.values = self.body_node = None
+
+	def share(self):
+		self.materialize()
+		return List.share(self)
+
+	def append(self, value):
+		self.materialize()
+		List.append(self, value)
+
+	def pop(self, index):
+		self.materialize()
+		return List.pop(self, index)
+
+	def extend(self, other):
+		self.materialize()
+		List.extend(self, other)
+
+	def element_at(self, index):
+		if self.vector is not None: return self.vector[index]
+		return pure_value(self.body_node, make_number(self.values[index]))
+
+	def length(self):
+		if self.vector is not None: return len(self.vector)
+		return len(self.values)
+
+	def iter_elements(self):
+		if self.vector is not None: return iter(self.vector)
+		body_node = self.body_node
+		return (pure_value(body_node, number) for number in map(make_number, self.values))
+
+def pure_value(node, value):
+	node_type = type(node)
+	if node_type is NumberNode: return node.value
+	if node_type is VarAccessNode: return value
+	if node_type is UnaryOpNode:
+		operand = pure_value(node.node, value)
+		return operand.multed_by(make_number(-1))[0] if node.op_tok.type == TOK_MINUS else operand
+	return BINARY_OP_FUNCS[node.op_index](pure_value(node.left_node, value), pure_value(node.right_node, value))[0]
+
+def run_lazy_loop(node, start, end, step, context):
+	if type(start) is int and type(end) is int and type(step) is int and step:
+		values = range(start, end, step)
+		result = LoopSequence(values, node.body_node)
+	else:
+		values = list(number_range(start, end, step))
+		result = List([pure_value(node.body_node, value) for value in values])
+		values = [value.value for value in values]
+
+	# The loop variable is left holding its last value, as after a normal loop
+	if values: context.assign(node.var_slot, node.var_name_tok.value, make_number(values[-1]))
+	return result
+
+# A homogeneous array of numbers stored in one array.array buffer, 'q' for
+# whole numbers and 'd' for floats. Arithmetic and comparisons work element
+# by element against another array of the same length or a single Number.
+# They run through NumPy when it is installed.
+class NumArray(Value):
+	__slots__ = ('data',)
+
+	def __init__(self, data):
+		self.data = data
+
+	def operate(self, other, op):
+		if isinstance(other, NumArray):
+			right = other.data
+			if len(right) != len(self.data):
+				return None, RunTimeError(None, None, 'Arrays must have the same length', None)
+			has_zero = 0 in right
+		elif isinstance(other, Number):
+			right = other.value
+			has_zero = right == 0
+		else:
+			return None, Value.illegal_operation(self, other)
+
+		if has_zero and op in (operator.truediv, operator.mod):
+			return None, OperandError('Division by zero')
+
+		try:
+			return NumArray(vectorized(op, self.data, right)), None
+		except ZeroDivisionError:
+			# Zero to a negative power
+			return None, OperandError('Division by zero')
+		except (OverflowError, TypeError):
+			return None, RunTimeError(None, None, 'Result does not fit in a number array', None)
+
+	def added_to(self, other):
+		return self.operate(other, operator.add)
+
+	def subbed_by(self, other):
+		return self.operate(other, operator.sub)
+
+	def multed_by(self, other):
+		return self.operate(other, operator.mul)
+
+	def dived_by(self, other):
+		return self.operate(other, operator.truediv)
+
+	def moded_by(self, other):
+		return self.operate(other, operator.mod)
+
+	def powed_by(self, other):
+		return self.operate(other, operator.pow)
+
+	def get_comp_eq(self, other):
+		return self.operate(other, operator.eq)
+
+	def get_comp_ne(self, other):
+		return self.operate(other, operator.ne)
+
+	def get_comp_lt(self, other):
+		return self.operate(other, operator.lt)
+
+	def get_comp_gt(self, other):
+		return self.operate(other, operator.gt)
+
+	def get_comp_lte(self, other):
+		return self.operate(other, operator.le)
+
+	def get_comp_gte(self, other):
+		return self.operate(other, operator.ge)
+
+	def length(self):
+		return len(self.data)
+
+	def total(self):
+		if numpy is not None:
+			values = numpy.frombuffer(self.data, NUMPY_DTYPES[self.data.typecode])
+			if self.data.typecode == 'd' or int_bound(values) * len(values) <= NUMPY_INT_LIMIT:
+				return values.sum().item()
+		return sum(self.data)
+
+	def to_list(self):
+		return List([make_number(value) for value in self.data])
+
+	def copy(self):
+		return NumArray(self.data)
+
+	def is_true(self):
+		return len(self.data) > 0
+
+	def __str__(self):
+		return f'array([{", ".join(map(str, self.data))}])'
+
+	def __repr__(self):
+		return str(self)
+
+ARRAY_COMPARISONS = (operator.eq, operator.ne, operator.lt, operator.gt, operator.le, operator.ge)
+NUMPY_DTYPES = {'q': 'int64', 'd': 'float64'}
+
+def make_array(numbers):
+	try:
+		return array.array('q', numbers)
+	except (TypeError, OverflowError):
+		return array.array('d', numbers)
+
+def result_typecode(op, left, right):
+	if op in ARRAY_COMPARISONS: return 'q'
+	if op is operator.truediv or left.typecode == 'd': return 'd'
+
+	if isinstance(right, array.array):
+		if right.typecode == 'd': return 'd'
+		negative = min(right, default=0) < 0
+	else:
+		if not isinstance(right, int): return 'd'
+		negative = right < 0
+
+	# Whole numbers to a negative power give fractions
+	return 'd' if op is operator.pow and negative else 'q'
+
+# int64 arithmetic in NumPy wraps around silently, so whole-number results
+# that could reach these limits are left to the exact path. Sums and
+# products are bounded from the operands; powers are estimated in floats.
+NUMPY_INT_LIMIT = 2 ** 63 - 1
+NUMPY_INT_BOUNDS = {operator.add: operator.add, operator.sub: operator.add, operator.mul: operator.mul, operator.mod: lambda left, right: right}
+
+def int_bound(value):
+	if not isinstance(value, numpy.ndarray): return abs(value)
+	return max(abs(int(value.min())), abs(int(value.max()))) if len(value) else 0
+
+def vectorized(op, left, right):
+	typecode = result_typecode(op, left, right)
+
+	if numpy is not None:
+		result = numpy_vectorized(op, left, right, typecode)
+		if result is not None: return result
+
+	if isinstance(right, array.array):
+		return array.array(typecode, map(op, left, right))
+	return array.array(typecode, map(op, left, itertools.repeat(right)))
+
+# Returns None when NumPy would overflow, divide by zero or produce an
+# invalid float, so that the exact path above gives the result or the error
+def numpy_vectorized(op, left, right, typecode):
+	left = numpy.frombuffer(left, NUMPY_DTYPES[left.typecode])
+	if isinstance(right, array.array):
+		right = numpy.frombuffer(right, NUMPY_DTYPES[right.typecode])
+	as_float = lambda value: value.astype('float64') if isinstance(value, numpy.ndarray) else float(value)
+
+	try:
+		if typecode == 'd' and op not in ARRAY_COMPARISONS:
+			left, right = as_float(left), as_float(right)
+		elif op in NUMPY_INT_BOUNDS:
+			if NUMPY_INT_BOUNDS[op](int_bound(left), int_bound(right)) > NUMPY_INT_LIMIT: return None
+		elif op is operator.pow:
+			with numpy.errstate(all='ignore'):
+				estimate = op(as_float(left), as_float(right))
+			if not (numpy.abs(estimate) < 2.0 ** 62).all(): return None
+
+		with numpy.errstate(all='raise'):
+			result = op(left, right)
+	except (FloatingPointError, OverflowError):
+		return None
+	return array.array(typecode, result.astype(NUMPY_DTYPES[typecode]).tobytes())
+
+# Maps the hash_key of each key to its (key, value) pair, in insertion order
+class Dict(Value):
+	__slots__ = ('entries',)
+
+	def __init__(self, entries):
+		self.entries = entries
+
+	def dived_by(self, other):
+		key = other.hash_key()
+		if key is None: return None, key_type_error()
+		entry = self.entries.get(key)
+		if entry is None: return None, OperandError('Key was not found in dict')
+		return entry[1], None
+
+	def length(self):
+		return len(self.entries)
+
+	def keys(self):
+		return List([key for key, _ in self.entries.values()])
+
+	def copy(self):
+		return Dict(dict(self.entries))
+
+	def is_true(self):
+		return len(self.entries) > 0
+
+	def __str__(self):
+		return f'{{{", ".join([f"{key!r}: {value!r}" for key, value in self.entries.values()])}}}'
+
+	def __repr__(self):
+		return str(self)
+
+def key_type_error():
+	return RunTimeError(None, None, 'Dict keys must be numbers or strings', None)
+
+def make_dict(pairs):
+	entries = {}
+	for key, value in pairs:
+		hash_key = key.hash_key()
+		if hash_key is None: return None, key_type_error()
+		entries[hash_key] = (key, value)
+	return Dict(entries), None
+
+class BaseFunction(Value):
+  __slots__ = ('name',)
+
+  def __init__(self, name):
+    super().__init__()
     self.name = name or "<anonymous>"
 
-  def generate_new_context(self):
-    new_context = Context(self.name, self.context, self.pos_start)
-    new_context.symbol_table = SymbolTable(new_context.parent.symbol_table)
+  def generate_new_context(self, context, entry_pos):
+    new_context = Context(self.name, context, entry_pos)
+    new_context.symbol_table = SymbolTable(context.symbol_table)
     return new_context
 
   def check_args(self, arg_names, args):
@@ -1568,16 +2428,16 @@ class BaseFunction(Value):
 
     if len(args) > len(arg_names):
       return res.failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         f"{len(args) - len(arg_names)} too many args passed into {self}",
-        self.context
+        None
       ))
     
     if len(args) < len(arg_names):
       return res.failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         f"{len(arg_names) - len(args)} too few args passed into {self}",
-        self.context
+        None
       ))
 
     return res.success(None)
@@ -1586,7 +2446,6 @@ class BaseFunction(Value):
     for i in range(len(args)):
       arg_name = arg_names[i]
       arg_value = args[i]
-      arg_value.set_context(exec_ctx)
       exec_ctx.symbol_table.set(arg_name, arg_value)
 
   def check_and_populate_args(self, arg_names, args, exec_ctx):
@@ -1597,42 +2456,191 @@ class BaseFunction(Value):
     return res.success(None)
 
 class Function(BaseFunction):
-	def __init__(self, name, body_node, arg_names,should_auto_return):
+	__slots__ = ('body_node', 'arg_names', 'should_auto_return', 'code', 'slot_count', 'scope')
+
+	def __init__(self, name, body_node, arg_names,should_auto_return, code=None, slot_count=0, scope=None):
 		super().__init__(name)
 		self.body_node = body_node
 		self.arg_names = arg_names
 		self.should_auto_return=should_auto_return
+		self.code = code
+		self.slot_count = slot_count
+		self.scope = scope
+
+	def generate_new_context(self, context, entry_pos):
+		new_context = Context(self.name, context, entry_pos)
+		new_context.symbol_table = self.scope.symbol_table
+		new_context.slots = [None] * self.slot_count
+		new_context.outer = self.scope
+		return new_context
+
+	def populate_args(self, arg_names, args, exec_ctx):
+		slots = exec_ctx.slots
+		for i in range(len(args)):
+			slots[i] = args[i]
+
+	def call(self, args, context, entry_pos):
+		if len(args) != len(self.arg_names):
+			raise ErrorSignal(self.check_args(self.arg_names, args).error)
+
+		# A tail call replaces the body being run, so a function recursing
+		# through tail calls loops here instead of nesting Python frames
+		function = self
+		while True:
+			exec_ctx = function.generate_new_context(context, entry_pos)
+			function.populate_args(function.arg_names, args, exec_ctx)
+
+			# brk/cont and errors are left to propagate, so a brk in a function
+			# still ends the caller's loop
+			try:
+				if not function.should_auto_return:
+					Interpreter().discard(function.body_node, exec_ctx)
+					return Number.null
+				value = Interpreter().visit(function.body_node, exec_ctx)
+			except ReturnSignal as signal:
+				value = signal.value
 
-	def execute(self, args):
+			if type(value) is not TailCall: return value
+			function, args = value.function, value.args
+
+	def execute(self, args, context, entry_pos):
 		res = RTResult()
-		interpreter = Interpreter()
-		exec_ctx = self.generate_new_context()
+		try:
+			return res.success(self.call(args, context, entry_pos))
+		except ErrorSignal as signal:
+			return res.failure(signal.error)
+		except ContinueSignal:
+			return res.success_cont()
+		except BreakSignal:
+			return res.success_brk()
 
-		res.register(self.check_and_populate_args(self.arg_names, args, exec_ctx))
-		if res.should_return() : return res
+	def copy(self):
+		return Function(self.name, self.body_node, self.arg_names,self.should_auto_return, self.code, self.slot_count, self.scope)
 
-		value = res.register(interpreter.visit(self.body_node, exec_ctx))
-		if res.should_return() and res.func_return_value== None: return res
+	def __repr__(self):
+		return f"<function {self.name}>"
 
-		ret_value= (value if self.should_auto_return else None) or res.func_return_value or Number.null
-		return res.success(ret_value)
+# Lists are mutable, so a memo only takes them as arguments when it was
+# made to hash them by value: the key is a snapshot of their elements
+def memo_key(value, by_value):
+	hash_key = value.hash_key()
+	if hash_key is not None: return hash_key
+	if by_value and isinstance(value, List):
+		keys = tuple(memo_key(element, True) for element in value.iter_elements())
+		if None not in keys: return ('list', keys)
+	return None
+
+def has_nested_containers(value):
+	if isinstance(value, List): elements = value.iter_elements()
+	elif isinstance(value, Dict): elements = (element for _, element in value.entries.values())
+	else: return False
+	return any(isinstance(element, (List, Dict)) for element in elements)
+
+# A copy of a cached result that shares nothing which can be changed in place.
+# A list only needs a new vector, unless it holds lists or dicts itself.
+def fresh_result(value, nested):
+	if not nested:
+		if isinstance(value, List): return List(value.share())
+		if isinstance(value, Dict): return value.copy()
+		return value
+	if isinstance(value, List):
+		return List([fresh_result(element, True) for element in value.iter_elements()])
+	if isinstance(value, Dict):
+		return Dict({hash_key: (key, fresh_result(element, True)) for hash_key, (key, element) in value.entries.items()})
+	return value
+
+class MemoCache:
+	__slots__ = ('entries', 'maxsize', 'by_value', 'hits', 'misses')
+
+	def __init__(self, maxsize, by_value):
+		self.entries = collections.OrderedDict()
+		self.maxsize = maxsize
+		self.by_value = by_value
+		self.hits = 0
+		self.misses = 0
+
+# Wraps a function and caches its results on the values of its arguments,
+# dropping the least recently used result once maxsize are stored
+class MemoFunction(BaseFunction):
+	__slots__ = ('function', 'cache')
+
+	def __init__(self, function, cache):
+		super().__init__(function.name)
+		self.function = function
+		self.cache = cache
+
+	def make_key(self, args, context):
+		cache = self.cache
+		key = tuple(memo_key(arg, cache.by_value) for arg in args)
+		if None not in key: return key, None
+		if cache.by_value:
+			message = f"Arguments of {self} must be numbers, strings or lists of them"
+		else:
+			message = f"Arguments of {self} must be numbers or strings (use memo_value to hash lists by value)"
+		return None, RunTimeError(None, None, message, context)
+
+	# Each call gets its own copy of a list or dict result, so changing it
+	# in place can't change what later calls return
+	def lookup(self, key):
+		cache = self.cache
+		entry = cache.entries.get(key)
+		if entry is None:
+			cache.misses += 1
+			return None
+		cache.hits += 1
+		cache.entries.move_to_end(key)
+		return fresh_result(*entry)
+
+	def store(self, key, value):
+		entries = self.cache.entries
+		entries[key] = entry = (value, has_nested_containers(value))
+		if len(entries) > self.cache.maxsize: entries.popitem(last=False)
+		return fresh_result(*entry)
+
+	def execute(self, args, context, entry_pos):
+		key, error = self.make_key(args, context)
+		if error: return RTResult().failure(error)
+		value = self.lookup(key)
+		if value is not None: return RTResult().success(value)
+
+		function = self.function
+		if isinstance(function, Function):
+			# Called directly so that brk and cont reach the caller's loop, as
+			# they do from the function itself
+			try:
+				value = function.call(args, context, entry_pos)
+			except ErrorSignal as signal:
+				return RTResult().failure(signal.error)
+		else:
+			res = function.execute(args, context, entry_pos)
+			if res.should_return(): return res
+			value = res.value
+		return RTResult().success(self.store(key, value))
+
+	def stats(self):
+		cache = self.cache
+		return make_dict([
+			(String('hits'), make_number(cache.hits)),
+			(String('misses'), make_number(cache.misses)),
+			(String('size'), make_number(len(cache.entries))),
+			(String('maxsize'), make_number(cache.maxsize)),
+		])[0]
 
 	def copy(self):
-		copy = Function(self.name, self.body_node, self.arg_names,self.should_auto_return)
-		copy.set_context(self.context)
-		copy.set_pos(self.pos_start, self.pos_end)
-		return copy
+		return MemoFunction(self.function, self.cache)
 
 	def __repr__(self):
-		return f"<function {self.name}>"
+		return f"<memo function {self.name}>"
 
 class BuiltInFunction(BaseFunction):
+  __slots__ = ()
+
   def __init__(self, name):
     super().__init__(name)
 
-  def execute(self, args):
+  def execute(self, args, context, entry_pos):
     res = RTResult()
-    exec_ctx = self.generate_new_context()
+    exec_ctx = self.generate_new_context(context, entry_pos)
 
     method_name = f'execute_{self.name}'
     method = getattr(self, method_name, self.no_visit_method)
@@ -1648,10 +2656,7 @@ class BuiltInFunction(BaseFunction):
     raise Exception(f'No execute_{self.name} method defined')
 
   def copy(self):
-    copy = BuiltInFunction(self.name)
-    copy.set_context(self.context)
-    copy.set_pos(self.pos_start, self.pos_end)
-    return copy
+    return BuiltInFunction(self.name)
 
   def __repr__(self):
     return f"<built-in function {self.name}>"
@@ -1680,7 +2685,7 @@ class BuiltInFunction(BaseFunction):
         break
       except ValueError:
         print(f"'{text}' must be an integer. Try again!")
-    return RTResult().success(Number(number))
+    return RTResult().success(make_number(number))
   execute_input_int.arg_names = []
 
   def execute_clrscr(self, exec_ctx):
@@ -1714,12 +2719,12 @@ class BuiltInFunction(BaseFunction):
 
     if not isinstance(list_, List):
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         "First argument must be list",
         exec_ctx
       ))
 
-    list_.elements.append(value)
+    list_.append(value)
     return RTResult().success(Number.null)
   execute_append.arg_names = ["list", "value"]
 
@@ -1729,23 +2734,23 @@ class BuiltInFunction(BaseFunction):
 
     if not isinstance(list_, List):
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         "First argument must be list",
         exec_ctx
       ))
 
     if not isinstance(index, Number):
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         "Second argument must be number",
         exec_ctx
       ))
 
     try:
-      element = list_.elements.pop(index.value)
+      element = list_.pop(index.value)
     except:
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         'Element at this index could not be removed from list because index is out of bounds',
         exec_ctx
       ))
@@ -1758,41 +2763,210 @@ class BuiltInFunction(BaseFunction):
 
     if not isinstance(listA, List):
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         "First argument must be list",
         exec_ctx
       ))
 
     if not isinstance(listB, List):
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         "Second argument must be list",
         exec_ctx
       ))
 
-    listA.elements.extend(listB.elements)
+    listA.extend(listB)
     return RTResult().success(Number.null)
   execute_ccat.arg_names = ["listA", "listB"]
 
   def execute_len(self, exec_ctx):
     list_ = exec_ctx.symbol_table.get("list")
 
-    if not isinstance(list_, List):
+    if not isinstance(list_, (List, NumArray, Dict, String)):
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         "Argument must be list",
         exec_ctx
       ))
 
-    return RTResult().success(Number(len(list_.elements)))
+    return RTResult().success(make_number(list_.length()))
   execute_len.arg_names = ["list"]
 
+  def execute_array(self, exec_ctx):
+    list_ = exec_ctx.symbol_table.get("list")
+
+    if not isinstance(list_, List):
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Argument must be list",
+        exec_ctx
+      ))
+
+    numbers = []
+    for element in list_.iter_elements():
+      if not isinstance(element, Number):
+        return RTResult().failure(RunTimeError(
+          None, None,
+          "List must contain only numbers",
+          exec_ctx
+        ))
+      numbers.append(element.value)
+
+    return RTResult().success(NumArray(make_array(numbers)))
+  execute_array.arg_names = ["list"]
+
+  def execute_to_list(self, exec_ctx):
+    array_ = exec_ctx.symbol_table.get("array")
+
+    if not isinstance(array_, NumArray):
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Argument must be array",
+        exec_ctx
+      ))
+
+    return RTResult().success(array_.to_list())
+  execute_to_list.arg_names = ["array"]
+
+  def execute_sum(self, exec_ctx):
+    array_ = exec_ctx.symbol_table.get("array")
+
+    if not isinstance(array_, NumArray):
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Argument must be array",
+        exec_ctx
+      ))
+
+    return RTResult().success(make_number(array_.total()))
+  execute_sum.arg_names = ["array"]
+
+  def execute_isarray(self, exec_ctx):
+    is_array = isinstance(exec_ctx.symbol_table.get("value"), NumArray)
+    return RTResult().success(Number.true if is_array else Number.false)
+  execute_isarray.arg_names = ["value"]
+
+  def dict_and_key(self, exec_ctx):
+    dict_ = exec_ctx.symbol_table.get("dict")
+    key = exec_ctx.symbol_table.get("key")
+
+    if not isinstance(dict_, Dict):
+      return None, None, RunTimeError(None, None, "First argument must be dict", exec_ctx)
+
+    hash_key = key.hash_key()
+    if hash_key is None:
+      return None, None, RunTimeError(None, None, "Dict keys must be numbers or strings", exec_ctx)
+
+    return dict_, hash_key, None
+
+  def execute_get(self, exec_ctx):
+    dict_, hash_key, error = self.dict_and_key(exec_ctx)
+    if error: return RTResult().failure(error)
+
+    entry = dict_.entries.get(hash_key)
+    if entry is None:
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Key was not found in dict",
+        exec_ctx
+      ))
+    return RTResult().success(entry[1])
+  execute_get.arg_names = ["dict", "key"]
+
+  def execute_set(self, exec_ctx):
+    dict_, hash_key, error = self.dict_and_key(exec_ctx)
+    if error: return RTResult().failure(error)
+
+    dict_.entries[hash_key] = (exec_ctx.symbol_table.get("key"), exec_ctx.symbol_table.get("value"))
+    return RTResult().success(Number.null)
+  execute_set.arg_names = ["dict", "key", "value"]
+
+  def execute_has(self, exec_ctx):
+    dict_, hash_key, error = self.dict_and_key(exec_ctx)
+    if error: return RTResult().failure(error)
+
+    return RTResult().success(Number.true if hash_key in dict_.entries else Number.false)
+  execute_has.arg_names = ["dict", "key"]
+
+  def execute_delete(self, exec_ctx):
+    dict_, hash_key, error = self.dict_and_key(exec_ctx)
+    if error: return RTResult().failure(error)
+
+    entry = dict_.entries.pop(hash_key, None)
+    if entry is None:
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Key was not found in dict",
+        exec_ctx
+      ))
+    return RTResult().success(entry[1])
+  execute_delete.arg_names = ["dict", "key"]
+
+  def execute_keys(self, exec_ctx):
+    dict_ = exec_ctx.symbol_table.get("dict")
+
+    if not isinstance(dict_, Dict):
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Argument must be dict",
+        exec_ctx
+      ))
+
+    return RTResult().success(dict_.keys())
+  execute_keys.arg_names = ["dict"]
+
+  def execute_isdict(self, exec_ctx):
+    is_dict = isinstance(exec_ctx.symbol_table.get("value"), Dict)
+    return RTResult().success(Number.true if is_dict else Number.false)
+  execute_isdict.arg_names = ["value"]
+
+  def make_memo(self, exec_ctx, by_value):
+    function = exec_ctx.symbol_table.get("function")
+    maxsize = exec_ctx.symbol_table.get("maxsize")
+
+    if not isinstance(function, BaseFunction):
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "First argument must be function",
+        exec_ctx
+      ))
+
+    if not isinstance(maxsize, Number) or type(maxsize.value) is not int or maxsize.value < 1:
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Second argument must be a whole number above 0",
+        exec_ctx
+      ))
+
+    return RTResult().success(MemoFunction(function, MemoCache(maxsize.value, by_value)))
+
+  def execute_memo(self, exec_ctx):
+    return self.make_memo(exec_ctx, False)
+  execute_memo.arg_names = ["function", "maxsize"]
+
+  def execute_memo_value(self, exec_ctx):
+    return self.make_memo(exec_ctx, True)
+  execute_memo_value.arg_names = ["function", "maxsize"]
+
+  def execute_memo_stats(self, exec_ctx):
+    function = exec_ctx.symbol_table.get("function")
+
+    if not isinstance(function, MemoFunction):
+      return RTResult().failure(RunTimeError(
+        None, None,
+        "Argument must be memo function",
+        exec_ctx
+      ))
+
+    return RTResult().success(function.stats())
+  execute_memo_stats.arg_names = ["function"]
+
   def execute_exec(self, exec_ctx):
     fn = exec_ctx.symbol_table.get("fn")
 
     if not isinstance(fn, String):
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         "Second argument must be string",
         exec_ctx
       ))
@@ -1800,20 +2974,22 @@ class BuiltInFunction(BaseFunction):
     fn = fn.value
 
     try:
-      with open(fn, "r") as f:
-        script = f.read()
+      node, code, error = compile_script(fn)
     except Exception as e:
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         f"Failed to load script \"{fn}\"\n" + str(e),
         exec_ctx
       ))
 
-    _, error = exec(fn, script)
+    # Run the script the same way as the program that called exec
+    root = exec_ctx
+    while root.parent: root = root.parent
+    if not error: _, error = run(node, code, root.mode)
     
     if error:
       return RTResult().failure(RunTimeError(
-        self.pos_start, self.pos_end,
+        None, None,
         f"Failed to finish executing script \"{fn}\"\n" +
         error.as_string(),
         exec_ctx
@@ -1836,6 +3012,24 @@ BuiltInFunction.pop         = BuiltInFunction("pop")
 BuiltInFunction.ccat        = BuiltInFunction("ccat")
 BuiltInFunction.len         = BuiltInFunction("len")
 BuiltInFunction.exec        = BuiltInFunction("exec")
+BuiltInFunction.array       = BuiltInFunction("array")
+BuiltInFunction.to_list     = BuiltInFunction("to_list")
+BuiltInFunction.sum         = BuiltInFunction("sum")
+BuiltInFunction.isarray     = BuiltInFunction("isarray")
+BuiltInFunction.get         = BuiltInFunction("get")
+BuiltInFunction.set         = BuiltInFunction("set")
+BuiltInFunction.has         = BuiltInFunction("has")
+BuiltInFunction.delete      = BuiltInFunction("delete")
+BuiltInFunction.keys        = BuiltInFunction("keys")
+BuiltInFunction.isdict      = BuiltInFunction("isdict")
+BuiltInFunction.memo        = BuiltInFunction("memo")
+BuiltInFunction.memo_value  = BuiltInFunction("memo_value")
+BuiltInFunction.memo_stats  = BuiltInFunction("memo_stats")
+
+# Built-ins that only read their arguments and don't run any Libra code
+PURE_BUILTINS = {name: getattr(BuiltInFunction, name) for name in (
+	'len', 'isnum', 'isstr', 'islist', 'isfun', 'isarray', 'isdict', 'get', 'has', 'sum',
+)}
 
 
 #######################################
@@ -1843,11 +3037,31 @@ BuiltInFunction.exec        = BuiltInFunction("exec")
 #######################################
 
 class Context:
+	# The exec mode the program runs in, set on the root context by run()
+	mode = 'vm'
+
 	def __init__(self, display_name, parent=None, parent_entry_pos=None):
 		self.display_name = display_name
 		self.parent = parent
 		self.parent_entry_pos = parent_entry_pos
 		self.symbol_table = None
+		self.slots = None
+		self.outer = None
+
+	def lookup(self, address, name):
+		for depth, slot in address:
+			scope = self
+			for _ in range(depth):
+				scope = scope.outer
+			value = scope.slots[slot]
+			if value is not None: return value
+		return self.symbol_table.get(name)
+
+	def assign(self, slot, name, value):
+		if slot is None:
+			self.symbol_table.set(name, value)
+		else:
+			self.slots[slot] = value
 
 #######################################
 # SYMBOL TABLE
@@ -1878,9 +3092,51 @@ class SymbolTable:
 
 class Interpreter:
 	def visit(self, node, context):
-		method_name = f'visit_{type(node).__name__}'
-		method = getattr(self, method_name, self.no_visit_method)
-		return method(node, context)
+		handler = self.handlers.get(type(node))
+		if handler is None: return self.no_visit_method(node, context)
+		return handler(self, node, context)
+
+	def discard(self, node, context):
+		# Like Compiler.compile_discarded: a statement list whose value is thrown away isn't built
+		if isinstance(node, ListNode):
+			for element_node in node.element_nodes:
+				self.discard(element_node, context)
+		elif is_constant(node):
+			pass
+		elif isinstance(node, FromNode):
+			self.visit_FromNode(node, context, False)
+		elif isinstance(node, UntilNode):
+			self.visit_UntilNode(node, context, False)
+		else:
+			self.visit(node, context)
+
+	def test(self, node, context, operand_of=None):
+		# Like Compiler.compile_jump: AND/OR in a condition become plain control
+		# flow and a comparison of two numbers is decided without a Number
+		if type(node) is BinOpNode:
+			op_index = node.op_index
+			decides = SHORT_CIRCUIT_OPS.get(op_index)
+			if decides is not None:
+				if self.test(node.left_node, context, node) == decides: return decides
+				return self.test(node.right_node, context, node)
+
+			compare = COMPARE_OPERATORS.get(op_index)
+			if compare:
+				left = self.visit(node.left_node, context)
+				right = self.visit(node.right_node, context)
+				if type(left) is Number and type(right) is Number:
+					return compare(left.value, right.value)
+
+				value, error = BINARY_OP_FUNCS[op_index](left, right)
+				if error: raise ErrorSignal(locate_error(error, node, context))
+				return self.truth(value, operand_of, context)
+		return self.truth(self.visit(node, context), operand_of, context)
+
+	def truth(self, value, operand_of, context):
+		if type(value) is Number: return bool(value.value)
+		# Only numbers can be AND/OR operands, as anded_by/ored_by would report
+		if operand_of: raise ErrorSignal(locate_error(value.illegal_operation(), operand_of, context))
+		return value.is_true()
 
 	def no_visit_method(self, node, context):
 		raise Exception(f'No visit_{type(node).__name__} method defined')
@@ -1888,232 +3144,1950 @@ class Interpreter:
 	###################################
 
 	def visit_NumberNode(self, node, context):
-		return RTResult().success(
-			Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return node.value
 
 	def visit_StringNode(self, node, context):
-		return RTResult().success(
-			String(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return node.value
 
 	def visit_ListNode(self, node, context):
-		res = RTResult()
-		elements = []
-		for element_node in node.element_nodes:
-			elements.append(res.register(self.visit(element_node, context)))
-			if res.should_return(): return res
-		return res.success(
-      List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-    )
+		elements = [self.visit(element_node, context) for element_node in node.element_nodes]
+		return List(elements)
+
+	def visit_DictNode(self, node, context):
+		entries = [(self.visit(key_node, context), self.visit(value_node, context)) for key_node, value_node in node.entry_nodes]
+		value, error = make_dict(entries)
+		if error: raise ErrorSignal(locate_error(error, node, context))
+		return value
 
 	def visit_VarAccessNode(self,node,context):
-		res=RTResult()
 		var_name=node.var_name_tok.value
-		value=context.symbol_table.get(var_name)
+		value=context.lookup(node.address, var_name)
 		if not value:
-			return res.failure(RunTimeError(node.pos_start,node.pos_end,f"'{var_name}' is not defined",context))
-		value=value.copy().set_pos(node.pos_start,node.pos_end).set_context(context)
-		return res.success(value)
+			raise ErrorSignal(RunTimeError(node.pos_start,node.pos_end,f"'{var_name}' is not defined",context))
+		return value
 
 	def visit_VarAssignNode(self,node,context):
-		res=RTResult()
-		var_name=node.var_name_tok.value
-		value=res.register(self.visit(node.value_node,context))
-		if res.should_return():  return res
-		context.symbol_table.set(var_name,value)
-		return res.success(value)
+		value=self.visit(node.value_node,context)
+		context.assign(node.slot, node.var_name_tok.value, value)
+		return value
 
 	def visit_BinOpNode(self, node, context):
-		res = RTResult()
-		left = res.register(self.visit(node.left_node, context))
-		if res.should_return(): return res
-		right = res.register(self.visit(node.right_node, context))
-		if res.should_return(): return res
-
-		if node.op_tok.type == TOK_PLUS:
-			result, error = left.added_to(right)
-		elif node.op_tok.type == TOK_MINUS:
-			result, error = left.subbed_by(right)
-		elif node.op_tok.type == TOK_MUL:
-			result, error = left.multed_by(right)
-		elif node.op_tok.type == TOK_DIV:
-			result, error = left.dived_by(right)
-		elif node.op_tok.type == TOK_MOD:
-			result, error = left.moded_by(right)
-		elif node.op_tok.type == TOK_POW:
-			result, error = left.powed_by(right)
-		elif node.op_tok.type == TOK_EE:
-			result, error = left.get_comp_eq(right)
-		elif node.op_tok.type == TOK_NE:
-			result, error = left.get_comp_ne(right)
-		elif node.op_tok.type == TOK_LT:
-			result, error = left.get_comp_lt(right)
-		elif node.op_tok.type == TOK_GT:
-			result, error = left.get_comp_gt(right)
-		elif node.op_tok.type == TOK_LTE:
-			result, error = left.get_comp_lte(right)
-		elif node.op_tok.type == TOK_GTE:
-			result, error = left.get_comp_gte(right)
-		elif node.op_tok.matches(TOK_KEYWORD, 'AND'):
-			result, error = left.anded_by(right)
-		elif node.op_tok.matches(TOK_KEYWORD, 'OR'):
-			result, error = left.ored_by(right)
-
-		if error:
-			return res.failure(error)
-		else:
-			return res.success(result.set_pos(node.pos_start, node.pos_end))
+		left = self.visit(node.left_node, context)
+		decides = SHORT_CIRCUIT_OPS.get(node.op_index)
+		if decides is not None and type(left) is Number and bool(left.value) is decides:
+			return left
+		right = self.visit(node.right_node, context)
+
+		result, error = BINARY_OP_FUNCS[node.op_index](left, right)
+		if error: raise ErrorSignal(locate_error(error, node, context))
+		return result
 
 	def visit_UnaryOpNode(self, node, context):
-		res = RTResult()
-		number = res.register(self.visit(node.node, context))
-		if res.should_return(): return res
+		number = self.visit(node.node, context)
 
 		error = None
 
 		if node.op_tok.type == TOK_MINUS:
-			number, error = number.multed_by(Number(-1))
+			number, error = number.multed_by(make_number(-1))
 
 		elif node.op_tok.matches(TOK_KEYWORD, 'NOT'):	
 			number, error = number.notted()
 
-		if error:
-			return res.failure(error)
-		else:
-			return res.success(number.set_pos(node.pos_start, node.pos_end))
+		if error: raise ErrorSignal(locate_error(error, node, context))
+		return number
 
 	def visit_IfNode(self, node, context):
-		res = RTResult()
-
 		for condition, expr, should_return_null in node.cases:
-			condition_value = res.register(self.visit(condition, context))
-			if res.should_return(): return res
-
-			if condition_value.is_true():
-				expr_value = res.register(self.visit(expr, context))
-				if res.should_return(): return res
-				return res.success(Number.null if should_return_null else expr_value)
+			if self.test(condition, context):
+				expr_value = self.visit(expr, context)
+				return Number.null if should_return_null else expr_value
 
 		if node.else_case:
 			expr,should_return_null=node.else_case
-			else_value = res.register(self.visit(expr, context))
-			if res.should_return(): return res
-			return res.success(Number.null if should_return_null else else_value)
+			else_value = self.visit(expr, context)
+			return Number.null if should_return_null else else_value
 
-		return res.success(Number.null)
+		return Number.null
 
-	def visit_FromNode(self, node, context):
-		res = RTResult()
-		elements=[]
-		start_value = res.register(self.visit(node.start_value_node, context))
-		if res.should_return(): return res
-
-		end_value = res.register(self.visit(node.end_value_node, context))
-		if res.should_return(): return res
+	def visit_FromNode(self, node, context, collect=None):
+		start_value = self.visit(node.start_value_node, context)
+		end_value = self.visit(node.end_value_node, context)
 
 		if node.step_value_node:
-			step_value = res.register(self.visit(node.step_value_node, context))
-			if res.should_return(): return res
+			step_value = self.visit(node.step_value_node, context)
 		else:
-			step_value = Number(1)
+			step_value = Number.true
 
-		i = start_value.value
+		if collect is None: collect = not node.should_return_null
+		if collect and node.lazy:
+			return run_lazy_loop(node, start_value.value, end_value.value, step_value.value, context)
 
-		if step_value.value >= 0:
-			condition = lambda: i < end_value.value
-		else:
-			condition = lambda: i > end_value.value
-		
-		while condition():
-			context.symbol_table.set(node.var_name_tok.value, Number(i))
-			i += step_value.value
+		if node.hoisted: enter_hoisted(node, context)
+		run_body = self.visit if collect else self.discard
+		body_node, elements = node.body_node, []
+		slot, var_name = node.var_slot, node.var_name_tok.value
 
-			value =res.register(self.visit(node.body_node, context))
-			if res.should_return() and res.loop_should_continue==False and res.loop_should_break==False: return res
-			if res.loop_should_continue:
+		for value in number_range(start_value.value, end_value.value, step_value.value):
+			context.assign(slot, var_name, value)
+
+			try:
+				value = run_body(body_node, context)
+			except ContinueSignal:
 				continue
-      
-			if res.loop_should_break:
+			except BreakSignal:
 				break
 
-			elements.append(value)
+			if collect: elements.append(value)
 
-		return res.success(
-			Number.null if node.should_return_null else
-			List(elements).set_context(context).set_pos(node.pos_start,node.pos_end))
+		return List(elements) if collect else Number.null
 
-	def visit_UntilNode(self, node, context):
-		res = RTResult()
+	def visit_UntilNode(self, node, context, collect=None):
+		if collect is None: collect = not node.should_return_null
+		if node.hoisted: enter_hoisted(node, context)
+		run_body = self.visit if collect else self.discard
 		elements=[]
 
 		while True:
-			condition = res.register(self.visit(node.condition_node, context))
-			if res.should_return(): return res
-
-			if not condition.is_true(): break
+			if not self.test(node.condition_node, context): break
 
-			value=res.register(self.visit(node.body_node, context))
-			if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False: return res
-
-			if res.loop_should_continue:
+			try:
+				value = run_body(node.body_node, context)
+			except ContinueSignal:
 				continue
-      
-			if res.loop_should_break:
+			except BreakSignal:
 				break
 
-			elements.append(value)
+			if collect: elements.append(value)
 
-		return res.success(
-			Number.null if node.should_return_null else
-			List(elements).set_context(context).set_pos(node.pos_start,node.pos_end))
+		return List(elements) if collect else Number.null
 
-	def visit_FuncDefNode(self, node, context):
-		res = RTResult()
+	def visit_HoistedNode(self, node, context):
+		if node.value is not None: return node.value
+		value = self.visit(node.node, context)
+		keep_hoisted(node, value)
+		return value
 
+	def visit_FuncDefNode(self, node, context):
 		func_name = node.var_name_tok.value if node.var_name_tok else None
 		body_node = node.body_node
 		arg_names = [arg_name.value for arg_name in node.arg_name_toks]
-		func_value = Function(func_name, body_node, arg_names, node.should_auto_return).set_context(context).set_pos(node.pos_start, node.pos_end)
+		func_value = Function(
+			func_name, body_node, arg_names, node.should_auto_return,
+			slot_count=len(node.slot_names), scope=context
+		)
 		
 		if node.var_name_tok:
-			context.symbol_table.set(func_name, func_value)
+			context.assign(node.name_slot, func_name, func_value)
 
-		return res.success(func_value)
+		return func_value
 
 	def visit_CallNode(self, node, context):
-		res = RTResult()
-		args = []
-
-		value_to_call = res.register(self.visit(node.node_to_call, context))
-		if res.should_return(): return res
-		value_to_call = value_to_call.copy().set_pos(node.pos_start, node.pos_end)
-
-		for arg_node in node.arg_nodes:
-			args.append(res.register(self.visit(arg_node, context)))
-			if res.should_return(): return res
+		value_to_call = self.visit(node.node_to_call, context)
+		args = [self.visit(arg_node, context) for arg_node in node.arg_nodes]
+
+		if isinstance(value_to_call, Function):
+			if node.tail:
+				if len(args) != len(value_to_call.arg_names):
+					error = value_to_call.check_args(value_to_call.arg_names, args).error
+					raise ErrorSignal(locate_error(error, node, context))
+				return TailCall(value_to_call, args)
+			try:
+				return value_to_call.call(args, context, node.pos_start)
+			except ErrorSignal as signal:
+				locate_error(signal.error, node, context)
+				raise
 
-		return_value = res.register(value_to_call.execute(args))
-		if res.should_return(): return res
-		return_value=return_value.copy().set_pos(node.pos_start,node.pos_end).set_context(context)
-		return res.success(return_value)
+		res = value_to_call.execute(args, context, node.pos_start)
+		if res.error: raise ErrorSignal(locate_error(res.error, node, context))
+		return res.value
 
 	def visit_RetNode(self, node, context):
-			res = RTResult()
-
 			if node.node_to_return:
-				value = res.register(self.visit(node.node_to_return, context))
-				if res.should_return(): return res
+				value = self.visit(node.node_to_return, context)
 			else:
 				value = Number.null
     
-			return res.success_ret(value)
+			raise ReturnSignal(value)
 
 	def visit_ContNode(self, node, context):
-			return RTResult().success_cont()
+			raise ContinueSignal()
 
 	def visit_BrkNode(self, node, context):
-			return RTResult().success_brk()
+			raise BreakSignal()
+
+Interpreter.handlers = node_handlers(Interpreter, 'visit_')
+
+#######################################
+# BYTECODE
+#######################################
+
+OP_LOAD_CONST        = 0
+OP_LOAD_NAME         = 1
+OP_STORE_NAME        = 2
+OP_POP               = 3
+OP_BINARY            = 4
+OP_NEGATE            = 5
+OP_NOT               = 6
+OP_POSITIVE          = 7
+OP_JUMP              = 8
+OP_POP_JUMP_IF_FALSE = 9
+OP_BUILD_LIST        = 10
+OP_LOAD_NULL         = 11
+OP_NEW_ACC           = 12
+OP_LIST_APPEND       = 13
+OP_FINISH_ACC        = 14
+OP_FOR_PREP          = 15
+OP_FOR_NEXT_NAME     = 16
+OP_SETUP_LOOP        = 17
+OP_POP_BLOCK         = 18
+OP_BREAK             = 19
+OP_CONTINUE          = 20
+OP_MAKE_FUNCTION     = 21
+OP_CALL              = 22
+OP_RET               = 23
+OP_RETURN_VALUE      = 24
+OP_LOAD_FAST         = 25
+OP_STORE_FAST        = 26
+OP_LOAD_SCOPED       = 27
+OP_FOR_NEXT_FAST     = 28
+OP_LAZY_LOOP         = 29
+OP_BUILD_DICT        = 30
+OP_TAIL_CALL         = 31
+OP_AND_JUMP          = 32
+OP_OR_JUMP           = 33
+OP_POP_JUMP_IF_TRUE  = 34
+OP_COMPARE_JUMP_IF_FALSE = 35
+OP_COMPARE_JUMP_IF_TRUE  = 36
+OP_RESET_HOISTED     = 37
+OP_LOAD_HOISTED      = 38
+OP_STORE_HOISTED     = 39
+OP_BINARY_ADAPTIVE   = 40
+OP_BINARY_NUMBER     = 41
+OP_CALL_ADAPTIVE     = 42
+OP_CALL_FUNCTION     = 43
+
+OP_NAMES = {value: name[3:] for name, value in list(globals().items()) if name.startswith('OP_')}
+
+class CodeObject:
+	def __init__(self, name, arg_names=None, should_auto_return=False, body_node=None, slot_names=None):
+		self.name = name
+		self.arg_names = arg_names or []
+		self.should_auto_return = should_auto_return
+		self.body_node = body_node
+		self.slot_names = slot_names or []
+		self.code = []
+		self.spans = []
+		self.consts = []
+		self.names = []
+		self.scoped = []
+		# Per-instruction state for adaptive mode (see quicken)
+		self.counters = None
+		self.callees = None
+
+	def emit(self, op, arg=0, node=None):
+		self.code.append(op)
+		self.code.append(arg)
+		self.spans.append(node)
+		return len(self.code) - 2
+
+	def patch(self, at, target=None):
+		self.code[at + 1] = len(self.code) if target is None else target
+
+	def add_const(self, value):
+		self.consts.append(value)
+		return len(self.consts) - 1
+
+	def add_name(self, name):
+		if name not in self.names:
+			self.names.append(name)
+		return self.names.index(name)
+
+	def dump(self):
+		lines = [f'<code {self.name}>']
+		for pc in range(0, len(self.code), 2):
+			op, arg = self.code[pc], self.code[pc + 1]
+			lines.append(f'{pc:>5} {OP_NAMES[op]:<18} {arg}')
+		for const in self.consts:
+			if isinstance(const, CodeObject):
+				lines.append(const.dump())
+		return '\n'.join(lines)
+
+#######################################
+# COMPILER
+#######################################
+
+class Compiler:
+	def compile_program(self, node):
+		self.code = CodeObject('<program>')
+		self.compile(node)
+		self.code.emit(OP_RETURN_VALUE)
+		return self.code
+
+	def compile(self, node):
+		handler = self.handlers.get(type(node))
+		if handler is None: return self.no_compile_method(node)
+		handler(self, node)
+
+	def compile_discarded(self, node):
+		# Bodies whose value is thrown away don't need their statement list built
+		# and loops whose value is thrown away don't need their results collected
+		if isinstance(node, ListNode):
+			for element_node in node.element_nodes:
+				self.compile_discarded(element_node)
+		elif is_constant(node):
+			pass
+		elif isinstance(node, FromNode):
+			self.compile_FromNode(node, False)
+			self.code.emit(OP_POP)
+		elif isinstance(node, UntilNode):
+			self.compile_UntilNode(node, False)
+			self.code.emit(OP_POP)
+		else:
+			self.compile(node)
+			self.code.emit(OP_POP)
+
+	def no_compile_method(self, node):
+		raise Exception(f'No compile_{type(node).__name__} method defined')
+
+	###################################
+
+	def compile_NumberNode(self, node):
+		self.code.emit(OP_LOAD_CONST, self.code.add_const(node.value), node)
+
+	def compile_StringNode(self, node):
+		self.code.emit(OP_LOAD_CONST, self.code.add_const(node.value), node)
+
+	def compile_ListNode(self, node):
+		for element_node in node.element_nodes:
+			self.compile(element_node)
+		self.code.emit(OP_BUILD_LIST, len(node.element_nodes), node)
+
+	def compile_DictNode(self, node):
+		for key_node, value_node in node.entry_nodes:
+			self.compile(key_node)
+			self.compile(value_node)
+		self.code.emit(OP_BUILD_DICT, len(node.entry_nodes), node)
+
+	def compile_VarAccessNode(self, node):
+		name = node.var_name_tok.value
+		if not node.address:
+			self.code.emit(OP_LOAD_NAME, self.code.add_name(name), node)
+		elif len(node.address) == 1 and node.address[0][0] == 0:
+			self.code.emit(OP_LOAD_FAST, node.address[0][1], node)
+		else:
+			self.code.scoped.append((node.address, name))
+			self.code.emit(OP_LOAD_SCOPED, len(self.code.scoped) - 1, node)
+
+	def compile_VarAssignNode(self, node):
+		self.compile(node.value_node)
+		self.compile_store(node.slot, node.var_name_tok.value, node)
+
+	def compile_store(self, slot, name, node):
+		if slot is None:
+			self.code.emit(OP_STORE_NAME, self.code.add_name(name), node)
+		else:
+			self.code.emit(OP_STORE_FAST, slot, node)
+
+	def compile_BinOpNode(self, node):
+		self.compile(node.left_node)
+		decides = SHORT_CIRCUIT_OPS.get(node.op_index)
+		if decides is not None:
+			skip = self.code.emit(OP_OR_JUMP if decides else OP_AND_JUMP, 0, node)
+		self.compile(node.right_node)
+		self.code.emit(OP_BINARY, node.op_index, node)
+		if decides is not None:
+			self.code.patch(skip)
+
+	# Emits a test of condition that jumps when its truth is when and falls
+	# through otherwise, and returns the jumps to patch. AND/OR become jumps
+	# between their operands, and a comparison compares and branches in one
+	# step, falling into a plain jump only when its operands aren't numbers.
+	def compile_jump(self, condition, when, operand_of=None):
+		if type(condition) is BinOpNode:
+			decides = SHORT_CIRCUIT_OPS.get(condition.op_index)
+			if decides is not None:
+				if decides == when:
+					return self.compile_jump(condition.left_node, when, condition) + self.compile_jump(condition.right_node, when, condition)
+				skips = self.compile_jump(condition.left_node, decides, condition)
+				jumps = self.compile_jump(condition.right_node, when, condition)
+				for skip in skips:
+					self.code.patch(skip)
+				return jumps
+
+			if condition.op_index in COMPARE_OPERATORS:
+				self.compile(condition.left_node)
+				self.compile(condition.right_node)
+				compare_jump = self.code.emit(OP_COMPARE_JUMP_IF_TRUE if when else OP_COMPARE_JUMP_IF_FALSE, 0, condition)
+				return [compare_jump, self.emit_pop_jump(when, operand_of or condition)]
+
+		self.compile(condition)
+		return [self.emit_pop_jump(when, operand_of or condition)]
+
+	def emit_pop_jump(self, when, node):
+		# The VM reports a non-number popped here if node is an AND/OR
+		return self.code.emit(OP_POP_JUMP_IF_TRUE if when else OP_POP_JUMP_IF_FALSE, 0, node)
+
+	def compile_UnaryOpNode(self, node):
+		self.compile(node.node)
+		if node.op_tok.type == TOK_MINUS:
+			self.code.emit(OP_NEGATE, 0, node)
+		elif node.op_tok.matches(TOK_KEYWORD, 'NOT'):
+			self.code.emit(OP_NOT, 0, node)
+		else:
+			self.code.emit(OP_POSITIVE, 0, node)
+
+	def compile_IfNode(self, node):
+		end_jumps = []
+
+		for condition, expr, should_return_null in node.cases:
+			next_case = self.compile_jump(condition, False)
+			self.compile_case(expr, should_return_null)
+			end_jumps.append(self.code.emit(OP_JUMP))
+			for jump in next_case:
+				self.code.patch(jump)
+
+		if node.else_case:
+			expr, should_return_null = node.else_case
+			self.compile_case(expr, should_return_null)
+		else:
+			self.code.emit(OP_LOAD_NULL)
+
+		for jump in end_jumps:
+			self.code.patch(jump)
+
+	def compile_case(self, expr, should_return_null):
+		if should_return_null:
+			self.compile_discarded(expr)
+			self.code.emit(OP_LOAD_NULL)
+		else:
+			self.compile(expr)
+
+	def compile_FromNode(self, node, collect=None):
+		if collect is None: collect = not node.should_return_null
+		lazy = collect and node.lazy
+		if collect and not lazy: self.code.emit(OP_NEW_ACC)
+
+		self.compile(node.start_value_node)
+		self.compile(node.end_value_node)
+		if node.step_value_node:
+			self.compile(node.step_value_node)
+
+		if lazy:
+			self.code.emit(OP_LAZY_LOOP, 1 if node.step_value_node else 0, node)
+			return
+
+		self.code.emit(OP_FOR_PREP, 1 if node.step_value_node else 0, node)
+		if node.hoisted: self.code.emit(OP_RESET_HOISTED, 0, node)
+
+		setup = self.code.emit(OP_SETUP_LOOP)
+		loop_start = len(self.code.code)
+		# FOR_NEXT stores the loop variable itself and exits to the loop block's target
+		if node.var_slot is None:
+			self.code.emit(OP_FOR_NEXT_NAME, self.code.add_name(node.var_name_tok.value), node)
+		else:
+			self.code.emit(OP_FOR_NEXT_FAST, node.var_slot, node)
+		self.compile_loop_body(node.body_node, collect, 2)
+		self.code.emit(OP_JUMP, loop_start)
+
+		self.code.patch(setup)
+		self.code.emit(OP_POP_BLOCK)
+		self.code.emit(OP_POP)
+		self.finish_loop(node, collect)
+
+	def compile_UntilNode(self, node, collect=None):
+		if collect is None: collect = not node.should_return_null
+		if collect: self.code.emit(OP_NEW_ACC)
+		if node.hoisted: self.code.emit(OP_RESET_HOISTED, 0, node)
+
+		setup = self.code.emit(OP_SETUP_LOOP)
+		loop_start = len(self.code.code)
+		exit_jumps = self.compile_jump(node.condition_node, False)
+		self.compile_loop_body(node.body_node, collect, 1)
+		self.code.emit(OP_JUMP, loop_start)
+
+		self.code.patch(setup)
+		for jump in exit_jumps:
+			self.code.patch(jump)
+		self.code.emit(OP_POP_BLOCK)
+		self.finish_loop(node, collect)
+
+	def compile_loop_body(self, body_node, collect, acc_depth):
+		if collect:
+			self.compile(body_node)
+			self.code.emit(OP_LIST_APPEND, acc_depth)
+		else:
+			self.compile_discarded(body_node)
+
+	def finish_loop(self, node, collect):
+		if collect:
+			self.code.emit(OP_FINISH_ACC, 0, node)
+		else:
+			self.code.emit(OP_LOAD_NULL)
+
+	def compile_HoistedNode(self, node):
+		# LOAD_HOISTED jumps over the expression once it has a value
+		load = self.code.emit(OP_LOAD_HOISTED, 0, node)
+		self.compile(node.node)
+		self.code.emit(OP_STORE_HOISTED, 0, node)
+		self.code.patch(load)
+
+	def compile_FuncDefNode(self, node):
+		func_name = node.var_name_tok.value if node.var_name_tok else None
+		arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+		func_code = CodeObject(func_name, arg_names, node.should_auto_return, node.body_node, node.slot_names)
+
+		outer_code = self.code
+		self.code = func_code
+		if node.should_auto_return:
+			self.compile(node.body_node)
+		else:
+			self.compile_discarded(node.body_node)
+			self.code.emit(OP_LOAD_NULL)
+		self.code.emit(OP_RETURN_VALUE)
+		self.code = outer_code
+
+		self.code.emit(OP_MAKE_FUNCTION, self.code.add_const(func_code), node)
+		if func_name:
+			self.compile_store(node.name_slot, func_name, node)
+
+	def compile_CallNode(self, node):
+		self.compile(node.node_to_call)
+		for arg_node in node.arg_nodes:
+			self.compile(arg_node)
+		self.code.emit(OP_TAIL_CALL if node.tail else OP_CALL, len(node.arg_nodes), node)
+
+	def compile_RetNode(self, node):
+		if node.node_to_return:
+			self.compile(node.node_to_return)
+		else:
+			self.code.emit(OP_LOAD_NULL)
+		self.code.emit(OP_RET, 0, node)
+
+	def compile_ContNode(self, node):
+		self.code.emit(OP_CONTINUE, 0, node)
+		self.code.emit(OP_LOAD_NULL)
+
+	def compile_BrkNode(self, node):
+		self.code.emit(OP_BREAK, 0, node)
+		self.code.emit(OP_LOAD_NULL)
+
+Compiler.handlers = node_handlers(Compiler, 'compile_')
+
+#######################################
+# ADAPTIVE SPECIALIZATION
+#######################################
+
+# In adaptive mode BINARY and CALL start out as adaptive ops that watch
+# what they are given. A site that gets two numbers (or the same function
+# with the right number of args) ADAPTIVE_WARMUP times in a row is
+# rewritten in place into a specialized op that only checks a guard. When
+# the guard fails it goes back to the adaptive op, which waits
+# ADAPTIVE_BACKOFF more runs before it tries again.
+ADAPTIVE_WARMUP = 8
+ADAPTIVE_BACKOFF = 64
+
+# What the specialized op computes for two numbers, as Number's methods would
+NUMBER_OPERATORS = dict(COMPARE_OPERATORS)
+NUMBER_OPERATORS.update({BINARY_OP_INDEX[key]: func for key, func in (
+	(TOK_PLUS,  operator.add),
+	(TOK_MINUS, operator.sub),
+	(TOK_MUL,   operator.mul),
+)})
+
+class AdaptiveStats:
+	__slots__ = ('specializations', 'deoptimizations')
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.specializations = {'binary': 0, 'call': 0}
+		self.deoptimizations = {'binary': 0, 'call': 0}
+
+	def __repr__(self):
+		return f'<adaptive specializations={self.specializations} deoptimizations={self.deoptimizations}>'
+
+adaptive_stats = AdaptiveStats()
+
+def quicken(code):
+	if code.counters is not None: return
+	code.counters = [0] * len(code.spans)
+	code.callees = [None] * len(code.spans)
+
+	ops = code.code
+	for at in range(0, len(ops), 2):
+		if ops[at] == OP_BINARY and ops[at + 1] in NUMBER_OPERATORS:
+			ops[at] = OP_BINARY_ADAPTIVE
+		elif ops[at] == OP_CALL:
+			ops[at] = OP_CALL_ADAPTIVE
+
+	for const in code.consts:
+		if isinstance(const, CodeObject): quicken(const)
+
+def specialize(code, site, op, kind):
+	code.code[site << 1] = op
+	code.counters[site] = 0
+	adaptive_stats.specializations[kind] += 1
+
+def deoptimize(code, site, op, kind):
+	code.code[site << 1] = op
+	code.counters[site] = -ADAPTIVE_BACKOFF
+	adaptive_stats.deoptimizations[kind] += 1
+
+def observe_binary(code, site, left, right):
+	counters = code.counters
+	if type(left) is Number and type(right) is Number:
+		counters[site] += 1
+		if counters[site] >= ADAPTIVE_WARMUP: specialize(code, site, OP_BINARY_NUMBER, 'binary')
+	elif counters[site] > 0:
+		counters[site] = 0
+
+def observe_call(code, site, value_to_call, arg_count):
+	counters = code.counters
+	if type(value_to_call) is Function and value_to_call.code and len(value_to_call.arg_names) == arg_count:
+		if code.callees[site] is not value_to_call.code:
+			code.callees[site] = value_to_call.code
+			counters[site] = min(counters[site], 0)
+		counters[site] += 1
+		if counters[site] >= ADAPTIVE_WARMUP: specialize(code, site, OP_CALL_FUNCTION, 'call')
+	elif counters[site] > 0:
+		counters[site] = 0
+
+#######################################
+# VIRTUAL MACHINE
+#######################################
+
+class Frame:
+	def __init__(self, code, context):
+		self.code = code
+		self.context = context
+		self.pc = 0
+		self.stack = []
+		self.blocks = []
+		# (memo function, key) when the frame runs a memoized call that missed
+		self.memo = None
+
+class VM:
+	def run(self, code, context):
+		frames = [Frame(code, context)]
+		frame = frames[-1]
+		code, consts, names, spans = frame.code.code, frame.code.consts, frame.code.names, frame.code.spans
+		stack, ctx, pc = frame.stack, context, 0
+
+		while True:
+			op = code[pc]
+			arg = code[pc + 1]
+			pc += 2
+
+			if op == OP_LOAD_NAME:
+				name = names[arg]
+				value = ctx.symbol_table.get(name)
+				if not value:
+					return None, self.undefined(name, spans[(pc >> 1) - 1], ctx)
+				stack.append(value)
+
+			elif op == OP_LOAD_FAST:
+				value = ctx.slots[arg]
+				if value is None:
+					name = frame.code.slot_names[arg]
+					value = ctx.symbol_table.get(name)
+					if not value:
+						return None, self.undefined(name, spans[(pc >> 1) - 1], ctx)
+				stack.append(value)
+
+			elif op == OP_LOAD_CONST:
+				stack.append(consts[arg])
+
+			elif op == OP_BINARY:
+				right = stack.pop()
+				result, error = BINARY_OP_FUNCS[arg](stack[-1], right)
+				if error: return None, locate_error(error, spans[(pc >> 1) - 1], ctx)
+				stack[-1] = result
+
+			elif op == OP_BINARY_NUMBER:
+				left, right = stack[-2], stack[-1]
+				if type(left) is Number and type(right) is Number:
+					stack.pop()
+					stack[-1] = make_number(NUMBER_OPERATORS[arg](left.value, right.value))
+				else:
+					# Run the instruction again as the adaptive op
+					deoptimize(frame.code, (pc >> 1) - 1, OP_BINARY_ADAPTIVE, 'binary')
+					pc -= 2
+
+			elif op == OP_BINARY_ADAPTIVE:
+				right = stack.pop()
+				left = stack[-1]
+				observe_binary(frame.code, (pc >> 1) - 1, left, right)
+				result, error = BINARY_OP_FUNCS[arg](left, right)
+				if error: return None, locate_error(error, spans[(pc >> 1) - 1], ctx)
+				stack[-1] = result
+
+			elif op == OP_STORE_FAST:
+				ctx.slots[arg] = stack[-1]
+
+			elif op == OP_STORE_NAME:
+				ctx.symbol_table.set(names[arg], stack[-1])
+
+			elif op == OP_POP:
+				stack.pop()
+
+			elif op == OP_COMPARE_JUMP_IF_FALSE or op == OP_COMPARE_JUMP_IF_TRUE:
+				right = stack.pop()
+				left = stack[-1]
+				compare_node = spans[(pc >> 1) - 1]
+				if type(left) is Number and type(right) is Number:
+					stack.pop()
+					if COMPARE_OPERATORS[compare_node.op_index](left.value, right.value) == (op == OP_COMPARE_JUMP_IF_TRUE):
+						pc = arg
+					else:
+						pc += 2
+				else:
+					# Leave the result to the POP_JUMP that follows
+					result, error = BINARY_OP_FUNCS[compare_node.op_index](left, right)
+					if error: return None, locate_error(error, compare_node, ctx)
+					stack[-1] = result
+
+			elif op == OP_POP_JUMP_IF_FALSE or op == OP_POP_JUMP_IF_TRUE:
+				value = stack.pop()
+				if type(value) is Number:
+					truth = bool(value.value)
+				else:
+					test_node = spans[(pc >> 1) - 1]
+					# Only numbers can be AND/OR operands, as anded_by/ored_by would report
+					if type(test_node) is BinOpNode and test_node.op_index in SHORT_CIRCUIT_OPS:
+						return None, locate_error(value.illegal_operation(), test_node, ctx)
+					truth = value.is_true()
+				if truth == (op == OP_POP_JUMP_IF_TRUE):
+					pc = arg
+
+			elif op == OP_JUMP:
+				pc = arg
+
+			elif op == OP_FOR_NEXT_FAST:
+				value = next(stack[-1], None)
+				if value is None:
+					pc = frame.blocks[-1][0]
+				else:
+					ctx.slots[arg] = value
+
+			elif op == OP_FOR_NEXT_NAME:
+				value = next(stack[-1], None)
+				if value is None:
+					pc = frame.blocks[-1][0]
+				else:
+					ctx.symbol_table.set(names[arg], value)
+
+			elif op == OP_LIST_APPEND:
+				value = stack.pop()
+				stack[-arg].append(value)
+
+			# Both leave the left operand on the stack: as the result when it
+			# decides the AND/OR, as the left operand of OP_BINARY otherwise
+			elif op == OP_AND_JUMP:
+				value = stack[-1]
+				if type(value) is Number and not value.value:
+					pc = arg
+
+			elif op == OP_OR_JUMP:
+				value = stack[-1]
+				if type(value) is Number and value.value:
+					pc = arg
+
+			elif op == OP_CALL_FUNCTION:
+				value_to_call = stack[-1 - arg]
+				if type(value_to_call) is Function and value_to_call.code is frame.code.callees[(pc >> 1) - 1]:
+					# The site was specialized for this code, so the arg count is right
+					exec_ctx = value_to_call.generate_new_context(ctx, spans[(pc >> 1) - 1].pos_start)
+					exec_ctx.slots[:arg] = stack[len(stack) - arg:]
+					del stack[len(stack) - arg - 1:]
+
+					frame.pc = pc
+					frame = Frame(value_to_call.code, exec_ctx)
+					frames.append(frame)
+					code, consts, names, spans = frame.code.code, frame.code.consts, frame.code.names, frame.code.spans
+					stack, ctx, pc = frame.stack, exec_ctx, 0
+				else:
+					deoptimize(frame.code, (pc >> 1) - 1, OP_CALL_ADAPTIVE, 'call')
+					pc -= 2
+
+			elif op == OP_CALL or op == OP_TAIL_CALL or op == OP_CALL_ADAPTIVE:
+				call_node = spans[(pc >> 1) - 1]
+				if op == OP_CALL_ADAPTIVE: observe_call(frame.code, (pc >> 1) - 1, stack[-1 - arg], arg)
+				args = stack[len(stack) - arg:]
+				del stack[len(stack) - arg:]
+				value_to_call = stack.pop()
+
+				if isinstance(value_to_call, Function) and value_to_call.code:
+					# A tail call takes the place of the current frame; its
+					# context hangs off the caller's, as the tree-walker's does
+					if op == OP_TAIL_CALL:
+						exec_ctx = value_to_call.generate_new_context(ctx.parent, ctx.parent_entry_pos)
+					else:
+						exec_ctx = value_to_call.generate_new_context(ctx, call_node.pos_start)
+					res = value_to_call.check_and_populate_args(value_to_call.arg_names, args, exec_ctx)
+					if res.error: return None, locate_error(res.error, call_node, ctx)
+
+					frame.pc = pc
+					frame = Frame(value_to_call.code, exec_ctx)
+					if op == OP_TAIL_CALL:
+						frame.memo = frames[-1].memo
+						frames[-1] = frame
+					else:
+						frames.append(frame)
+					code, consts, names, spans = frame.code.code, frame.code.consts, frame.code.names, frame.code.spans
+					stack, ctx, pc = frame.stack, exec_ctx, 0
+				elif type(value_to_call) is MemoFunction and isinstance(value_to_call.function, Function) and value_to_call.function.code:
+					# A miss runs the function in a frame of its own, which
+					# stores the result when it returns
+					key, error = value_to_call.make_key(args, ctx)
+					if error: return None, locate_error(error, call_node, ctx)
+					value = value_to_call.lookup(key)
+					if value is not None:
+						stack.append(value)
+					else:
+						function = value_to_call.function
+						exec_ctx = function.generate_new_context(ctx, call_node.pos_start)
+						res = function.check_and_populate_args(function.arg_names, args, exec_ctx)
+						if res.error: return None, locate_error(res.error, call_node, ctx)
+
+						frame.pc = pc
+						frame = Frame(function.code, exec_ctx)
+						frame.memo = (value_to_call, key)
+						frames.append(frame)
+						code, consts, names, spans = frame.code.code, frame.code.consts, frame.code.names, frame.code.spans
+						stack, ctx, pc = frame.stack, exec_ctx, 0
+				else:
+					res = value_to_call.execute(args, ctx, call_node.pos_start)
+					if res.error: return None, locate_error(res.error, call_node, ctx)
+					stack.append(res.value or Number.null)
+
+			elif op == OP_RETURN_VALUE or op == OP_RET:
+				value = stack.pop()
+				memo = frames.pop().memo
+				if not frames:
+					return (value if op == OP_RETURN_VALUE else None), None
+				if memo: value = memo[0].store(memo[1], value)
+
+				frame = frames[-1]
+				code, consts, names, spans = frame.code.code, frame.code.consts, frame.code.names, frame.code.spans
+				stack, ctx, pc = frame.stack, frame.context, frame.pc
+				stack.append(value)
+
+			elif op == OP_LOAD_HOISTED:
+				value = spans[(pc >> 1) - 1].value
+				if value is not None:
+					stack.append(value)
+					pc = arg
+
+			elif op == OP_STORE_HOISTED:
+				keep_hoisted(spans[(pc >> 1) - 1], stack[-1])
+
+			elif op == OP_RESET_HOISTED:
+				enter_hoisted(spans[(pc >> 1) - 1], ctx)
+
+			elif op == OP_LOAD_NULL:
+				stack.append(Number.null)
+
+			elif op == OP_NEW_ACC:
+				stack.append([])
+
+			elif op == OP_FINISH_ACC:
+				stack[-1] = List(stack[-1])
+
+			elif op == OP_SETUP_LOOP:
+				frame.blocks.append((arg, pc, len(stack)))
+
+			elif op == OP_POP_BLOCK:
+				frame.blocks.pop()
+
+			elif op == OP_FOR_PREP:
+				step_value = stack.pop().value if arg else 1
+				end_value = stack.pop()
+				start_value = stack.pop()
+				stack.append(number_range(start_value.value, end_value.value, step_value))
+
+			elif op == OP_LAZY_LOOP:
+				step_value = stack.pop().value if arg else 1
+				end_value = stack.pop()
+				stack[-1] = run_lazy_loop(spans[(pc >> 1) - 1], stack[-1].value, end_value.value, step_value, ctx)
+
+			elif op == OP_BUILD_LIST:
+				elements = stack[len(stack) - arg:]
+				del stack[len(stack) - arg:]
+				stack.append(List(elements))
+
+			elif op == OP_BUILD_DICT:
+				items = stack[len(stack) - 2 * arg:]
+				del stack[len(stack) - 2 * arg:]
+				value, error = make_dict(zip(items[::2], items[1::2]))
+				if error: return None, locate_error(error, spans[(pc >> 1) - 1], ctx)
+				stack.append(value)
+
+			elif op == OP_NEGATE:
+				result, error = stack[-1].multed_by(make_number(-1))
+				if error: return None, locate_error(error, spans[(pc >> 1) - 1], ctx)
+				stack[-1] = result
+
+			elif op == OP_NOT:
+				result, error = stack[-1].notted()
+				if error: return None, locate_error(error, spans[(pc >> 1) - 1], ctx)
+				stack[-1] = result
+
+			elif op == OP_POSITIVE:
+				pass
+
+			elif op == OP_BREAK or op == OP_CONTINUE:
+				# Like the tree-walker, brk/cont outside a loop unwinds into the caller's loop
+				while not frame.blocks:
+					frames.pop()
+					if not frames: return None, None
+					frame = frames[-1]
+				code, consts, names, spans = frame.code.code, frame.code.consts, frame.code.names, frame.code.spans
+				stack, ctx = frame.stack, frame.context
+
+				break_pc, continue_pc, depth = frame.blocks[-1]
+				del stack[depth:]
+				pc = break_pc if op == OP_BREAK else continue_pc
+
+			elif op == OP_LOAD_SCOPED:
+				address, name = frame.code.scoped[arg]
+				value = ctx.lookup(address, name)
+				if not value:
+					return None, self.undefined(name, spans[(pc >> 1) - 1], ctx)
+				stack.append(value)
+
+			elif op == OP_MAKE_FUNCTION:
+				func_code = consts[arg]
+				stack.append(Function(
+					func_code.name, func_code.body_node, func_code.arg_names,
+					func_code.should_auto_return, func_code, len(func_code.slot_names), ctx
+				))
+
+			else:
+				raise Exception(f'Unknown opcode {op}')
+
+	def undefined(self, name, node, context):
+		return RunTimeError(node.pos_start, node.pos_end, f"'{name}' is not defined", context)
+
+#######################################
+# PYTHON BACKEND
+#######################################
+
+# mode='python' turns the program into Python source, one function per
+# Libra function, and runs it as CPython bytecode. Values, contexts and
+# functions are the same objects the other modes use.
+#
+# Every operation that can fail gets a line of its own, and the line
+# table maps each line back to the node it came from. Errors are raised
+# without a position; when one leaves a generated function, the innermost
+# generated line in its traceback gives the node (and the frame's ctx the
+# context), as locate_error would have at that node in the tree-walker.
+
+PYTHON_FILENAME = '<libra python>'
+
+PYTHON_METHODS = {BINARY_OP_INDEX[key]: name for key, name in (
+	(TOK_PLUS,  'added_to'),
+	(TOK_MINUS, 'subbed_by'),
+	(TOK_MUL,   'multed_by'),
+	(TOK_DIV,   'dived_by'),
+	(TOK_MOD,   'moded_by'),
+	(TOK_POW,   'powed_by'),
+	(TOK_EE,    'get_comp_eq'),
+	(TOK_NE,    'get_comp_ne'),
+	(TOK_LT,    'get_comp_lt'),
+	(TOK_GT,    'get_comp_gt'),
+	(TOK_LTE,   'get_comp_lte'),
+	(TOK_GTE,   'get_comp_gte'),
+	((TOK_KEYWORD, 'AND'), 'anded_by'),
+	((TOK_KEYWORD, 'OR'),  'ored_by'),
+)}
+
+# Operators applied directly when both operands are numbers (see NUMBER_OPERATORS)
+PYTHON_OPERATORS = {BINARY_OP_INDEX[key]: symbol for key, symbol in (
+	(TOK_PLUS,  '+'),
+	(TOK_MINUS, '-'),
+	(TOK_MUL,   '*'),
+	(TOK_EE,    '=='),
+	(TOK_NE,    '!='),
+	(TOK_LT,    '<'),
+	(TOK_GT,    '>'),
+	(TOK_LTE,   '<='),
+	(TOK_GTE,   '>='),
+)}
+
+class PyFunction(Function):
+	__slots__ = ('run',)
+
+	def __init__(self, name, body_node, arg_names, should_auto_return, slot_count, scope, run):
+		super().__init__(name, body_node, arg_names, should_auto_return, None, slot_count, scope)
+		self.run = run
+
+	def call(self, args, context, entry_pos):
+		if len(args) != len(self.arg_names):
+			raise ErrorSignal(self.check_args(self.arg_names, args).error)
+
+		function = self
+		while True:
+			# A self tail call found another kind of function under the name
+			if type(function) is not PyFunction: return function.call(args, context, entry_pos)
+			exec_ctx = function.generate_new_context(context, entry_pos)
+			function.populate_args(function.arg_names, args, exec_ctx)
+
+			value = run_python(function.run, exec_ctx)
+			if type(value) is not TailCall: return value
+			function, args = value.function, value.args
+
+	def copy(self):
+		return PyFunction(self.name, self.body_node, self.arg_names, self.should_auto_return, self.slot_count, self.scope, self.run)
+
+def run_python(run, context):
+	try:
+		return run(context)
+	except ErrorSignal as signal:
+		if signal.error.pos_start is None or signal.error.context is None:
+			tb, frame = signal.__traceback__, None
+			while tb:
+				if tb.tb_frame.f_code.co_filename == PYTHON_FILENAME: frame, line = tb.tb_frame, tb.tb_lineno
+				tb = tb.tb_next
+			if frame:
+				node = frame.f_globals['LINE_NODES'][line - 1]
+				if node: locate_error(signal.error, node, frame.f_locals['ctx'])
+		raise
+
+def checked(result):
+	value, error = result
+	if error: raise ErrorSignal(error)
+	return value
+
+def truth(value, is_operand):
+	if type(value) is Number: return bool(value.value)
+	if is_operand: raise ErrorSignal(value.illegal_operation())
+	return value.is_true()
+
+def load_global(symbols, name):
+	value = symbols.get(name)
+	if not value: raise ErrorSignal(RunTimeError(None, None, f"'{name}' is not defined", None))
+	return value
+
+def undefined(name):
+	raise ErrorSignal(RunTimeError(None, None, f"'{name}' is not defined", None))
+
+def call_value(value, args, context, entry_pos):
+	if isinstance(value, Function): return value.call(args, context, entry_pos)
+	res = value.execute(args, context, entry_pos)
+	if res.error: raise ErrorSignal(res.error)
+	return res.value
+
+def tail_call_value(value, args, context, entry_pos):
+	if isinstance(value, Function):
+		if len(args) != len(value.arg_names):
+			raise ErrorSignal(value.check_args(value.arg_names, args).error)
+		return TailCall(value, args)
+	return call_value(value, args, context, entry_pos)
+
+def make_py_function(node, run, context):
+	return PyFunction(
+		node.var_name_tok.value if node.var_name_tok else None, node.body_node,
+		[arg_name.value for arg_name in node.arg_name_toks], node.should_auto_return,
+		len(node.slot_names), context, run
+	)
+
+PYTHON_RUNTIME = {
+	'Number': Number, 'List': List, 'TailCall': TailCall,
+	'ContinueSignal': ContinueSignal, 'BreakSignal': BreakSignal, 'ReturnSignal': ReturnSignal,
+	'NULL': Number.null, 'TRUE': Number.true, 'MINUS_ONE': make_number(-1),
+	'make_number': make_number, 'make_dict': make_dict, 'number_range': number_range,
+	'run_lazy_loop': run_lazy_loop, 'enter_hoisted': enter_hoisted, 'keep_hoisted': keep_hoisted,
+	'checked': checked, 'truth': truth, 'load_global': load_global, 'undefined': undefined,
+	'call_value': call_value, 'tail_call_value': tail_call_value, 'make_py_function': make_py_function,
+}
+
+class PythonModule:
+	def __init__(self, lines, line_nodes, refs):
+		self.lines = lines
+		self.line_nodes = line_nodes
+		self.refs = refs
+
+	def source(self, annotate=False):
+		if not annotate: return '\n'.join(self.lines) + '\n'
+		# Each line that can fail is tagged with the Libra line:column it reports
+		lines = []
+		for line, node in zip(self.lines, self.line_nodes):
+			if node: line = f'{line}  # {node.pos_start.ln + 1}:{node.pos_start.col + 1}'
+			lines.append(line)
+		return '\n'.join(lines) + '\n'
+
+	def load(self):
+		namespace = dict(PYTHON_RUNTIME)
+		namespace.update(self.refs)
+		namespace['LINE_NODES'] = self.line_nodes
+		# This module's exec runs Libra; the generated code needs Python's
+		builtins.exec(compile(self.source(), PYTHON_FILENAME, 'exec'), namespace)
+		return namespace['_program']
+
+class Transpiler:
+	def transpile_program(self, node):
+		self.functions = []
+		self.refs, self.ref_names = {}, {}
+		self.temp_count = self.function_count = 0
+		self.numbers = set()
+
+		self.begin_function('_program', 'ctx')
+		self.in_function = False
+		value = self.transpile(node)
+		self.line(f'return {value}')
+		self.end_function()
+
+		lines, line_nodes = [], []
+		for function in self.functions:
+			for indent, text, node in function:
+				lines.append('\t' * indent + text)
+				line_nodes.append(node)
+			lines.append('')
+			line_nodes.append(None)
+		return PythonModule(lines, line_nodes, self.refs)
+
+	def transpile(self, node):
+		handler = self.handlers.get(type(node))
+		if handler is None: return self.no_transpile_method(node)
+		return handler(self, node)
+
+	def transpile_discarded(self, node):
+		# As Interpreter.discard: statement lists and loops whose value is thrown away aren't built
+		if isinstance(node, ListNode):
+			for element_node in node.element_nodes:
+				self.transpile_discarded(element_node)
+		elif is_constant(node):
+			pass
+		elif isinstance(node, FromNode):
+			self.transpile_FromNode(node, False)
+		elif isinstance(node, UntilNode):
+			self.transpile_UntilNode(node, False)
+		else:
+			self.transpile(node)
+
+	def no_transpile_method(self, node):
+		raise Exception(f'No transpile_{type(node).__name__} method defined')
+
+	###################################
+
+	def begin_function(self, name, args):
+		self.body, self.indent, self.in_loop = [], 0, False
+		self.line(f'def {name}({args}):')
+		self.indent = 1
+		self.line('slots = ctx.slots')
+		self.line('symbols = ctx.symbol_table')
+		self.line('names = symbols.symbols')
+
+	def end_function(self):
+		self.functions.append(self.body)
+
+	def line(self, text, node=None):
+		self.body.append((self.indent, text, node))
+
+	@contextlib.contextmanager
+	def block(self):
+		self.indent += 1
+		start = len(self.body)
+		try:
+			yield
+		finally:
+			if len(self.body) == start: self.line('pass')
+			self.indent -= 1
+
+	def temp(self):
+		self.temp_count += 1
+		return f'_t{self.temp_count}'
+
+	def ref(self, value, prefix):
+		# Constants, nodes and positions the code refers to become module globals
+		name = self.ref_names.get(id(value))
+		if name is None:
+			name = f'{prefix}{len(self.refs)}'
+			self.refs[name] = value
+			self.ref_names[id(value)] = name
+		return name
+
+	def are_numbers(self, *values):
+		# Constants are known to be numbers already
+		return ' and '.join(f'type({value}) is Number' for value in values if value not in self.numbers) or 'True'
+
+	def store(self, slot, name, value):
+		if slot is None:
+			self.line(f'names[{name!r}] = {value}')
+		else:
+			self.line(f'slots[{slot}] = {value}')
+
+	def test(self, node, operand_of=None):
+		# As Interpreter.test: gives a name holding a Python bool
+		if type(node) is BinOpNode:
+			op_index = node.op_index
+			decides = SHORT_CIRCUIT_OPS.get(op_index)
+			if decides is not None:
+				left = self.test(node.left_node, node)
+				self.line(f'if {"not " if decides else ""}{left}:')
+				with self.block():
+					self.line(f'{left} = {self.test(node.right_node, node)}')
+				return left
+
+			if op_index in COMPARE_OPERATORS:
+				left = self.transpile(node.left_node)
+				right = self.transpile(node.right_node)
+				result, symbol = self.temp(), PYTHON_OPERATORS[op_index]
+				self.line(f'if {self.are_numbers(left, right)}: {result} = {left}.value {symbol} {right}.value')
+				self.line('else:')
+				with self.block():
+					self.line(f'{result} = checked({left}.{PYTHON_METHODS[op_index]}({right}))', node)
+					self.line(f'{result} = truth({result}, {operand_of is not None})', operand_of)
+				return result
+
+		value, result = self.transpile(node), self.temp()
+		self.line(f'{result} = bool({value}.value) if type({value}) is Number else truth({value}, {operand_of is not None})', operand_of)
+		return result
+
+	###################################
+
+	def transpile_NumberNode(self, node):
+		name = self.ref(node.value, '_k')
+		self.numbers.add(name)
+		return name
+
+	def transpile_StringNode(self, node):
+		return self.ref(node.value, '_k')
+
+	def transpile_ListNode(self, node):
+		elements = [self.transpile(element_node) for element_node in node.element_nodes]
+		result = self.temp()
+		self.line(f'{result} = List([{", ".join(elements)}])')
+		return result
+
+	def transpile_DictNode(self, node):
+		entries = [(self.transpile(key_node), self.transpile(value_node)) for key_node, value_node in node.entry_nodes]
+		result = self.temp()
+		self.line(f'{result} = checked(make_dict([{", ".join(f"({key}, {value})" for key, value in entries)}]))', node)
+		return result
+
+	def transpile_VarAccessNode(self, node):
+		name, address = node.var_name_tok.value, node.address
+		result = self.temp()
+		if not address:
+			self.line(f'{result} = names.get({name!r}) or load_global(symbols, {name!r})', node)
+		elif len(address) == 1 and address[0][0] == 0:
+			self.line(f'{result} = slots[{address[0][1]}] or load_global(symbols, {name!r})', node)
+		else:
+			self.line(f'{result} = ctx.lookup({self.ref(address, "_a")}, {name!r}) or undefined({name!r})', node)
+		return result
+
+	def transpile_VarAssignNode(self, node):
+		value = self.transpile(node.value_node)
+		self.store(node.slot, node.var_name_tok.value, value)
+		return value
+
+	def transpile_BinOpNode(self, node):
+		op_index = node.op_index
+		method = PYTHON_METHODS[op_index]
+		left = self.transpile(node.left_node)
+		result = self.temp()
+
+		decides = SHORT_CIRCUIT_OPS.get(op_index)
+		if decides is not None:
+			self.line(f'if type({left}) is Number and {"" if decides else "not "}{left}.value:')
+			with self.block():
+				self.line(f'{result} = {left}')
+			self.line('else:')
+			with self.block():
+				right = self.transpile(node.right_node)
+				self.line(f'{result} = checked({left}.{method}({right}))', node)
+			return result
+
+		right = self.transpile(node.right_node)
+		symbol = PYTHON_OPERATORS.get(op_index)
+		if symbol:
+			self.line(
+				f'{result} = make_number({left}.value {symbol} {right}.value) '
+				f'if {self.are_numbers(left, right)} else checked({left}.{method}({right}))',
+				node
+			)
+		else:
+			self.line(f'{result} = checked({left}.{method}({right}))', node)
+		return result
+
+	def transpile_UnaryOpNode(self, node):
+		value = self.transpile(node.node)
+		if node.op_tok.type == TOK_MINUS:
+			result = self.temp()
+			self.line(f'{result} = checked({value}.multed_by(MINUS_ONE))', node)
+			return result
+		if node.op_tok.matches(TOK_KEYWORD, 'NOT'):
+			result = self.temp()
+			self.line(f'{result} = checked({value}.notted())', node)
+			return result
+		return value
+
+	def transpile_IfNode(self, node):
+		result = self.temp()
+
+		def transpile_cases(cases):
+			if not cases:
+				if node.else_case:
+					self.transpile_case(result, *node.else_case)
+				else:
+					self.line(f'{result} = NULL')
+				return
+
+			condition, expr, should_return_null = cases[0]
+			self.line(f'if {self.test(condition)}:')
+			with self.block():
+				self.transpile_case(result, expr, should_return_null)
+			self.line('else:')
+			with self.block():
+				transpile_cases(cases[1:])
+
+		transpile_cases(node.cases)
+		return result
+
+	def transpile_case(self, result, expr, should_return_null):
+		if should_return_null:
+			self.transpile_discarded(expr)
+			self.line(f'{result} = NULL')
+		else:
+			self.line(f'{result} = {self.transpile(expr)}')
+
+	def transpile_FromNode(self, node, collect=None):
+		if collect is None: collect = not node.should_return_null
+		start = self.transpile(node.start_value_node)
+		end = self.transpile(node.end_value_node)
+		step = self.transpile(node.step_value_node) if node.step_value_node else 'TRUE'
+
+		if collect and node.lazy:
+			result = self.temp()
+			self.line(f'{result} = run_lazy_loop({self.ref(node, "_n")}, {start}.value, {end}.value, {step}.value, ctx)', node)
+			return result
+
+		if node.hoisted: self.line(f'enter_hoisted({self.ref(node, "_n")}, ctx)')
+		elements = self.temp()
+		if collect: self.line(f'{elements} = []')
+
+		value = self.temp()
+		self.line(f'for {value} in number_range({start}.value, {end}.value, {step}.value):')
+		with self.block():
+			self.store(node.var_slot, node.var_name_tok.value, value)
+			self.transpile_loop_body(node.body_node, collect, elements)
+		return self.finish_loop(collect, elements)
+
+	def transpile_UntilNode(self, node, collect=None):
+		if collect is None: collect = not node.should_return_null
+		if node.hoisted: self.line(f'enter_hoisted({self.ref(node, "_n")}, ctx)')
+		elements = self.temp()
+		if collect: self.line(f'{elements} = []')
+
+		self.line('while True:')
+		with self.block():
+			# brk/cont in the condition belong to an enclosing loop, as in the tree-walker
+			in_loop, self.in_loop = self.in_loop, False
+			self.line(f'if not {self.test(node.condition_node)}: break')
+			self.in_loop = in_loop
+			self.transpile_loop_body(node.body_node, collect, elements)
+		return self.finish_loop(collect, elements)
+
+	def transpile_loop_body(self, body_node, collect, elements):
+		# brk/cont from a called function arrive as signals
+		in_loop, self.in_loop = self.in_loop, True
+		self.line('try:')
+		with self.block():
+			if collect:
+				value = self.transpile(body_node)
+			else:
+				self.transpile_discarded(body_node)
+		self.line('except ContinueSignal: continue')
+		self.line('except BreakSignal: break')
+		if collect: self.line(f'{elements}.append({value})')
+		self.in_loop = in_loop
+
+	def finish_loop(self, collect, elements):
+		if not collect: return 'NULL'
+		result = self.temp()
+		self.line(f'{result} = List({elements})')
+		return result
+
+	def transpile_FuncDefNode(self, node):
+		func_name = node.var_name_tok.value if node.var_name_tok else None
+		self.function_count += 1
+		name = f'_f{self.function_count}' + (f'_{func_name}' if func_name else '')
+
+		state = self.body, self.indent, self.in_loop, self.in_function
+		self.begin_function(name, 'ctx')
+		self.in_function = True
+		if node.should_auto_return:
+			self.line(f'return {self.transpile(node.body_node)}')
+		else:
+			self.transpile_discarded(node.body_node)
+			self.line('return NULL')
+		# A nested function goes in before the one it was found in
+		self.end_function()
+		self.body, self.indent, self.in_loop, self.in_function = state
+
+		result = self.temp()
+		self.line(f'{result} = make_py_function({self.ref(node, "_n")}, {name}, ctx)')
+		if func_name: self.store(node.name_slot, func_name, result)
+		return result
+
+	def transpile_CallNode(self, node):
+		value_to_call = self.transpile(node.node_to_call)
+		args = [self.transpile(arg_node) for arg_node in node.arg_nodes]
+		result = self.temp()
+		helper = 'tail_call_value' if node.tail else 'call_value'
+		self.line(f'{result} = {helper}({value_to_call}, [{", ".join(args)}], ctx, {self.ref(node.pos_start, "_p")})', node)
+		return result
+
+	def transpile_RetNode(self, node):
+		value = self.transpile(node.node_to_return) if node.node_to_return else 'NULL'
+		self.line(f'return {value}' if self.in_function else f'raise ReturnSignal({value})')
+		return 'NULL'
+
+	def transpile_ContNode(self, node):
+		self.line('continue' if self.in_loop else 'raise ContinueSignal()')
+		return 'NULL'
+
+	def transpile_BrkNode(self, node):
+		self.line('break' if self.in_loop else 'raise BreakSignal()')
+		return 'NULL'
+
+	def transpile_HoistedNode(self, node):
+		hoisted, result = self.ref(node, '_n'), self.temp()
+		self.line(f'{result} = {hoisted}.value')
+		self.line(f'if {result} is None:')
+		with self.block():
+			self.line(f'{result} = {self.transpile(node.node)}')
+			self.line(f'keep_hoisted({hoisted}, {result})')
+		return result
+
+Transpiler.handlers = node_handlers(Transpiler, 'transpile_')
+
+def python_source(fn, text):
+	node, error = parse(fn, text)
+	if error: return None, error
+	return Transpiler().transpile_program(node).source(annotate=True), None
+
+def python_program(node):
+	# Python allows 20 nested blocks (a loop here takes two); deeper
+	# programs are left to the tree-walker
+	try:
+		return Transpiler().transpile_program(node).load()
+	except (SyntaxError, RecursionError):
+		return None
+
+#######################################
+# CLOSURE COMPILER
+#######################################
+
+# mode='closure' turns each node into a Python closure once, before the
+# program runs. A closure takes the context and gives the node's value,
+# calling the closures of its children directly. The node's type, operator
+# and slot are looked at when the closure is made, not on every run.
+# Everything else (signals, errors and their locations) works as in the
+# tree-walker.
+
+class ClosureFunction(Function):
+	__slots__ = ('run',)
+
+	def __init__(self, name, body_node, arg_names, should_auto_return, slot_count, scope, run):
+		super().__init__(name, body_node, arg_names, should_auto_return, None, slot_count, scope)
+		self.run = run
+
+	def call(self, args, context, entry_pos):
+		if len(args) != len(self.arg_names):
+			raise ErrorSignal(self.check_args(self.arg_names, args).error)
+
+		function = self
+		while True:
+			if type(function) is not ClosureFunction: return function.call(args, context, entry_pos)
+			exec_ctx = function.generate_new_context(context, entry_pos)
+			function.populate_args(function.arg_names, args, exec_ctx)
+
+			try:
+				value = function.run(exec_ctx)
+			except ReturnSignal as signal:
+				value = signal.value
+
+			if type(value) is not TailCall: return value
+			function, args = value.function, value.args
+
+	def copy(self):
+		return ClosureFunction(self.name, self.body_node, self.arg_names, self.should_auto_return, self.slot_count, self.scope, self.run)
+
+class ClosureCompiler:
+	def compile(self, node):
+		handler = self.handlers.get(type(node))
+		if handler is None: return self.no_closure_method(node)
+		return handler(self, node)
+
+	def compile_discarded(self, node):
+		# As Interpreter.discard: statement lists and loops whose value is thrown away aren't built
+		if isinstance(node, ListNode):
+			statements = [self.compile_discarded(element_node) for element_node in node.element_nodes]
+			def run_statements(ctx):
+				for statement in statements:
+					statement(ctx)
+			return run_statements
+		if is_constant(node):
+			return lambda ctx: None
+		if isinstance(node, FromNode):
+			return self.closure_FromNode(node, False)
+		if isinstance(node, UntilNode):
+			return self.closure_UntilNode(node, False)
+		return self.compile(node)
+
+	def compile_returning(self, node):
+		# A function body's statements give back the value of a ret they reach
+		# or NOT_RETURNED, so a ret outside a loop doesn't need a ReturnSignal
+		if isinstance(node, RetNode):
+			return self.compile(node.node_to_return) if node.node_to_return else lambda ctx: Number.null
+
+		if isinstance(node, ListNode):
+			statements = [self.compile_returning(element_node) for element_node in node.element_nodes]
+			def run_statements(ctx):
+				for statement in statements:
+					value = statement(ctx)
+					if value is not NOT_RETURNED: return value
+				return NOT_RETURNED
+			return run_statements
+
+		if isinstance(node, IfNode):
+			cases = [(self.compile_test(condition), self.compile_returning(expr)) for condition, expr, _ in node.cases]
+			else_case = self.compile_returning(node.else_case[0]) if node.else_case else None
+			def choose(ctx):
+				for condition, expr in cases:
+					if condition(ctx): return expr(ctx)
+				return else_case(ctx) if else_case else NOT_RETURNED
+			return choose
+
+		run = self.compile_discarded(node)
+		def run_statement(ctx):
+			run(ctx)
+			return NOT_RETURNED
+		return run_statement
+
+	def compile_test(self, node, operand_of=None):
+		# As Interpreter.test: the closure gives a Python bool
+		if type(node) is BinOpNode:
+			op_index = node.op_index
+			decides = SHORT_CIRCUIT_OPS.get(op_index)
+			if decides is not None:
+				left, right = self.compile_test(node.left_node, node), self.compile_test(node.right_node, node)
+				if decides:
+					return lambda ctx: left(ctx) or right(ctx)
+				return lambda ctx: left(ctx) and right(ctx)
+
+			compare = COMPARE_OPERATORS.get(op_index)
+			if compare:
+				left, right = self.compile(node.left_node), self.compile(node.right_node)
+				operate = BINARY_OP_FUNCS[op_index]
+				def compare_values(ctx):
+					left_value, right_value = left(ctx), right(ctx)
+					if type(left_value) is Number and type(right_value) is Number:
+						return compare(left_value.value, right_value.value)
+					value, error = operate(left_value, right_value)
+					if error: raise ErrorSignal(locate_error(error, node, ctx))
+					return truth_of(value, operand_of, ctx)
+				return compare_values
+
+		value = self.compile(node)
+		return lambda ctx: truth_of(value(ctx), operand_of, ctx)
+
+	def no_closure_method(self, node):
+		raise Exception(f'No closure_{type(node).__name__} method defined')
+
+	###################################
+
+	def closure_NumberNode(self, node):
+		value = node.value
+		return lambda ctx: value
+
+	def closure_StringNode(self, node):
+		value = node.value
+		return lambda ctx: value
+
+	def closure_ListNode(self, node):
+		elements = [self.compile(element_node) for element_node in node.element_nodes]
+		return lambda ctx: List([element(ctx) for element in elements])
+
+	def closure_DictNode(self, node):
+		entries = [(self.compile(key_node), self.compile(value_node)) for key_node, value_node in node.entry_nodes]
+		def make(ctx):
+			value, error = make_dict([(key(ctx), value(ctx)) for key, value in entries])
+			if error: raise ErrorSignal(locate_error(error, node, ctx))
+			return value
+		return make
+
+	def closure_VarAccessNode(self, node):
+		name, address = node.var_name_tok.value, node.address
+
+		def undefined(ctx):
+			raise ErrorSignal(RunTimeError(node.pos_start, node.pos_end, f"'{name}' is not defined", ctx))
+
+		if not address:
+			def load_global(ctx):
+				return ctx.symbol_table.get(name) or undefined(ctx)
+			return load_global
+		if len(address) == 1 and address[0][0] == 0:
+			slot = address[0][1]
+			def load_local(ctx):
+				return ctx.slots[slot] or ctx.symbol_table.get(name) or undefined(ctx)
+			return load_local
+		def load_scoped(ctx):
+			return ctx.lookup(address, name) or undefined(ctx)
+		return load_scoped
+
+	def closure_VarAssignNode(self, node):
+		return self.compile_store(node.slot, node.var_name_tok.value, self.compile(node.value_node))
+
+	def compile_store(self, slot, name, value):
+		if slot is None:
+			def store_global(ctx):
+				result = ctx.symbol_table.symbols[name] = value(ctx)
+				return result
+			return store_global
+		def store_local(ctx):
+			result = ctx.slots[slot] = value(ctx)
+			return result
+		return store_local
+
+	def closure_BinOpNode(self, node):
+		op_index = node.op_index
+		operate = BINARY_OP_FUNCS[op_index]
+		left = self.compile(node.left_node)
+		right = self.compile(node.right_node)
+
+		decides = SHORT_CIRCUIT_OPS.get(op_index)
+		if decides is not None:
+			def short_circuit(ctx):
+				left_value = left(ctx)
+				if type(left_value) is Number and bool(left_value.value) is decides: return left_value
+				result, error = operate(left_value, right(ctx))
+				if error: raise ErrorSignal(locate_error(error, node, ctx))
+				return result
+			return short_circuit
+
+		number_op = NUMBER_OPERATORS.get(op_index)
+		if number_op and isinstance(node.right_node, NumberNode):
+			# x + 1, n - 2: the right operand is known to be a number
+			constant = node.right_node.value
+			right_value = constant.value
+			def operate_constant(ctx):
+				left_value = left(ctx)
+				if type(left_value) is Number: return make_number(number_op(left_value.value, right_value))
+				result, error = operate(left_value, constant)
+				if error: raise ErrorSignal(locate_error(error, node, ctx))
+				return result
+			return operate_constant
+
+		if number_op:
+			def operate_numbers(ctx):
+				left_value, right_value = left(ctx), right(ctx)
+				if type(left_value) is Number and type(right_value) is Number:
+					return make_number(number_op(left_value.value, right_value.value))
+				result, error = operate(left_value, right_value)
+				if error: raise ErrorSignal(locate_error(error, node, ctx))
+				return result
+			return operate_numbers
+
+		def operate_values(ctx):
+			result, error = operate(left(ctx), right(ctx))
+			if error: raise ErrorSignal(locate_error(error, node, ctx))
+			return result
+		return operate_values
+
+	def closure_UnaryOpNode(self, node):
+		value = self.compile(node.node)
+		if node.op_tok.type == TOK_MINUS:
+			minus_one = make_number(-1)
+			def negate(ctx):
+				result, error = value(ctx).multed_by(minus_one)
+				if error: raise ErrorSignal(locate_error(error, node, ctx))
+				return result
+			return negate
+		if node.op_tok.matches(TOK_KEYWORD, 'NOT'):
+			def invert(ctx):
+				result, error = value(ctx).notted()
+				if error: raise ErrorSignal(locate_error(error, node, ctx))
+				return result
+			return invert
+		return value
+
+	def closure_IfNode(self, node):
+		cases = [
+			(self.compile_test(condition), self.compile_case(expr, should_return_null))
+			for condition, expr, should_return_null in node.cases
+		]
+		else_case = self.compile_case(*node.else_case) if node.else_case else None
+
+		def choose(ctx):
+			for condition, expr in cases:
+				if condition(ctx): return expr(ctx)
+			if else_case: return else_case(ctx)
+			return Number.null
+		return choose
+
+	def compile_case(self, expr, should_return_null):
+		if not should_return_null: return self.compile(expr)
+		run = self.compile_discarded(expr)
+		def run_case(ctx):
+			run(ctx)
+			return Number.null
+		return run_case
+
+	def closure_FromNode(self, node, collect=None):
+		if collect is None: collect = not node.should_return_null
+		start = self.compile(node.start_value_node)
+		end = self.compile(node.end_value_node)
+		step = self.compile(node.step_value_node) if node.step_value_node else lambda ctx: Number.true
+		body = self.compile(node.body_node) if collect else self.compile_discarded(node.body_node)
+		slot, var_name, lazy = node.var_slot, node.var_name_tok.value, collect and node.lazy
+
+		def loop(ctx):
+			start_value, end_value, step_value = start(ctx), end(ctx), step(ctx)
+			if lazy: return run_lazy_loop(node, start_value.value, end_value.value, step_value.value, ctx)
+			if node.hoisted: enter_hoisted(node, ctx)
+
+			elements = []
+			for value in number_range(start_value.value, end_value.value, step_value.value):
+				ctx.assign(slot, var_name, value)
+				try:
+					value = body(ctx)
+				except ContinueSignal:
+					continue
+				except BreakSignal:
+					break
+				if collect: elements.append(value)
+			return List(elements) if collect else Number.null
+		return loop
+
+	def closure_UntilNode(self, node, collect=None):
+		if collect is None: collect = not node.should_return_null
+		condition = self.compile_test(node.condition_node)
+		body = self.compile(node.body_node) if collect else self.compile_discarded(node.body_node)
+
+		def loop(ctx):
+			if node.hoisted: enter_hoisted(node, ctx)
+			elements = []
+			while condition(ctx):
+				try:
+					value = body(ctx)
+				except ContinueSignal:
+					continue
+				except BreakSignal:
+					break
+				if collect: elements.append(value)
+			return List(elements) if collect else Number.null
+		return loop
+
+	def closure_FuncDefNode(self, node):
+		func_name = node.var_name_tok.value if node.var_name_tok else None
+		arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+		if node.should_auto_return:
+			run = self.compile(node.body_node)
+		else:
+			body = self.compile_returning(node.body_node)
+			def run(ctx):
+				value = body(ctx)
+				return Number.null if value is NOT_RETURNED else value
+
+		slot_count = len(node.slot_names)
+		def make_function(ctx):
+			return ClosureFunction(func_name, node.body_node, arg_names, node.should_auto_return, slot_count, ctx, run)
+		if func_name: return self.compile_store(node.name_slot, func_name, make_function)
+		return make_function
+
+	def closure_CallNode(self, node):
+		callee = self.compile(node.node_to_call)
+		arg_closures = [self.compile(arg_node) for arg_node in node.arg_nodes]
+		tail, entry_pos = node.tail, node.pos_start
+
+		def call(ctx):
+			value_to_call = callee(ctx)
+			args = [arg(ctx) for arg in arg_closures]
+
+			if isinstance(value_to_call, Function):
+				if tail:
+					if len(args) != len(value_to_call.arg_names):
+						error = value_to_call.check_args(value_to_call.arg_names, args).error
+						raise ErrorSignal(locate_error(error, node, ctx))
+					return TailCall(value_to_call, args)
+				try:
+					return value_to_call.call(args, ctx, entry_pos)
+				except ErrorSignal as signal:
+					locate_error(signal.error, node, ctx)
+					raise
+
+			res = value_to_call.execute(args, ctx, entry_pos)
+			if res.error: raise ErrorSignal(locate_error(res.error, node, ctx))
+			return res.value
+		return call
+
+	def closure_RetNode(self, node):
+		value = self.compile(node.node_to_return) if node.node_to_return else lambda ctx: Number.null
+		def ret(ctx):
+			raise ReturnSignal(value(ctx))
+		return ret
+
+	def closure_ContNode(self, node):
+		def cont(ctx):
+			raise ContinueSignal()
+		return cont
+
+	def closure_BrkNode(self, node):
+		def brk(ctx):
+			raise BreakSignal()
+		return brk
+
+	def closure_HoistedNode(self, node):
+		value = self.compile(node.node)
+		def load_hoisted(ctx):
+			if node.value is not None: return node.value
+			result = value(ctx)
+			keep_hoisted(node, result)
+			return result
+		return load_hoisted
+
+ClosureCompiler.handlers = node_handlers(ClosureCompiler, 'closure_')
+
+NOT_RETURNED = object()
+
+def truth_of(value, operand_of, context):
+	if type(value) is Number: return bool(value.value)
+	# Only numbers can be AND/OR operands, as anded_by/ored_by would report
+	if operand_of: raise ErrorSignal(locate_error(value.illegal_operation(), operand_of, context))
+	return value.is_true()
+
+#######################################
+# SCRIPT CACHE
+#######################################
+
+CACHE_SUFFIX = '.librac'
+CACHE_MAGIC = b'LIBRAC\x01\n'
+
+interpreter_version_tag = None
+
+def interpreter_version():
+	global interpreter_version_tag
+	if interpreter_version_tag is None:
+		with open(__file__, 'rb') as f:
+			digest = hashlib.sha256(f.read()).hexdigest()[:16]
+		interpreter_version_tag = f'{digest}-py{sys.version_info[0]}.{sys.version_info[1]}'
+	return interpreter_version_tag
+
+# The entries are large acyclic object graphs; letting the collector
+# rescan them while they are built only costs time.
+@contextlib.contextmanager
+def gc_paused():
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		if enabled: gc.enable()
+
+def cache_path(fn):
+	return os.path.splitext(fn)[0] + CACHE_SUFFIX
+
+# Tokens and positions only carry the id of their source file, which is
+# different in every process, so they are stored without it and get the
+# id of the script being loaded back when unpickled.
+class CachePickler(pickle.Pickler):
+	def __init__(self, file, file_id):
+		super().__init__(file, pickle.HIGHEST_PROTOCOL)
+		self.file_id = file_id
+		self.dispatch_table = {
+			Token: self.reduce_token,
+			Position: self.reduce_position,
+			EndPosition: self.reduce_position,
+		}
+
+	def check_file(self, obj):
+		if obj.file_id != self.file_id:
+			raise pickle.PicklingError(f'{type(obj).__name__} from another source file')
+
+	def reduce_token(self, tok):
+		self.check_file(tok)
+		return (Token, (tok.type, tok.value, tok.start, tok.end))
+
+	def reduce_position(self, pos):
+		self.check_file(pos)
+		return (type(pos), (pos.idx,))
+
+CACHE_CLASSES = frozenset({
+	'NumberNode', 'StringNode', 'ListNode', 'DictNode', 'VarAccessNode', 'VarAssignNode',
+	'BinOpNode', 'UnaryOpNode', 'IfNode', 'FromNode', 'UntilNode', 'FuncDefNode',
+	'CallNode', 'RetNode', 'HoistedNode', 'ContNode', 'BrkNode',
+	'Token', 'Position', 'EndPosition', 'CodeObject', 'Number', 'String',
+})
+
+class CacheUnpickler(pickle.Unpickler):
+	def __init__(self, file, file_id):
+		super().__init__(file)
+		self.file_id = file_id
+
+	# Only the classes a cache entry is made of can be loaded. Anyone who can
+	# write next to a script could otherwise run code in every process that
+	# loads it, since unpickling can call any global it names.
+	def find_class(self, module, name):
+		if module != __name__ or name not in CACHE_CLASSES:
+			raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a script cache")
+		cls = super().find_class(module, name)
+		if cls in (Token, Position, EndPosition):
+			return functools.partial(cls, file_id=self.file_id)
+		return cls
+
+def cache_key(text, st):
+	return (interpreter_version(), st.st_size, st.st_mtime_ns, hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest())
+
+def load_cached_script(fn, file_id, key):
+	try:
+		with open(cache_path(fn), 'rb') as f:
+			if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC: return None
+			unpickler = CacheUnpickler(f, file_id)
+			if unpickler.load() != key: return None
+			with gc_paused():
+				node, code = unpickler.load()
+	except FileNotFoundError:
+		return None
+	except Exception:
+		# Corrupt or truncated entries are rebuilt like stale ones
+		return None
+	return node, code
+
+def store_cached_script(fn, file_id, key, node, code):
+	path = cache_path(fn)
+	tmp_path = f'{path}.{os.getpid()}.tmp'
+	try:
+		with open(tmp_path, 'wb') as f:
+			f.write(CACHE_MAGIC)
+			pickler = CachePickler(f, file_id)
+			pickler.dump(key)
+			with gc_paused():
+				pickler.dump((node, code))
+		os.replace(tmp_path, path)
+	except Exception:
+		try: os.remove(tmp_path)
+		except OSError: pass
+
+def compile_script(fn):
+	st = os.stat(fn)
+	with open(fn, 'r') as f:
+		text = f.read()
+
+	file_id = register_source(fn, text)
+	key = cache_key(text, st)
+	cached = load_cached_script(fn, file_id, key)
+	if cached: return cached[0], cached[1], None
+
+	node, error = parse(fn, text)
+	if error: return None, None, error
+
+	code = Compiler().compile_program(node)
+	store_cached_script(fn, file_id, key, node, code)
+	return node, code, None
 
 #######################################
 # RUN
@@ -2139,8 +5113,21 @@ global_symbol_table.set("pop", BuiltInFunction.pop)
 global_symbol_table.set("ccat", BuiltInFunction.ccat)
 global_symbol_table.set("len", BuiltInFunction.len)
 global_symbol_table.set("exec", BuiltInFunction.exec)
-
-def exec(fn, text):
+global_symbol_table.set("array", BuiltInFunction.array)
+global_symbol_table.set("to_list", BuiltInFunction.to_list)
+global_symbol_table.set("sum", BuiltInFunction.sum)
+global_symbol_table.set("isarray", BuiltInFunction.isarray)
+global_symbol_table.set("get", BuiltInFunction.get)
+global_symbol_table.set("set", BuiltInFunction.set)
+global_symbol_table.set("has", BuiltInFunction.has)
+global_symbol_table.set("delete", BuiltInFunction.delete)
+global_symbol_table.set("keys", BuiltInFunction.keys)
+global_symbol_table.set("isdict", BuiltInFunction.isdict)
+global_symbol_table.set("memo", BuiltInFunction.memo)
+global_symbol_table.set("memo_value", BuiltInFunction.memo_value)
+global_symbol_table.set("memo_stats", BuiltInFunction.memo_stats)
+
+def parse(fn, text):
 	# Generate tokens
 	lexer = Lexer(fn, text)
 	tokens, error = lexer.make_tokens()
@@ -2151,10 +5138,56 @@ def exec(fn, text):
 	ast = parser.parse()
 	if ast.error: return None, ast.error
 
-	# Run program
-	interpreter = Interpreter()
+	# Fold constants and prune dead code, then find loop invariants
+	node = Optimizer().optimize(ast.node)
+	hoist_invariants(node)
+	return node, None
+
+def run(node, code=None, mode='vm'):
 	context = Context('<program>')
 	context.symbol_table=global_symbol_table
-	result = interpreter.visit(ast.node, context)
+	context.mode = mode
+
+	if mode == 'tree':
+		try:
+			return Interpreter().visit(node, context), None
+		except ErrorSignal as signal:
+			return None, signal.error
+		except (ReturnSignal, ContinueSignal, BreakSignal):
+			return None, None
+
+	if mode == 'closure':
+		program = ClosureCompiler().compile(node)
+		try:
+			return program(context), None
+		except ErrorSignal as signal:
+			return None, signal.error
+		except (ReturnSignal, ContinueSignal, BreakSignal):
+			return None, None
+
+	if mode == 'python':
+		program = python_program(node)
+		if program is None: return run(node, mode='tree')
+		try:
+			return run_python(program, context), None
+		except ErrorSignal as signal:
+			return None, signal.error
+		except (ReturnSignal, ContinueSignal, BreakSignal):
+			return None, None
+
+	if mode == 'vm' or mode == 'adaptive':
+		if code is None: code = Compiler().compile_program(node)
+		if mode == 'adaptive': quicken(code)
+		return VM().run(code, context)
+
+	raise Exception(f"Unknown exec mode '{mode}'")
+
+def exec(fn, text, mode='vm'):
+	node, error = parse(fn, text)
+	if error: return None, error
+	return run(node, mode=mode)
 
-	return result.value, result.error
\ No newline at end of file
+def exec_file(fn, mode='vm'):
+	node, code, error = compile_script(fn)
+	if error: return None, error
+	return run(node, code, mode)
@@ -0,0 +1,458 @@
+import os
+import array
+import sys
+import time
+import tempfile
+import tracemalloc
+import Libra
+
+SAMPLE = '''fun scale(l, k)
+	var out = []
+	from i = 0 to len(l) then
+		append(out, (l / i) * k + 1.5)
+	just
+	ret out
+just
+var data = [1, 2, 3, 4, 5, 6, 7, 8]
+var total = 0
+until total >= 100 then var total = total + 3 * 2 - 1
+if total > 50 AND total < 200 then print("in range") elsif total == 0 then print("zero") else print("out")
+'''
+
+def generate_source(size):
+	return SAMPLE * (size // len(SAMPLE) + 1)
+
+def timed(func, repeat=3):
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = func()
+		elapsed = time.perf_counter() - start
+		if best is None or elapsed < best: best = elapsed
+	return best, result
+
+def report(name, elapsed, extra=''):
+	print(f'{name:<28} {elapsed * 1000:10.2f} ms  {extra}')
+
+#######################################
+# BENCHMARKS
+#######################################
+
+def bench_lexer(size=4 * 1024 * 1024):
+	text = generate_source(size)
+	elapsed, (tokens, error) = timed(lambda: Libra.Lexer('<bench>', text).make_tokens())
+	mb = len(text) / (1024 * 1024)
+	report('lexer', elapsed, f'{mb / elapsed:.2f} MB/s, {len(tokens) / elapsed / 1e6:.2f} M tokens/s')
+
+def bench_parser(size=1024 * 1024):
+	text = generate_source(size)
+	tokens, error = Libra.Lexer('<bench>', text).make_tokens()
+	elapsed, ast = timed(lambda: Libra.Parser(tokens).parse())
+	mb = len(text) / (1024 * 1024)
+	report('parser', elapsed, f'{mb / elapsed:.2f} MB/s, {len(tokens) / elapsed / 1e6:.2f} M tokens/s')
+
+def bench_script_cache(size=1024 * 1024):
+	text = generate_source(size)
+	with tempfile.TemporaryDirectory() as tmp:
+		fn = os.path.join(tmp, 'bench.libra')
+		with open(fn, 'w') as f:
+			f.write(text)
+
+		def cold():
+			if os.path.exists(Libra.cache_path(fn)): os.remove(Libra.cache_path(fn))
+			return Libra.compile_script(fn)
+
+		cold_elapsed, _ = timed(cold)
+		warm_elapsed, _ = timed(lambda: Libra.compile_script(fn))
+		cache_kb = os.path.getsize(Libra.cache_path(fn)) / 1024
+	report('script cache (cold)', cold_elapsed, 'lex + parse + compile + store')
+	report('script cache (warm)', warm_elapsed, f'{cold_elapsed / warm_elapsed:.1f}x faster, {cache_kb:.0f} KB entry')
+
+ARITHMETIC = '''var total = 0
+from i = 0 to 20000 then var total = total + i * 2 - i / 4 + i % 3
+var flag = total > 100 AND total < 1000000000 OR total == 0
+'''
+
+# The dispatch the tree-walker used before handler tables: a method name
+# built per node and a linear scan over the operators, like the old
+# if/elif chain on the operator token.
+class NameDispatchInterpreter(Libra.Interpreter):
+	def visit(self, node, context):
+		method_name = f'visit_{type(node).__name__}'
+		method = getattr(self, method_name, self.no_visit_method)
+		return method(node, context)
+
+	def visit_BinOpNode(self, node, context):
+		left = self.visit(node.left_node, context)
+		right = self.visit(node.right_node, context)
+
+		op_tok = node.op_tok
+		for key, func in Libra.BINARY_OPS:
+			if op_tok.type == key or (isinstance(key, tuple) and op_tok.matches(*key)):
+				result, error = func(left, right)
+				break
+
+		if error: raise Libra.ErrorSignal(Libra.locate_error(error, node, context))
+		return result
+
+def bench_dispatch():
+	node, error = Libra.parse('<bench>', ARITHMETIC)
+
+	def run(interpreter):
+		context = Libra.Context('<program>')
+		context.symbol_table = Libra.SymbolTable(Libra.global_symbol_table)
+		return interpreter.visit(node, context)
+
+	name_elapsed, _ = timed(lambda: run(NameDispatchInterpreter()))
+	table_elapsed, _ = timed(lambda: run(Libra.Interpreter()))
+	report('dispatch (by name)', name_elapsed)
+	report('dispatch (tables)', table_elapsed, f'{name_elapsed / table_elapsed:.2f}x faster')
+
+DEEP_CALLS = '''var scale = 3
+fun walk(n, acc) : if n == 0 then acc else walk(n - 1, acc + n * scale)
+from i = 0 to 200 then walk(150, 0)
+'''
+
+def bench_deep_calls():
+	sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+	for mode in ('tree', 'vm'):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', DEEP_CALLS, mode))
+		report(f'deep calls ({mode})', elapsed, '200 x 150 nested calls reading a local and a global')
+
+def count_calls(owner, name, counter):
+	original = getattr(owner, name)
+	def counted(*args, **kwargs):
+		counter[0] += 1
+		return original(*args, **kwargs)
+	setattr(owner, name, counted)
+	return lambda: setattr(owner, name, original)
+
+def bench_tree_walk():
+	program = ARITHMETIC + DEEP_CALLS
+	sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+	visits, results = [0], [0]
+	restore_visit = count_calls(Libra.Interpreter, 'visit', visits)
+	restore_result = count_calls(Libra.RTResult, '__init__', results)
+	try:
+		Libra.exec('<bench>', program, 'tree')
+	finally:
+		restore_visit()
+		restore_result()
+
+	elapsed, _ = timed(lambda: Libra.exec('<bench>', program, 'tree'))
+	report('tree walk', elapsed, f'{visits[0]} nodes, {results[0] / visits[0]:.3f} RTResult per node, {elapsed / visits[0] * 1e9:.0f} ns per node')
+
+LOOP = '''var total = 0
+var inc = 2
+from i = 0 to 50000 then var total = total + inc
+'''
+
+def bench_loop_iteration(iterations=50000):
+	collect = f'var xs = from i = 0 to {iterations} then i * 2'
+	for mode in ('tree', 'vm'):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', LOOP, mode))
+
+		tracemalloc.start()
+		Libra.exec('<bench>', collect, mode)
+		Libra.global_symbol_table.get('xs').share()
+		retained, _ = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		Libra.global_symbol_table.remove('xs')
+
+		report(f'loop iteration ({mode})', elapsed, f'{elapsed / iterations * 1e9:.0f} ns per iteration, {retained / iterations:.0f} bytes per collected element')
+
+def bench_from_loop(iterations=1000000):
+	def native():
+		for i in range(iterations): pass
+	native_elapsed, _ = timed(native)
+	report('from loop (python range)', native_elapsed)
+
+	program = f'fun count()\nfrom i = 0 to {iterations} then 0\njust\ncount()'
+	for mode in ('tree', 'vm'):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', program, mode))
+		report(f'from loop ({mode})', elapsed, f'{elapsed / native_elapsed:.1f}x python range')
+
+def bench_lazy_loop(count=1000000):
+	source = f'var xs = from i = 0 to {count} then i * 2 + 1\nlen(xs)\nxs / -1'
+	for mode in ('tree', 'vm'):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', source, mode))
+
+		tracemalloc.start()
+		Libra.exec('<bench>', source, mode)
+		lazy, _ = tracemalloc.get_traced_memory()
+		Libra.global_symbol_table.get('xs').share()
+		materialized, _ = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		Libra.global_symbol_table.remove('xs')
+
+		report(f'lazy loop ({mode})', elapsed, f'len and last element, {lazy / count:.3f} bytes per element ({materialized / count:.1f} once materialized)')
+
+ACCUMULATE = '''fun build(n)
+	var acc = []
+	from i = 0 to n then
+		var acc = acc + i
+	just
+	ret acc
+just
+var xs = build({size})
+'''
+
+def bench_list_accumulate():
+	for size in (1000, 10000, 100000):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', ACCUMULATE.format(size=size)), repeat=1)
+		elements = Libra.global_symbol_table.get('xs')
+
+		def index_all():
+			for i in range(size): elements.element_at(i)
+		index_elapsed, _ = timed(index_all)
+		Libra.global_symbol_table.remove('xs')
+		report(f'list accumulate ({size})', elapsed, f'{elapsed / size * 1e9:.0f} ns per acc + i, {index_elapsed / size * 1e9:.0f} ns per index')
+
+def bench_num_array(count=10000000, list_count=1000000):
+	Libra.global_symbol_table.set('ys', Libra.NumArray(array.array('d', range(count))))
+	for label, source in (('sum', 'sum(ys)'), ('scale', 'ys * 2.5'), ('compare', 'ys > 1000')):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', source), repeat=1)
+		report(f'num array {label}', elapsed, f'{count} elements, {elapsed / count * 1e9:.1f} ns per element')
+	Libra.global_symbol_table.remove('ys')
+
+	Libra.global_symbol_table.set('xs', Libra.List([Libra.make_number(i) for i in range(list_count)]))
+	elapsed, _ = timed(lambda: Libra.exec('<bench>', 'to_list(array(xs))'), repeat=1)
+	report('num array from/to list', elapsed, f'{list_count} elements, {elapsed / list_count * 1e9:.1f} ns per element')
+	Libra.global_symbol_table.remove('xs')
+
+JOIN_SCAN = '''fun find(ids, id)
+	from i = 0 to len(ids) then
+		if ids / i == id then ret i
+	just
+	ret -1
+just
+fun join(ids, orders)
+	var total = 0
+	from j = 0 to len(orders) then
+		var total = total + find(ids, orders / j)
+	just
+	ret total
+just
+'''
+
+JOIN_DICT = '''fun join(ids, orders)
+	var index = {}
+	from i = 0 to len(ids) then
+		set(index, ids / i, i)
+	just
+	var total = 0
+	from j = 0 to len(orders) then
+		var total = total + index / (orders / j)
+	just
+	ret total
+just
+'''
+
+def bench_dict_join():
+	for size in (250, 500, 1000):
+		data = f'var ids = from i = 0 to {size} then i * 7\nvar orders = from i = 0 to {size} then (i * 3 % {size}) * 7\n'
+		for label, program in (('scan', JOIN_SCAN), ('dict', JOIN_DICT)):
+			elapsed, _ = timed(lambda: Libra.exec('<bench>', data + program + 'join(ids, orders)'), repeat=1)
+			report(f'join {label} ({size})', elapsed, f'{elapsed / size * 1e6:.1f} us per lookup')
+
+REPORT = '''fun build(n)
+	var s = ""
+	from i = 0 to n then
+		var s = s + "line " + "of the report; "
+	just
+	ret len(s)
+just
+build({size})
+'''
+
+def bench_string_build():
+	for size in (10000, 100000, 300000):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', REPORT.format(size=size)), repeat=1)
+		report(f'string build ({size})', elapsed, f'{elapsed / size * 1e6:.2f} us per line')
+
+FIB = '''fun fib(n) : if n < 2 then n else fib(n - 1) + fib(n - 2)
+'''
+
+def bench_memo(n=22):
+	for label, program in (('plain', FIB), ('memo', FIB + 'var fib = memo(fib, 1000)\n')):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', program + f'fib({n})'), repeat=1)
+		report(f'fib {label} ({n})', elapsed)
+	Libra.exec('<bench>', FIB + 'var fib = memo(fib, 1000)\n' + f'fib({n})')
+	print(f'{"memo stats":<28} {Libra.global_symbol_table.get("fib").stats()}')
+	Libra.global_symbol_table.remove('fib')
+
+WALK = '''fun walk(l, i, acc) : if i == len(l) then acc else walk(l, i + 1, acc + l / i)
+var xs = from i = 0 to {size} then i
+walk(xs, 0, 0)
+'''
+
+def bench_tail_calls():
+	for size in (1000, 100000):
+		source = WALK.format(size=size)
+		for mode in ('tree', 'vm'):
+			try:
+				elapsed, _ = timed(lambda: Libra.exec('<bench>', source, mode), repeat=1)
+			except RecursionError:
+				print(f'{f"tail calls ({mode}, {size})":<28} RecursionError')
+				continue
+
+			tracemalloc.start()
+			Libra.exec('<bench>', source, mode)
+			_, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+			report(f'tail calls ({mode}, {size})', elapsed, f'{elapsed / size * 1e6:.1f} us per call, {peak / 1024:.0f} KB peak')
+	Libra.global_symbol_table.remove('xs')
+	Libra.global_symbol_table.remove('walk')
+
+CONDITIONS = '''fun count(n)
+	var hits = 0
+	from i = 0 to n then
+		if i > 10 AND i < n AND i > 5 then var hits = hits + 1
+	just
+	var i = 0
+	until i < n then var i = i + 1
+	ret hits
+just
+count({size})
+'''
+
+GUARDS = '''fun expensive(i)
+	var total = 0
+	from j = 0 to 20 then var total = total + j
+	ret total > i
+just
+fun count(n)
+	var hits = 0
+	from i = 0 to n then
+		if i < 0 AND expensive(i) then var hits = hits - 1
+		if i >= 0 OR expensive(i) then var hits = hits + 1
+	just
+	ret hits
+just
+count({size})
+'''
+
+def bench_guards(size=200000):
+	for label, program in (('conditions', CONDITIONS), ('guards', GUARDS)):
+		for mode in ('tree', 'vm'):
+			elapsed, _ = timed(lambda: Libra.exec('<bench>', program.format(size=size), mode), repeat=1)
+			report(f'{label} ({mode})', elapsed, f'{elapsed / size * 1e6:.2f} us per iteration')
+
+INVARIANTS = '''fun scale(data, n)
+	var total = 0
+	from i = 0 to n then
+		var total = total + len(data) * (n * n + 1) - sum(data)
+	just
+	ret total
+just
+scale(array([1, 2, 3, 4]), {size})
+'''
+
+def bench_invariants(size=200000):
+	for mode in ('tree', 'vm'):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', INVARIANTS.format(size=size), mode), repeat=1)
+		report(f'invariants ({mode})', elapsed, f'{elapsed / size * 1e6:.2f} us per iteration')
+
+ADAPTIVE = '''fun fib(n)
+	if n < 2 then ret n
+	ret fib(n - 1) + fib(n - 2)
+just
+fun mix(x, y) : x * 3 + y - 1
+var total = 0
+from i = 0 to 100000 then var total = mix(total, i) - total * 2
+fib(22)
+'''
+
+def bench_adaptive():
+	for mode in ('vm', 'adaptive'):
+		Libra.adaptive_stats.reset()
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', ADAPTIVE, mode), repeat=1)
+		report(f'adaptive ({mode})', elapsed, repr(Libra.adaptive_stats) if mode == 'adaptive' else '')
+
+def bench_python_backend():
+	program = ADAPTIVE + INVARIANTS.format(size=100000)
+	for mode in ('tree', 'vm', 'python'):
+		elapsed, _ = timed(lambda: Libra.exec('<bench>', program, mode), repeat=1)
+		report(f'python backend ({mode})', elapsed)
+
+def bench_closures():
+	sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+	for label, program in (('arithmetic', ARITHMETIC), ('deep calls', DEEP_CALLS), ('fib and loops', ADAPTIVE)):
+		for mode in ('tree', 'closure'):
+			elapsed, _ = timed(lambda: Libra.exec('<bench>', program, mode), repeat=1)
+			report(f'{label} ({mode})', elapsed)
+
+def bytes_per_object(factory, count=100000):
+	tracemalloc.start()
+	objects = [factory() for _ in range(count)]
+	current, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return (current - sys.getsizeof(objects)) / count
+
+def slot_names(cls):
+	return [name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ())]
+
+# Copies of a sample object that share its attribute values, so only the
+# object itself is measured. The twin is an ordinary dict-backed class
+# with the same attributes, for comparison.
+def clones(obj, with_dict=False):
+	cls = type(obj)
+	names = slot_names(cls)
+	clone_cls = type(cls.__name__ + 'Dict', (), {}) if with_dict else cls
+	def make():
+		clone = clone_cls.__new__(clone_cls)
+		for name in names:
+			setattr(clone, name, getattr(obj, name))
+		return clone
+	return make
+
+def bench_memory(count=1000000):
+	tok = Libra.Token(Libra.TOK_INT, 1000, 0, 4, 0)
+	samples = [
+		Libra.Number(1.5), Libra.String('text'), Libra.List([]), tok, tok.pos_start,
+		Libra.NumberNode(tok), Libra.VarAccessNode(tok),
+		Libra.BinOpNode(Libra.NumberNode(tok), Libra.Token(Libra.TOK_PLUS, None, 5, 6, 0), Libra.NumberNode(tok)),
+	]
+	for sample in samples:
+		slotted = bytes_per_object(clones(sample))
+		with_dict = bytes_per_object(clones(sample, with_dict=True))
+		print(f'{"memory " + type(sample).__name__:<28} {slotted:6.0f} bytes per object, {with_dict:.0f} with __dict__')
+
+	for source, label in ((f'var xs = from i = 0 to {count} then i', 'ints'), (f'var xs = from i = 0 to {count} then i % 100', 'small ints')):
+		tracemalloc.start()
+		Libra.exec('<bench>', source)
+		Libra.global_symbol_table.get('xs').share()
+		retained, _ = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		Libra.global_symbol_table.remove('xs')
+		print(f'{"memory list of " + label:<28} {retained / count:6.1f} bytes per element')
+
+BENCHMARKS = {
+	'lexer': bench_lexer,
+	'parser': bench_parser,
+	'script_cache': bench_script_cache,
+	'dispatch': bench_dispatch,
+	'deep_calls': bench_deep_calls,
+	'tree_walk': bench_tree_walk,
+	'loop_iteration': bench_loop_iteration,
+	'from_loop': bench_from_loop,
+	'lazy_loop': bench_lazy_loop,
+	'list_accumulate': bench_list_accumulate,
+	'num_array': bench_num_array,
+	'dict_join': bench_dict_join,
+	'string_build': bench_string_build,
+	'memo': bench_memo,
+	'tail_calls': bench_tail_calls,
+	'guards': bench_guards,
+	'invariants': bench_invariants,
+	'adaptive': bench_adaptive,
+	'python_backend': bench_python_backend,
+	'closures': bench_closures,
+	'memory': bench_memory,
+}
+
+if __name__ == '__main__':
+	names = sys.argv[1:] or list(BENCHMARKS)
+	for name in names:
+		BENCHMARKS[name]()
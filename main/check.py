@@ -0,0 +1,291 @@
+import io
+import os
+import sys
+import pickle
+import tempfile
+import contextlib
+import Libra
+
+# check.py runs programs in more than one way and reports any that disagree.
+# It exits with status 1 when a check fails.
+
+def outcome(text, mode='vm'):
+	try:
+		result, error = Libra.exec('<check>', text, mode)
+	except Exception as e:
+		return f'raised {type(e).__name__}: {e}'
+	if error: return f'{error.error_name}: {error.details}'
+	return repr(result)
+
+# The value or the full error text, with everything the program printed.
+# Globals the program sets are removed again so runs don't see each other's.
+def mode_outcome(text, mode):
+	symbols = dict(Libra.global_symbol_table.symbols)
+	output = io.StringIO()
+	try:
+		with contextlib.redirect_stdout(output):
+			result, error = Libra.exec('<check>', text, mode)
+	except Exception as e:
+		return f'raised {type(e).__name__}: {e}'
+	finally:
+		Libra.global_symbol_table.symbols = symbols
+	return output.getvalue() + (error.as_string() if error else repr(result))
+
+def compare(label, expected, actual):
+	if expected == actual: return True
+	print(f'FAIL {label}\n  expected: {expected}\n  actual:   {actual}')
+	return False
+
+#######################################
+# CHECKS
+#######################################
+
+ARRAY_PROGRAMS = [
+	'array([1, 2, 3]) + array([4, 5, 6])',
+	'array([1, 2, 3]) * 2 - 1',
+	'array([7, 8, 9]) % 4',
+	'array([7, 8, 9]) / 2',
+	'array([1.5, 2.5]) * array([2, 4])',
+	'array([1, 5, 3]) < 3',
+	'array([1, 2]) < 2 ^ 70',
+	'array([2, 3]) ^ 2',
+	'array([4]) ^ 0.5',
+	'array([1, 2]) ^ array([0 - 1, 2])',
+	'sum(array([1, 2, 3]))',
+	'sum(array([4611686018427387904, 4611686018427387904]))',
+	'array([9223372036854775807]) + 1',
+	'array([0 - 9223372036854775807]) - 2',
+	'array([4294967296]) * 4294967296',
+	'array([2, 3]) ^ 100',
+	'array([1]) + 2 ^ 70',
+	'array([0, 1]) ^ (0 - 1)',
+	'array([0.0]) ^ (0 - 1)',
+	'array([0 - 8]) ^ 0.5',
+	'array([10.0]) ^ 400',
+	'array([4]) / 0',
+	'array([4]) % array([0])',
+	'array([1, 2]) + array([1])',
+	'array([]) * 3',
+]
+
+# NumArray goes through NumPy when it is installed; it has to give the same
+# results and errors as the array.array path
+def check_num_array():
+	if Libra.numpy is None:
+		print('skip num_array: NumPy is not installed')
+		return True
+
+	ok = True
+	for text in ARRAY_PROGRAMS:
+		with_numpy = outcome(text)
+		Libra.numpy, numpy = None, Libra.numpy
+		try:
+			without_numpy = outcome(text)
+		finally:
+			Libra.numpy = numpy
+		ok = compare(f'num_array: {text}', without_numpy, with_numpy) and ok
+	return ok
+
+MODES = ('vm', 'adaptive', 'python', 'closure')
+
+MODE_PROGRAMS = {
+	'arithmetic': """var total = 0
+from i = 0 to 200 then var total = total + i * 2 - i / 4 + i % 3
+[total, 7 ^ 3, 10 / 4, 0 - 5 % 3, NOT 0, 1 AND 0 OR 2, 3 == 3.0, "ab" * 3 + "c"]
+""",
+	'nested break and continue': """var out = []
+from i = 0 to 6 then
+	if i == 1 then cont
+	from j = 0 to 6 then
+		if j == 2 then cont
+		if j > i then brk
+		append(out, i * 10 + j)
+	just
+	var k = 0
+	until TRUE then
+		var k = k + 1
+		if k < 3 then cont
+		brk
+	just
+	append(out, k)
+	if i == 4 then brk
+just
+out
+""",
+	'break out of a loop in a function': """fun find(l, x)
+	var at = 0 - 1
+	from i = 0 to len(l) then
+		from j = 0 to 3 then
+			if j == 1 then brk
+		just
+		if l / i == x then
+			var at = i
+			brk
+		just
+	just
+	ret at
+just
+[find([5, 6, 7, 8], 7), find([1], 9)]
+""",
+	'tail calls': """fun count(n, acc) : if n == 0 then acc else count(n - 1, acc + n)
+fun down(n)
+	if n == 0 then ret "done"
+	ret down(n - 1)
+just
+fun parity(n) : if n == 0 then "even" elsif n == 1 then "odd" else parity(n - 2)
+[count(20000, 0), down(20000), parity(10001)]
+""",
+	'lazy from lists': """var squares = from i = 0 to 10 then i * i
+var odd = from i = 9 to 0 step 0 - 2 then i
+var halves = from i = 0 to 2 step 0.5 then i / 2
+var cubes = from i = 0 to 5 then i * i * i
+var grown = from i = 0 to 4 then i
+append(grown, 10)
+ccat(grown, odd)
+var popped = pop(grown, 0)
+[squares / 3, len(squares), squares + 100, odd, halves, i, cubes - 0, cubes * [1], grown, popped, len(grown)]
+""",
+	'closures and scope': """fun adder(n) : fun (x) : x + n
+var add5 = adder(5)
+var x = 1
+fun shadow()
+	var x = 10
+	ret x + add5(x)
+just
+[add5(1), shadow(), x]
+""",
+	'strings, dicts and memo': """var d = {"a": 1, 2: "b"}
+set(d, "c", 3)
+var s = ""
+from i = 0 to 5 then var s = s + "x" * i + ","
+fun fib(n) : if n < 2 then n else fib(n - 1) + fib(n - 2)
+var fib = memo(fib, 100)
+[d / "a", d / 2, keys(d), len(d), has(d, "x"), fib(40)]
+""",
+	'memo results are not shared': """fun f(x) : [x, [x], {"k": x}]
+var g = memo(f, 3)
+var a = g(1)
+append(a, 2)
+append(a / 1, 3)
+set(a / 2, "k", 4)
+var b = g(1)
+append(b, 5)
+[a, b, g(1), f(1), memo_stats(g)]
+""",
+	'memo in a loop': """fun fib(n) : if n < 2 then n else fib(n - 1) + fib(n - 2)
+var fib = memo(fib, 3)
+fun stop(x)
+	if x == 2 then brk
+	ret x
+just
+var stop = memo(stop, 10)
+var out = []
+from i = 0 to 5 then append(out, [fib(i * 10), stop(i)])
+[out, memo_stats(fib), memo_stats(stop)]
+""",
+	'printing': """fun greet(name) : print("hi " + name)
+from i = 0 to 3 then greet("x" * i)
+print([1, 2])
+""",
+	'error in a function': """fun divide(a, b) : a / b
+fun outer(x)
+	var y = x + 1
+	ret divide(y, 0)
+just
+outer(1)
+""",
+	'error in a loop in a function': """fun walk(l)
+	from i = 0 to 10 then
+		if i == 2 then cont
+		l / i
+	just
+just
+walk([1, 2, 3])
+""",
+	'undefined name in a function': """fun f() : missing + 1
+from i = 0 to 3 then f()
+""",
+	'wrong arg count': """fun f(a, b) : a + b
+f(1)
+""",
+	'error after a tail call': """fun count(n) : if n == 0 then 1 / 0 else count(n - 1)
+count(100)
+""",
+	'illegal operation': """fun f(x) : x - "a"
+f(1)
+""",
+}
+
+# Every mode has to give the same value, output and error text as tree mode
+def check_modes():
+	sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+	ok = True
+	for label, text in MODE_PROGRAMS.items():
+		expected = mode_outcome(text, 'tree')
+		for mode in MODES:
+			ok = compare(f'modes: {label} ({mode})', expected, mode_outcome(text, mode)) and ok
+	return ok
+
+MEMO_PROGRAM = """fun f(x) : [x, [x], {"k": x}]
+var g = memo(f, 3)
+var a = g(1)
+append(a, 2)
+append(a / 1, 3)
+set(a / 2, "k", 4)
+[g(1), f(1)]
+"""
+
+# Changing a result a memo handed out must not change what it returns later
+def check_memo():
+	ok = True
+	for mode in ('tree',) + MODES:
+		symbols = dict(Libra.global_symbol_table.symbols)
+		try:
+			result, error = Libra.exec('<check>', MEMO_PROGRAM, mode)
+		finally:
+			Libra.global_symbol_table.symbols = symbols
+		if error:
+			ok = compare(f'memo ({mode})', 'no error', error.as_string()) and ok
+			continue
+		memoized, plain = result.element_at(-1).iter_elements()
+		ok = compare(f'memo ({mode})', repr(plain), repr(memoized)) and ok
+	return ok
+
+class Planted:
+	def __reduce__(self):
+		return (print, ('cache entry ran code',))
+
+# A .librac can't make exec() call anything outside the classes a cache
+# entry is made of; such an entry is treated as corrupt and rebuilt
+def check_script_cache():
+	with tempfile.TemporaryDirectory() as tmp:
+		fn = os.path.join(tmp, 'planted.libra')
+		with open(fn, 'w') as f:
+			f.write('var planted = 1')
+		with open(Libra.cache_path(fn), 'wb') as f:
+			f.write(Libra.CACHE_MAGIC)
+			pickle.dump(Planted(), f)
+
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			node, code, error = Libra.compile_script(fn)
+		ok = compare('script_cache: planted entry', '', output.getvalue())
+
+		with open(fn) as f:
+			text = f.read()
+		key = Libra.cache_key(text, os.stat(fn))
+		rebuilt = Libra.load_cached_script(fn, Libra.register_source(fn, text), key)
+		return compare('script_cache: rebuilt', True, error is None and rebuilt is not None) and ok
+
+CHECKS = {
+	'modes': check_modes,
+	'memo': check_memo,
+	'num_array': check_num_array,
+	'script_cache': check_script_cache,
+}
+
+if __name__ == '__main__':
+	names = sys.argv[1:] or list(CHECKS)
+	failed = [name for name in names if not CHECKS[name]()]
+	print(f'{len(names) - len(failed)} of {len(names)} checks passed')
+	sys.exit(1 if failed else 0)
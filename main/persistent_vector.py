@@ -0,0 +1,182 @@
+import operator
+
+#######################################
+# PERSISTENT VECTOR
+#######################################
+
+# A 32-way trie with a separate tail, as in Clojure's PersistentVector.
+# Operations return a new vector and share every node they don't touch.
+#
+# Each operation takes an optional edit token. Nodes created under a token
+# are stamped with it, and later operations under the same token change
+# them in place instead of copying them. The owner of a token must stop
+# using it (take a new one) as soon as it hands its vector to anyone else.
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+class Node:
+	__slots__ = ('edit', 'array')
+
+	def __init__(self, edit, array):
+		self.edit = edit
+		self.array = array
+
+def editable(node, edit):
+	if edit is not None and node.edit is edit: return node
+	return Node(edit, node.array[:])
+
+def new_path(edit, level, node):
+	while level:
+		node = Node(edit, [node])
+		level -= BITS
+	return node
+
+class PersistentVector:
+	__slots__ = ('count', 'shift', 'root', 'tail')
+
+	def __init__(self, count, shift, root, tail):
+		self.count = count
+		self.shift = shift
+		self.root = root
+		self.tail = tail
+
+	@staticmethod
+	def from_list(items):
+		# Takes ownership of items; a short list becomes the tail as it is
+		if len(items) <= WIDTH:
+			return PersistentVector(len(items), BITS, EMPTY_NODE, Node(None, items))
+		return EMPTY.extend(items)
+
+	def tail_offset(self):
+		if self.count < WIDTH: return 0
+		return ((self.count - 1) >> BITS) << BITS
+
+	def index(self, index):
+		index = operator.index(index)
+		if index < 0: index += self.count
+		if not 0 <= index < self.count:
+			raise IndexError('vector index out of range')
+		return index
+
+	def leaf_for(self, index):
+		if index >= self.tail_offset(): return self.tail
+		node = self.root
+		for level in range(self.shift, 0, -BITS):
+			node = node.array[(index >> level) & MASK]
+		return node
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, index):
+		count = self.count
+		if type(index) is not int: index = operator.index(index)
+		if index < 0: index += count
+		if not 0 <= index < count:
+			raise IndexError('vector index out of range')
+
+		if index >= ((count - 1) >> BITS) << BITS:
+			return self.tail.array[index & MASK]
+		node, level = self.root, self.shift
+		while level:
+			node = node.array[(index >> level) & MASK]
+			level -= BITS
+		return node.array[index & MASK]
+
+	def __iter__(self):
+		for start in range(0, self.count, WIDTH):
+			yield from self.leaf_for(start).array
+
+	###################################
+
+	def append(self, value, edit=None):
+		count, shift, root = self.count, self.shift, self.root
+
+		if count - self.tail_offset() < WIDTH:
+			tail = editable(self.tail, edit)
+			tail.array.append(value)
+			return PersistentVector(count + 1, shift, root, tail)
+
+		# The tail is full: push it into the trie and start a new one
+		if (count >> BITS) > (1 << shift):
+			root = Node(edit, [root, new_path(edit, shift, self.tail)])
+			shift += BITS
+		else:
+			root = self.push_tail(shift, root, self.tail, edit)
+		return PersistentVector(count + 1, shift, root, Node(edit, [value]))
+
+	def push_tail(self, level, parent, tail, edit):
+		parent = editable(parent, edit)
+		sub_index = ((self.count - 1) >> level) & MASK
+
+		if level == BITS:
+			child = tail
+		elif sub_index < len(parent.array):
+			child = self.push_tail(level - BITS, parent.array[sub_index], tail, edit)
+		else:
+			child = new_path(edit, level - BITS, tail)
+
+		if sub_index < len(parent.array):
+			parent.array[sub_index] = child
+		else:
+			parent.array.append(child)
+		return parent
+
+	def pop(self, edit=None):
+		count, shift = self.count, self.shift
+		if count == 0: raise IndexError('pop from empty vector')
+		if count == 1: return EMPTY
+
+		if count - self.tail_offset() > 1:
+			tail = editable(self.tail, edit)
+			tail.array.pop()
+			return PersistentVector(count - 1, shift, self.root, tail)
+
+		# The tail is used up: the last leaf of the trie becomes the tail
+		tail = self.leaf_for(count - 2)
+		root = self.pop_tail(shift, self.root, edit) or EMPTY_NODE
+		if shift > BITS and len(root.array) == 1:
+			root = root.array[0]
+			shift -= BITS
+		return PersistentVector(count - 1, shift, root, tail)
+
+	def pop_tail(self, level, node, edit):
+		sub_index = ((self.count - 2) >> level) & MASK
+
+		if level > BITS:
+			child = self.pop_tail(level - BITS, node.array[sub_index], edit)
+			if child is None and sub_index == 0: return None
+			node = editable(node, edit)
+			if child is None:
+				node.array.pop()
+			else:
+				node.array[sub_index] = child
+			return node
+
+		if sub_index == 0: return None
+		node = editable(node, edit)
+		node.array.pop()
+		return node
+
+	def extend(self, values, edit=None):
+		# A private token lets a persistent extend build its new nodes in place
+		edit = edit or object()
+		vector = self
+		for value in values:
+			vector = vector.append(value, edit)
+		return vector
+
+	def removed(self, index, edit=None):
+		index = self.index(index)
+		edit = edit or object()
+		rest = [self[i] for i in range(index + 1, self.count)]
+
+		vector = self
+		for _ in range(len(rest) + 1):
+			vector = vector.pop(edit)
+		return vector.extend(rest, edit)
+
+EMPTY_NODE = Node(None, [])
+EMPTY = PersistentVector(0, BITS, EMPTY_NODE, Node(None, []))
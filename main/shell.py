@@ -1,5 +1,18 @@
+import sys
 import Libra
 
+# shell.py --dump-python file prints the Python that mode='python' runs for the file
+if len(sys.argv) > 2 and sys.argv[1] == '--dump-python':
+		with open(sys.argv[2]) as f:
+				source, error = Libra.python_source(sys.argv[2], f.read())
+		print(error.as_string() if error else source, end='')
+		sys.exit(1 if error else 0)
+
+if len(sys.argv) > 1:
+		result, error = Libra.exec_file(sys.argv[1])
+		if error: print(error.as_string())
+		sys.exit(1 if error else 0)
+
 while True:
 		text = input('Libra > ')
 		if text.strip()=="":continue
@@ -7,7 +20,7 @@ while True:
 
 		if error: print(error.as_string())
 		elif result: 
-			if len(result.elements)==1:
-				print(repr(result.elements[0]))
+			if result.length()==1:
+				print(repr(result.element_at(0)))
 			else:
 				print(repr(result))
\ No newline at end of file
@@ -1,10 +1,19 @@
-def string_with_arrows(text, pos_start, pos_end):
+import bisect
+
+def string_with_arrows(text, pos_start, pos_end, line_starts):
     result = ''
 
-    # Calculate indices
-    idx_start = max(text.rfind('\n', 0, pos_start.idx), 0)
-    idx_end = text.find('\n', idx_start + 1)
-    if idx_end < 0: idx_end = len(text)
+    # Calculate indices from the line-start index instead of rescanning the text
+    def newline_before(idx):
+        ln = bisect.bisect_right(line_starts, idx) - 1
+        return line_starts[ln] - 1
+
+    def newline_after(idx):
+        ln = bisect.bisect_right(line_starts, idx)
+        return line_starts[ln] - 1 if ln < len(line_starts) else len(text)
+
+    idx_start = max(newline_before(pos_start.idx), 0)
+    idx_end = newline_after(idx_start + 1)
     
     # Generate each line
     line_count = pos_end.ln - pos_start.ln + 1
@@ -20,7 +29,6 @@ def string_with_arrows(text, pos_start, pos_end):
 
         # Re-calculate indices
         idx_start = idx_end
-        idx_end = text.find('\n', idx_start + 1)
-        if idx_end < 0: idx_end = len(text)
+        idx_end = newline_after(idx_start + 1)
 
     return result.replace('\t', '')
\ No newline at end of file